@@ -1,9 +1,60 @@
-from django.contrib import admin
+import re
+
+from django import forms
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from django.utils import timezone
-from django.db.models import Count, Sum, Q
-from .models import Categoria, Producto, Cliente, Pedido, DetallePedido, Oferta
+from django.db.models import Count, F, Sum, Q, Prefetch, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Categoria, Producto, Cliente, Pedido, PedidoQuerySet, DetallePedido, Oferta, CorreoSaliente, MovimientoInventario
+from .resumenes import ESTADOS_VENDIDOS, recalcular_pedidos, registrar_pedidos_nuevos
+from .reposicion import DIAS_ALERTA
+from .paginacion import PaginadorEstimado
+from .inventario import registrar_movimiento, stock_actual, anotar_stock_actual, activar_fragmentos, desactivar_fragmentos, StockInsuficiente
 from django.templatetags.static import static
+from django.db import transaction
+from django.utils.text import smart_split, unescape_string_literal
+
+
+# ===== BÚSQUEDA INDEXADA =====
+class BusquedaIndexadaMixin:
+    """
+    Reemplaza la búsqueda del admin (OR de ILIKE '%x%' sobre todos los
+    search_fields) por una que usa los índices:
+    - campos_trigrama: icontains, resuelto en PostgreSQL con los índices GIN
+      pg_trgm de la migración 0011.
+    - campos_exactos: (campo, regex) igualdad exacta, solo cuando la palabra
+      calza con el formato (#123 → id) y por lo tanto va a su índice btree.
+    Igual que en Django, las palabras se combinan con AND.
+    """
+    campos_trigrama = ()
+    campos_exactos = ()
+    
+    def get_search_results(self, request, queryset, search_term):
+        for palabra in smart_split(search_term):
+            if palabra.startswith(('"', "'")) and palabra[0] == palabra[-1]:
+                palabra = unescape_string_literal(palabra)
+            
+            condicion = Q()
+            for campo, patron in self.campos_exactos:
+                coincidencia = re.fullmatch(patron, palabra)
+                if coincidencia:
+                    condicion |= Q(**{campo: coincidencia.group(coincidencia.lastindex or 0)})
+            
+            # Con menos de 3 caracteres el trigrama no filtra: si la palabra ya
+            # tiene una búsqueda exacta, no se agrega el recorrido de texto
+            if len(palabra) >= 3 or not condicion:
+                for campo in self.campos_trigrama:
+                    condicion |= Q(**{f'{campo}__icontains': palabra})
+            queryset = queryset.filter(condicion)
+        
+        return queryset, False
+
+
+def es_autocompletado(request):
+    """True en las consultas de los widgets de autocompletado (/admin/autocomplete/)"""
+    return request.resolver_match is not None and request.resolver_match.url_name == 'autocomplete'
+
 
 # ===== CONFIGURACIÓN PARA CATEGORÍA =====
 @admin.register(Categoria)
@@ -36,14 +87,29 @@ class CategoriaAdmin(admin.ModelAdmin):
         return "-"
     descripcion_corta.short_description = 'Descripción'
     
+    def get_queryset(self, request):
+        # Los conteos salen en la misma consulta del listado (un JOIN agrupado)
+        con_stock = (
+            anotar_stock_actual(Producto.objects.filter(categoria=OuterRef('pk'), activo=True))
+            .filter(stock_real__gt=0)
+            .values('categoria')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return super().get_queryset(request).annotate(
+            num_productos=Count('productos'),
+            num_productos_con_stock=Coalesce(Subquery(con_stock), 0),
+        )
+    
     def total_productos(self, obj):
-        return obj.productos.count()
+        return obj.num_productos
     total_productos.short_description = 'Total Productos'
+    total_productos.admin_order_field = 'num_productos'
     
     def total_productos_con_stock(self, obj):
-        total = obj.productos.filter(stock_disponible__gt=0, activo=True).count()
-        return format_html('<span style="color: green; font-weight: bold;">{}</span>', total)
+        return format_html('<span style="color: green; font-weight: bold;">{}</span>', obj.num_productos_con_stock)
     total_productos_con_stock.short_description = 'Con Stock'
+    total_productos_con_stock.admin_order_field = 'num_productos_con_stock'
     
     def activa_badge(self, obj):
         if obj.activa:
@@ -70,10 +136,12 @@ class CategoriaAdmin(admin.ModelAdmin):
 
 # ===== CONFIGURACIÓN PARA CLIENTE =====
 @admin.register(Cliente)
-class ClienteAdmin(admin.ModelAdmin):
+class ClienteAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
     list_display = ('id', 'nombre', 'correo', 'telefono', 'total_pedidos', 'total_gastado', 'fecha_registro', 'estado_badge')
     list_display_links = ('id', 'nombre', 'correo')
     search_fields = ('nombre', 'correo', 'telefono', 'id')
+    campos_trigrama = ('nombre', 'correo', 'telefono')
+    campos_exactos = (('id', r'#?(\d{1,9})'), ('correo', r'[^@\s]+@[^@\s]+\.[^@\s]+'))
     list_filter = ('fecha_registro', 'is_active', 'is_staff')
     readonly_fields = ('fecha_registro', 'last_login', 'total_pedidos', 'total_gastado')
     ordering = ('-fecha_registro',)
@@ -100,16 +168,32 @@ class ClienteAdmin(admin.ModelAdmin):
         }),
     )
     
+    def save_model(self, request, obj, form, change):
+        # Desactivar a un cliente revoca sus tokens JWT ya emitidos
+        if change and 'is_active' in form.changed_data:
+            obj.version_token += 1
+        super().save_model(request, obj, form, change)
+    
+    def get_queryset(self, request):
+        # Ambas columnas salen del mismo JOIN con pedidos, sin consultas por fila.
+        # El autocompletado solo muestra el nombre: no paga el JOIN agrupado.
+        queryset = super().get_queryset(request)
+        if es_autocompletado(request):
+            return queryset
+        return queryset.annotate(
+            num_pedidos=Count('pedidos'),
+            monto_gastado=Sum('pedidos__total_pedido', filter=Q(pedidos__estado_pedido__in=ESTADOS_VENDIDOS)),
+        )
+    
     def total_pedidos(self, obj):
-        return obj.pedidos.count()
+        return obj.num_pedidos
     total_pedidos.short_description = 'Total Pedidos'
+    total_pedidos.admin_order_field = 'num_pedidos'
     
     def total_gastado(self, obj):
-        total = obj.pedidos.filter(
-            estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado']
-        ).aggregate(Sum('total_pedido'))['total_pedido__sum'] or 0
-        return f"${total:,.0f}"
+        return f"${obj.monto_gastado or 0:,.0f}"
     total_gastado.short_description = 'Total Gastado'
+    total_gastado.admin_order_field = 'monto_gastado'
     
     def estado_badge(self, obj):
         if obj.is_active:
@@ -129,6 +213,7 @@ class OfertaAdmin(admin.ModelAdmin):
     search_fields = ('producto__nombre', 'id')
     date_hierarchy = 'fecha_inicio'
     ordering = ('-fecha_inicio',)
+    list_select_related = ('producto',)
     autocomplete_fields = ['producto']
     
     class Media:
@@ -188,16 +273,43 @@ class OfertaAdmin(admin.ModelAdmin):
 
 
 # ===== CONFIGURACIÓN PARA PRODUCTO =====
+class ReposicionFilter(admin.SimpleListFilter):
+    """Filtra por el punto de reorden y la velocidad calculados cada noche"""
+    title = 'reposición'
+    parameter_name = 'reposicion'
+    
+    def lookups(self, request, model_admin):
+        return (
+            ('reponer', 'Bajo el punto de reorden'),
+            ('pronto', f'Se agota en menos de {DIAS_ALERTA} días'),
+            ('sin_ventas', 'Sin ventas recientes'),
+        )
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'reponer':
+            return queryset.filter(
+                reposicion__velocidad_diaria__gt=0, stock_real__lte=F('reposicion__punto_reorden')
+            )
+        if self.value() == 'pronto':
+            return queryset.filter(stock_real__lt=F('reposicion__velocidad_diaria') * DIAS_ALERTA)
+        if self.value() == 'sin_ventas':
+            return queryset.filter(Q(reposicion__isnull=True) | Q(reposicion__velocidad_diaria=0))
+        return queryset
+
+
 @admin.register(Producto)
-class ProductoAdmin(admin.ModelAdmin):
-    list_display = ('id', 'nombre', 'categoria', 'precio_unitario', 'stock_badge', 'unidad_medida', 'imagen_preview', 'oferta_badge', 'activo_badge')
+class ProductoAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
+    list_display = ('id', 'nombre', 'categoria', 'precio_unitario', 'stock_badge', 'reposicion_badge', 'unidad_medida', 'imagen_preview', 'oferta_badge', 'activo_badge')
     list_display_links = ('id', 'nombre')
-    list_filter = ('categoria', 'unidad_medida', 'activo', 'fecha_creacion')
+    list_filter = ('categoria', ReposicionFilter, 'unidad_medida', 'activo', 'fecha_creacion')
     search_fields = ('nombre', 'descripcion', 'id')
+    campos_trigrama = ('nombre', 'descripcion')
+    campos_exactos = (('id', r'#?(\d{1,9})'),)
     ordering = ('-fecha_creacion',)
     list_per_page = 20
+    list_select_related = ('categoria', 'reposicion')
     autocomplete_fields = ['categoria']
-    readonly_fields = ('fecha_creacion', 'fecha_modificacion', 'imagen_preview_large')
+    readonly_fields = ('fecha_creacion', 'fecha_modificacion', 'imagen_preview_large', 'stock_fragmentado')
     
     class Media:
         css = {
@@ -209,7 +321,8 @@ class ProductoAdmin(admin.ModelAdmin):
             'fields': ('nombre', 'descripcion', 'categoria', 'unidad_medida', 'activo')
         }),
         ('Inventario y Precios', {
-            'fields': ('precio_unitario', 'stock_disponible')
+            'fields': ('precio_unitario', 'stock_disponible', 'stock_fragmentado'),
+            'description': 'Los cambios de stock se registran como ajustes en el libro de movimientos.'
         }),
         ('Imagen', {
             'fields': ('imagen', 'imagen_preview_large'),
@@ -240,33 +353,60 @@ class ProductoAdmin(admin.ModelAdmin):
     imagen_preview_large.short_description = 'Vista Previa'
     
     def stock_badge(self, obj):
-        if obj.stock_disponible == 0:
+        # stock_real viene anotado en get_queryset (incluye los fragmentos)
+        if obj.stock_real == 0:
             return format_html(
                 '<span style="background-color: #dc3545; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">⚠ Agotado</span>'
             )
-        elif obj.stock_disponible < 10:
+        elif obj.stock_real < 10:
             return format_html(
                 '<span style="background-color: #ffc107; color: black; padding: 3px 10px; border-radius: 3px; font-weight: bold;">⚠ {} unidades</span>',
-                obj.stock_disponible
+                obj.stock_real
             )
         return format_html(
             '<span style="background-color: #28a745; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">✓ {} unidades</span>',
-            obj.stock_disponible
+            obj.stock_real
         )
     stock_badge.short_description = 'Stock'
     
+    def reposicion_badge(self, obj):
+        reposicion = getattr(obj, 'reposicion', None)
+        dias = reposicion.dias_hasta_agotar(obj.stock_real) if reposicion else None
+        if dias is None:
+            return format_html('<span style="color: #6c757d;">Sin ventas</span>')
+        if obj.stock_real <= reposicion.punto_reorden:
+            color = '#dc3545'
+        elif dias < DIAS_ALERTA:
+            color = '#ffc107'
+        else:
+            color = '#28a745'
+        return format_html(
+            '<span style="color: {}; font-weight: bold;" title="{} u/día, reordenar en {} u">≈ {} días</span>',
+            color, f'{reposicion.velocidad_diaria:.1f}', reposicion.punto_reorden, int(dias)
+        )
+    reposicion_badge.short_description = 'Duración stock'
+    
+    def get_queryset(self, request):
+        # Las ofertas vigentes de toda la página se traen en una sola consulta
+        queryset = super().get_queryset(request)
+        if es_autocompletado(request):
+            return queryset
+        ahora = timezone.now()
+        return anotar_stock_actual(queryset).prefetch_related(
+            Prefetch(
+                'ofertas',
+                queryset=Oferta.objects.filter(activa=True, fecha_inicio__lte=ahora, fecha_fin__gte=ahora),
+                to_attr='ofertas_vigentes'
+            )
+        )
+    
     def oferta_badge(self, obj):
-        if obj.tiene_oferta_activa:
-            oferta = obj.ofertas.filter(
-                fecha_inicio__lte=timezone.now(),
-                fecha_fin__gte=timezone.now(),
-                activa=True
-            ).first()
-            if oferta:
-                return format_html(
-                    '<span style="background-color: #dc3545; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">🔥 -{}%</span>',
-                    oferta.descuento_porcentaje
-                )
+        if obj.ofertas_vigentes:
+            # El prefetch deja cargado oferta.producto, así que el descuento no consulta
+            return format_html(
+                '<span style="background-color: #dc3545; color: white; padding: 3px 10px; border-radius: 3px; font-weight: bold;">🔥 -{}%</span>',
+                obj.ofertas_vigentes[0].descuento_porcentaje
+            )
         return format_html('<span style="color: #6c757d;">-</span>')
     oferta_badge.short_description = 'Oferta'
     
@@ -280,7 +420,44 @@ class ProductoAdmin(admin.ModelAdmin):
         )
     activo_badge.short_description = 'Activo'
 
-    actions = ['activar_productos', 'desactivar_productos', 'marcar_sin_stock']
+    actions = [
+        'activar_productos', 'desactivar_productos', 'marcar_sin_stock',
+        'fragmentar_stock', 'desfragmentar_stock'
+    ]
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            super().save_model(request, obj, form, change)
+            if obj.stock_disponible:
+                MovimientoInventario.objects.create(
+                    producto=obj, tipo='ajuste', cantidad=obj.stock_disponible,
+                    nota='Stock inicial', compactado=True
+                )
+            return
+        
+        # stock_disponible no se sobrescribe: las ventas concurrentes se perderían.
+        # El stock editado a mano se aplica como ajuste en el libro de movimientos.
+        campos = [campo for campo in form.changed_data if campo != 'stock_disponible']
+        if campos:
+            obj.save(update_fields=campos + ['fecha_modificacion'])
+        
+        ajuste = obj.stock_disponible - stock_actual([obj.pk])[obj.pk]
+        if 'stock_disponible' in form.changed_data and ajuste:
+            try:
+                registrar_movimiento(obj, ajuste, 'ajuste', nota=f'Editado desde el admin por {request.user}')
+            except StockInsuficiente as e:
+                self.message_user(request, f'No se pudo ajustar el stock: {e}', level=messages.WARNING)
+        obj.refresh_from_db(fields=['stock_disponible'])
+    
+    def fragmentar_stock(self, request, queryset):
+        count = sum(1 for producto_id in queryset.values_list('id', flat=True) if activar_fragmentos(producto_id))
+        self.message_user(request, f'{count} producto(s) con contador fragmentado.')
+    fragmentar_stock.short_description = "🔀 Fragmentar contador de stock (más vendidos)"
+    
+    def desfragmentar_stock(self, request, queryset):
+        count = sum(1 for producto_id in queryset.values_list('id', flat=True) if desactivar_fragmentos(producto_id))
+        self.message_user(request, f'{count} producto(s) con contador único.')
+    desfragmentar_stock.short_description = "↩ Volver a contador único"
     
     def activar_productos(self, request, queryset):
         updated = queryset.update(activo=True)
@@ -293,7 +470,16 @@ class ProductoAdmin(admin.ModelAdmin):
     desactivar_productos.short_description = "✗ Desactivar productos"
     
     def marcar_sin_stock(self, request, queryset):
-        updated = queryset.update(stock_disponible=0)
+        updated = 0
+        for producto in queryset:
+            stock = stock_actual([producto.pk]).get(producto.pk, 0)
+            if stock > 0:
+                try:
+                    registrar_movimiento(producto, -stock, 'ajuste', nota='Marcado sin stock desde el admin')
+                except StockInsuficiente:
+                    # Se vendió algo en paralelo; el próximo intento lo deja en cero
+                    continue
+            updated += 1
         self.message_user(request, f'{updated} producto(s) marcado(s) sin stock.')
     marcar_sin_stock.short_description = "⚠ Marcar sin stock"
 
@@ -306,6 +492,9 @@ class DetallePedidoInline(admin.TabularInline):
     can_delete = False
     fields = ('producto', 'cantidad', 'precio_compra', 'subtotal_calculado')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('producto')
+    
     def subtotal_calculado(self, obj):
         if obj.pk:
             return f"${obj.subtotal:,.0f}"
@@ -314,15 +503,37 @@ class DetallePedidoInline(admin.TabularInline):
 
 
 # ===== CONFIGURACIÓN PARA PEDIDO =====
+class PedidoAdminForm(forms.ModelForm):
+    """El estado editado a mano solo acepta las transiciones de PedidoQuerySet.TRANSICIONES"""
+    
+    def clean_estado_pedido(self):
+        estado_nuevo = self.cleaned_data['estado_pedido']
+        estado_actual = self.initial.get('estado_pedido')
+        if self.instance.pk and estado_nuevo != estado_actual:
+            estados_origen, _ = PedidoQuerySet.TRANSICIONES.get(estado_nuevo, ((), None))
+            if estado_actual not in estados_origen:
+                raise forms.ValidationError(
+                    f'Un pedido "{estado_actual}" no puede pasar a "{estado_nuevo}".'
+                )
+        return estado_nuevo
+
+
 @admin.register(Pedido)
-class PedidoAdmin(admin.ModelAdmin):
+class PedidoAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
+    form = PedidoAdminForm
     list_display = ('id', 'nombre_cliente', 'correo_cliente', 'fecha_pedido', 'estado_badge', 'total_pedido_formateado', 'metodo_pago', 'tipo_cliente')
     list_display_links = ('id', 'nombre_cliente')
     list_filter = ('estado_pedido', 'metodo_pago', 'fecha_pedido')
     search_fields = ('nombre_cliente', 'correo_cliente', 'telefono_cliente', 'id', 'numero_seguimiento')
+    campos_trigrama = ('nombre_cliente', 'correo_cliente', 'telefono_cliente')
+    campos_exactos = (('id', r'#?(\d{1,9})'), ('numero_seguimiento', r'(?=.*\d)[A-Za-z0-9-]{6,100}'))
     date_hierarchy = 'fecha_pedido'
     inlines = [DetallePedidoInline]
     ordering = ('-fecha_pedido',)
+    autocomplete_fields = ['usuario']
+    # Tablas grandes: conteo estimado y sin el COUNT(*) extra del total sin filtrar
+    paginator = PaginadorEstimado
+    show_full_result_count = False
     readonly_fields = ('fecha_pedido', 'total_pedido', 'fecha_pago', 'fecha_envio', 'fecha_entrega')
     
     class Media:
@@ -350,6 +561,44 @@ class PedidoAdmin(admin.ModelAdmin):
         }),
     )
     
+    def save_model(self, request, obj, form, change):
+        # El estado editado a mano pasa por cambiar_estado, igual que las acciones:
+        # repone stock, encola el aviso, emite el evento SSE y mueve los resúmenes
+        if change and 'estado_pedido' in form.changed_data:
+            estado_nuevo = obj.estado_pedido
+            obj.estado_pedido = form.initial['estado_pedido']
+            with transaction.atomic():
+                super().save_model(request, obj, form, change)
+                cambiados = Pedido.objects.filter(pk=obj.pk).cambiar_estado(estado_nuevo)
+            if not cambiados:
+                self.message_user(
+                    request, f'El estado del pedido #{obj.pk} cambió mientras se editaba; no se aplicó "{estado_nuevo}".',
+                    messages.WARNING
+                )
+            obj.refresh_from_db()
+            return
+        if not change:
+            # Un pedido creado a mano también suma en los resúmenes del dashboard
+            with transaction.atomic():
+                super().save_model(request, obj, form, change)
+                registrar_pedidos_nuevos([obj.pk], obj.estado_pedido)
+            return
+        super().save_model(request, obj, form, change)
+    
+    def delete_model(self, request, obj):
+        with recalcular_pedidos([obj.pk]):
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with recalcular_pedidos(queryset.values_list('pk', flat=True)):
+            super().delete_queryset(request, queryset)
+    
+    def get_readonly_fields(self, request, obj=None):
+        # Al crear un pedido a mano el total se ingresa; después queda fijo
+        if obj is None:
+            return tuple(campo for campo in self.readonly_fields if campo != 'total_pedido')
+        return self.readonly_fields
+    
     def total_pedido_formateado(self, obj):
         return f"${obj.total_pedido:,.0f}"
     total_pedido_formateado.short_description = 'Total'
@@ -393,37 +642,31 @@ class PedidoAdmin(admin.ModelAdmin):
     estado_badge.short_description = 'Estado'
     estado_badge.admin_order_field = 'estado_pedido'
     
-    actions = ['marcar_como_pagado', 'marcar_como_enviado', 'marcar_como_completado', 'cancelar_pedidos']
+    actions = ['marcar_como_pagado', 'marcar_como_preparando', 'marcar_como_enviado', 'marcar_como_completado', 'cancelar_pedidos']
     
     def marcar_como_pagado(self, request, queryset):
-        count = 0
-        for pedido in queryset.filter(estado_pedido='pendiente_pago'):
-            pedido.marcar_como_pagado()
-            count += 1
+        count = queryset.cambiar_estado('pagado')
         self.message_user(request, f'{count} pedido(s) marcado(s) como pagado.')
     marcar_como_pagado.short_description = "✅ Marcar como Pagado"
     
+    def marcar_como_preparando(self, request, queryset):
+        count = queryset.cambiar_estado('preparando')
+        self.message_user(request, f'{count} pedido(s) marcado(s) como en preparación.')
+    marcar_como_preparando.short_description = "🧺 Marcar como Preparando"
+    
     def marcar_como_enviado(self, request, queryset):
-        count = 0
-        for pedido in queryset.filter(estado_pedido__in=['pagado', 'preparando']):
-            pedido.marcar_como_enviado()
-            count += 1
+        count = queryset.cambiar_estado('enviado')
         self.message_user(request, f'{count} pedido(s) marcado(s) como enviado.')
     marcar_como_enviado.short_description = "📦 Marcar como Enviado"
     
     def marcar_como_completado(self, request, queryset):
-        count = 0
-        for pedido in queryset.filter(estado_pedido='enviado'):
-            pedido.marcar_como_completado()
-            count += 1
+        count = queryset.cambiar_estado('completado')
         self.message_user(request, f'{count} pedido(s) marcado(s) como completado.')
     marcar_como_completado.short_description = "✔️ Marcar como Completado"
     
     def cancelar_pedidos(self, request, queryset):
-        updated = queryset.filter(estado_pedido__in=['pendiente_pago', 'pagado']).update(
-            estado_pedido='cancelado'
-        )
-        self.message_user(request, f'{updated} pedido(s) cancelado(s).')
+        updated = queryset.cambiar_estado('cancelado')
+        self.message_user(request, f'{updated} pedido(s) cancelado(s) y stock repuesto.')
     cancelar_pedidos.short_description = "❌ Cancelar Pedidos"
 
 
@@ -435,6 +678,9 @@ class DetallePedidoAdmin(admin.ModelAdmin):
     list_filter = ('pedido__estado_pedido', 'producto__categoria')
     search_fields = ('pedido__id', 'producto__nombre', 'id')
     ordering = ('-id',)
+    list_select_related = ('pedido', 'producto')
+    paginator = PaginadorEstimado
+    show_full_result_count = False
     autocomplete_fields = ['pedido', 'producto']
     
     class Media:
@@ -445,6 +691,75 @@ class DetallePedidoAdmin(admin.ModelAdmin):
     def subtotal_formateado(self, obj):
         return f'${obj.subtotal:,.0f}'
     subtotal_formateado.short_description = 'Subtotal'
+    
+    # Las líneas editadas o eliminadas se reflejan en los resúmenes de sus pedidos
+    def save_model(self, request, obj, form, change):
+        pedidos = {obj.pedido_id, form.initial.get('pedido')} - {None}
+        with recalcular_pedidos(pedidos):
+            super().save_model(request, obj, form, change)
+    
+    def delete_model(self, request, obj):
+        with recalcular_pedidos([obj.pedido_id]):
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with recalcular_pedidos(set(queryset.values_list('pedido_id', flat=True))):
+            super().delete_queryset(request, queryset)
+
+
+# ===== CONFIGURACIÓN PARA CORREOS SALIENTES =====
+@admin.register(CorreoSaliente)
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'destinatarios', 'asunto', 'estado', 'intentos', 'proximo_intento', 'fecha_envio')
+    list_display_links = ('id', 'asunto')
+    list_filter = ('estado', 'tipo')
+    search_fields = ('asunto', 'id')
+    ordering = ('-fecha_creacion',)
+    autocomplete_fields = ['pedido']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    readonly_fields = ('fecha_creacion', 'fecha_envio', 'intentos', 'ultimo_error', 'contiene_secreto')
+    
+    actions = ['reintentar_correos']
+    
+    def get_exclude(self, request, obj=None):
+        # El enlace secreto (restablecer contraseña, seguimiento) no se muestra en el admin
+        if obj is not None and obj.contiene_secreto:
+            return ('html', 'texto')
+        return super().get_exclude(request, obj)
+    
+    def reintentar_correos(self, request, queryset):
+        # Un correo con secreto descartado ya no tiene contenido: se pide uno nuevo
+        updated = queryset.exclude(estado='enviado').exclude(estado='fallido', contiene_secreto=True).update(
+            estado='pendiente',
+            proximo_intento=timezone.now()
+        )
+        self.message_user(request, f'{updated} correo(s) marcado(s) para reintento.')
+    reintentar_correos.short_description = "🔁 Reintentar envío"
+
+
+# ===== CONFIGURACIÓN PARA MOVIMIENTOS DE INVENTARIO =====
+@admin.register(MovimientoInventario)
+class MovimientoInventarioAdmin(admin.ModelAdmin):
+    list_display = ('id', 'fecha', 'producto', 'tipo', 'cantidad', 'pedido', 'compactado', 'nota')
+    list_display_links = ('id',)
+    list_filter = ('tipo', 'compactado', 'fecha')
+    search_fields = ('producto__nombre', 'pedido__id', 'nota')
+    ordering = ('-fecha',)
+    list_select_related = ('producto', 'pedido')
+    raw_id_fields = ('producto', 'pedido')
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    
+    # El libro solo admite agregar filas: nada se edita ni se borra desde el admin
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 # ===== PERSONALIZACIÓN DEL SITIO ADMIN =====
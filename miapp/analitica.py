@@ -0,0 +1,163 @@
+# miapp/analitica.py
+"""
+Analítica de clientes: puntajes RFM (recencia, frecuencia, monto), cohortes
+mensuales y tasa de recompra.
+
+Los pedidos vendidos de clientes registrados se leen con una sola consulta
+(`values_list().iterator()`, sin instanciar modelos) a arreglos NumPy, y todas
+las métricas se calculan con operaciones vectorizadas (bincount, agrupación
+por códigos únicos). El resultado reemplaza completo el contenido de
+ClienteRFM y CohorteMensual; lo ejecuta una vez al día el comando
+`calcular_analitica_clientes`.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ClienteRFM, CohorteMensual, Pedido
+from .resumenes import ESTADOS_VENDIDOS
+
+HECHOS_DTYPE = [('cliente', 'i8'), ('dia', 'M8[D]'), ('monto', 'f8')]
+
+
+def hechos_pedidos(desde=None, lote=5000):
+    """Arreglo estructurado (cliente, dia, monto) con un elemento por pedido vendido"""
+    pedidos = Pedido.objects.filter(usuario__isnull=False, estado_pedido__in=ESTADOS_VENDIDOS)
+    if desde:
+        pedidos = pedidos.filter(fecha_pedido__date__gte=desde)
+    filas = (
+        pedidos.annotate(dia=TruncDate('fecha_pedido'))
+        .values_list('usuario_id', 'dia', 'total_pedido')
+        .order_by()
+        .iterator(chunk_size=lote)
+    )
+    return np.fromiter(
+        ((cliente, dia, float(monto)) for cliente, dia, monto in filas),
+        dtype=HECHOS_DTYPE
+    )
+
+
+def _quintil(valores):
+    """Puntaje 1 a 5 por quintil: los empates reciben el puntaje más bajo del grupo"""
+    ordenados = np.sort(valores)
+    menores = np.searchsorted(ordenados, valores, side='left')
+    return (menores * 5 // len(valores) + 1).astype(np.int16)
+
+
+def calcular_rfm(hechos, clientes, indice, hoy):
+    """
+    Métricas por cliente (`clientes, indice = np.unique(hechos['cliente'],
+    return_inverse=True)`). Retorna un dict de arreglos alineados con
+    `clientes`: primera, ultima, recencia, frecuencia, monto, r, f, m, segmento.
+    """
+    n = len(clientes)
+    dias = hechos['dia'].astype(np.int64)
+
+    frecuencia = np.bincount(indice, minlength=n)
+    monto = np.bincount(indice, weights=hechos['monto'], minlength=n)
+    primera = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(primera, indice, dias)
+    ultima = np.full(n, np.iinfo(np.int64).min)
+    np.maximum.at(ultima, indice, dias)
+    recencia = np.datetime64(hoy, 'D').astype(np.int64) - ultima
+
+    r = _quintil(-recencia)
+    f = _quintil(frecuencia)
+    m = _quintil(monto)
+    segmento = np.select(
+        [
+            (r >= 4) & (f >= 4),
+            f >= 4,
+            (r >= 4) & (frecuencia == 1),
+            (r <= 2) & (f >= 3),
+            r <= 2,
+        ],
+        ['campeones', 'leales', 'nuevos', 'en_riesgo', 'perdidos'],
+        default='potenciales'
+    )
+    return {
+        'primera': primera.astype('M8[D]'),
+        'ultima': ultima.astype('M8[D]'),
+        'recencia': recencia,
+        'frecuencia': frecuencia,
+        'monto': monto,
+        'r': r, 'f': f, 'm': m,
+        'segmento': segmento,
+    }
+
+
+def calcular_cohortes(hechos, primera, indice):
+    """
+    Agrupa los pedidos por (mes de la primera compra del cliente, meses
+    transcurridos). Retorna arreglos cohorte, mes, clientes, pedidos, monto.
+    """
+    cohorte = primera[indice].astype('M8[M]').astype(np.int64)
+    mes = hechos['dia'].astype('M8[M]').astype(np.int64) - cohorte
+    ancho = int(mes.max()) + 1
+
+    grupos, por_pedido = np.unique(cohorte * ancho + mes, return_inverse=True)
+    pedidos = np.bincount(por_pedido)
+    monto = np.bincount(por_pedido, weights=hechos['monto'])
+    # Clientes distintos por grupo: pares (grupo, cliente) únicos
+    total_clientes = int(indice.max()) + 1
+    pares = np.unique(por_pedido.astype(np.int64) * total_clientes + indice)
+    clientes = np.bincount(pares // total_clientes, minlength=len(grupos))
+
+    return {
+        'cohorte': (grupos // ancho).astype('M8[M]').astype('M8[D]'),
+        'mes': grupos % ancho,
+        'clientes': clientes,
+        'pedidos': pedidos,
+        'monto': monto,
+    }
+
+
+def _decimal(valor):
+    return Decimal(f'{valor:.2f}')
+
+
+def calcular_analitica_clientes(desde=None, hoy=None):
+    """
+    Recalcula ClienteRFM y CohorteMensual desde los pedidos (desde `desde`,
+    None = todo el historial). Retorna (clientes, filas de cohortes) escritos.
+    """
+    hoy = hoy or timezone.localdate()
+    ahora = timezone.now()
+    hechos = hechos_pedidos(desde)
+
+    filas_rfm, filas_cohortes = [], []
+    if len(hechos):
+        clientes, indice = np.unique(hechos['cliente'], return_inverse=True)
+        rfm = calcular_rfm(hechos, clientes, indice, hoy)
+        cohortes = calcular_cohortes(hechos, rfm['primera'], indice)
+        filas_rfm = [
+            ClienteRFM(
+                cliente_id=int(cliente), primera_compra=primera.item(), ultima_compra=ultima.item(),
+                recencia_dias=int(recencia), frecuencia=int(frecuencia), monto=_decimal(monto),
+                puntaje_r=int(r), puntaje_f=int(f), puntaje_m=int(m), segmento=str(segmento),
+                fecha_calculo=ahora,
+            )
+            for cliente, primera, ultima, recencia, frecuencia, monto, r, f, m, segmento in zip(
+                clientes, rfm['primera'], rfm['ultima'], rfm['recencia'], rfm['frecuencia'],
+                rfm['monto'], rfm['r'], rfm['f'], rfm['m'], rfm['segmento']
+            )
+        ]
+        filas_cohortes = [
+            CohorteMensual(
+                cohorte=cohorte.item(), mes=int(mes), clientes=int(activos),
+                pedidos=int(pedidos), monto=_decimal(monto),
+            )
+            for cohorte, mes, activos, pedidos, monto in zip(
+                cohortes['cohorte'], cohortes['mes'], cohortes['clientes'], cohortes['pedidos'], cohortes['monto']
+            )
+        ]
+
+    with transaction.atomic():
+        ClienteRFM.objects.all().delete()
+        CohorteMensual.objects.all().delete()
+        ClienteRFM.objects.bulk_create(filas_rfm, batch_size=1000)
+        CohorteMensual.objects.bulk_create(filas_cohortes, batch_size=1000)
+    return len(filas_rfm), len(filas_cohortes)
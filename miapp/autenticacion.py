@@ -0,0 +1,112 @@
+# miapp/autenticacion.py
+"""
+Autenticación JWT sin consultar la tabla de clientes en cada request.
+
+Los tokens llevan la identidad firmada (id, nombre, correo, activo) y la
+versión de tokens del cliente. `ClaimsJWTAuthentication` solo compara esa
+versión con la vigente, que se guarda en un cache del proceso por
+JWT_CACHE_SEGUNDOS: subir `Cliente.version_token` (cambio de contraseña,
+desactivación, `invalidar_tokens()`) revoca todos los tokens emitidos. El
+proceso que hace el cambio lo ve de inmediato; los demás, al vencer el cache.
+
+El Cliente completo se carga solo si la vista lo pide (`request.user.cliente`).
+"""
+import threading
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Cliente
+
+CLAIM_VERSION = 'version_token'
+
+_estados = TTLCache(maxsize=10000, ttl=getattr(settings, 'JWT_CACHE_SEGUNDOS', 60))
+_bloqueo = threading.Lock()
+
+
+def estado_cliente(cliente_id):
+    """(version_token, is_active) del cliente, o None si no existe. Cacheado por proceso."""
+    cliente_id = int(cliente_id)
+    with _bloqueo:
+        if cliente_id in _estados:
+            return _estados[cliente_id]
+    estado = Cliente.objects.filter(pk=cliente_id).values_list('version_token', 'is_active').first()
+    with _bloqueo:
+        _estados[cliente_id] = estado
+    return estado
+
+
+def olvidar_estado_cliente(cliente_id):
+    with _bloqueo:
+        _estados.pop(int(cliente_id), None)
+
+
+class TokenCliente(RefreshToken):
+    """Refresh token con los datos del cliente; el access token hereda los claims"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['nombre'] = user.nombre
+        token['correo'] = user.correo
+        token['is_active'] = user.is_active
+        token[CLAIM_VERSION] = user.version_token
+        return token
+
+
+class ClienteToken(TokenUser):
+    """Usuario armado con los claims del token; el modelo se consulta al pedirlo"""
+
+    @cached_property
+    def id(self):
+        # simplejwt guarda el id como texto en el claim
+        return int(self.token[jwt_api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def nombre(self):
+        return self.token.get('nombre', '')
+
+    @cached_property
+    def correo(self):
+        return self.token.get('correo', '')
+
+    @cached_property
+    def cliente(self):
+        return Cliente.objects.get(pk=self.id)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.correo})"
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication que confía en los claims firmados. Los tokens emitidos
+    antes de agregar la versión se validan como siempre, contra la base.
+    """
+
+    def get_user(self, validated_token):
+        if CLAIM_VERSION not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            cliente_id = validated_token[jwt_api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('El token no identifica a un cliente')
+
+        estado = estado_cliente(cliente_id)
+        if estado is None or not estado[1]:
+            raise AuthenticationFailed('Cliente no encontrado o inactivo', code='user_inactive')
+        if validated_token[CLAIM_VERSION] != estado[0]:
+            raise AuthenticationFailed('El token fue revocado', code='token_revoked')
+        return ClienteToken(validated_token)
+
+
+def cliente_de_request(request):
+    """Cliente (modelo) del usuario autenticado, sea por claims o por la base"""
+    return getattr(request.user, 'cliente', None) or request.user
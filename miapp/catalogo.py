@@ -0,0 +1,33 @@
+# miapp/catalogo.py
+"""
+Versión global del catálogo.
+
+Cualquier cambio en productos, ofertas o categorías incrementa la versión,
+lo que invalida los datos derivados del catálogo (por ejemplo, el resumen
+del carrito guardado en la sesión).
+"""
+import time
+
+from django.core.cache import cache
+
+CLAVE_VERSION_CATALOGO = 'catalogo:version'
+
+
+def obtener_version_catalogo():
+    """Retorna la versión actual del catálogo (la inicializa si no existe)"""
+    version = cache.get(CLAVE_VERSION_CATALOGO)
+    if version is None:
+        # Valor inicial basado en el tiempo para no reutilizar versiones
+        # antiguas si el cache se reinicia
+        cache.add(CLAVE_VERSION_CATALOGO, int(time.time() * 1000), timeout=None)
+        version = cache.get(CLAVE_VERSION_CATALOGO)
+    return version
+
+
+def incrementar_version_catalogo():
+    """Invalida todo lo que dependa del catálogo"""
+    try:
+        return cache.incr(CLAVE_VERSION_CATALOGO)
+    except ValueError:
+        # La clave no existe todavía
+        return obtener_version_catalogo()
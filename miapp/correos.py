@@ -0,0 +1,381 @@
+# miapp/correos.py
+"""
+Correos transaccionales con bandeja de salida (outbox).
+
+Las vistas solo encolan mensajes en CorreoSaliente (dentro de la misma
+transacción del pedido); el comando `python manage.py enviar_correos` los
+entrega con reintentos y backoff usando el proveedor configurado en
+EMAIL_PROVEEDOR ('resend' en producción, 'fake' para pruebas).
+
+Los mensajes con enlaces secretos (`contiene_secreto`) no quedan guardados:
+su contenido se borra apenas se entregan o se descartan.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CorreoSaliente, Pedido
+
+logger = logging.getLogger(__name__)
+
+CORREO_VENTAS = 'ventas.tresenuno@gmail.com'
+
+
+# ===== PROVEEDORES =====
+
+class ProveedorResend:
+    """Envía correos usando la API HTTP de Resend"""
+
+    def enviar(self, correo):
+        import resend
+
+        resend.api_key = settings.EMAIL_HOST_PASSWORD  # Usamos esta variable para la API key
+
+        params = {
+            "from": f"Tres en Uno <{settings.DEFAULT_FROM_EMAIL}>",
+            "to": correo.destinatarios,
+            "subject": correo.asunto,
+        }
+        if correo.html:
+            params["html"] = correo.html
+        if correo.texto:
+            params["text"] = correo.texto
+
+        resend.Emails.send(params)
+
+
+class ProveedorFalso:
+    """
+    Proveedor local para pruebas y desarrollo: no hace llamadas HTTP,
+    solo guarda los correos en ProveedorFalso.enviados.
+    """
+    enviados = []
+
+    def enviar(self, correo):
+        ProveedorFalso.enviados.append({
+            'to': list(correo.destinatarios),
+            'subject': correo.asunto,
+            'html': correo.html,
+            'text': correo.texto,
+        })
+
+
+PROVEEDORES = {
+    'resend': ProveedorResend,
+    'fake': ProveedorFalso,
+}
+
+
+def obtener_proveedor():
+    nombre = getattr(settings, 'EMAIL_PROVEEDOR', 'resend')
+    return PROVEEDORES[nombre]()
+
+
+# ===== CONSTRUCCIÓN DE MENSAJES =====
+
+def construir_correo_confirmacion_pedido(pedido, token_seguimiento=None):
+    """
+    Correo de confirmación al cliente con instrucciones de pago.
+    Recibe el pedido cargado con `Pedido.objects.con_detalles()`.
+    Con `token_seguimiento` incluye el enlace para seguir el pedido sin cuenta.
+    """
+    detalles = pedido.detalles.all()
+    
+    seguimiento_html = ""
+    if token_seguimiento:
+        enlace = f"{settings.SITE_URL}/seguimiento/{token_seguimiento}/"
+        seguimiento_html = f'<p>Sigue el estado de tu pedido en cualquier momento: <a href="{enlace}">{enlace}</a></p>'
+
+    # Construir lista de productos
+    productos_html = ""
+    for detalle in detalles:
+        productos_html += f"<li>{detalle.cantidad} x {detalle.producto.nombre} - ${detalle.precio_compra:,.0f}</li>"
+
+    mensaje_html = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <h2 style="color: #28a745;">¡Gracias por tu pedido!</h2>
+            
+            <div style="background: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0;">
+                <h3>Pedido #{pedido.id}</h3>
+                <p><strong>Total:</strong> ${pedido.total_pedido:,.0f}</p>
+            </div>
+            
+            <h3>Productos:</h3>
+            <ul>{productos_html}</ul>
+            
+            <div style="background: #fff3cd; padding: 20px; border-radius: 5px; margin: 20px 0; border-left: 4px solid #ffc107;">
+                <h3 style="margin-top: 0;">💳 Datos para Transferencia</h3>
+                <p><strong>Banco:</strong> Banco Estado</p>
+                <p><strong>Tipo de Cuenta:</strong> Cuenta Vista</p>
+                <p><strong>Número de Cuenta:</strong> 90272246717</p>
+                <p><strong>RUT:</strong> 77.851.212-2</p>
+                <p><strong>Titular:</strong> Tres en uno</p>
+                <p><strong>Monto a transferir:</strong> ${pedido.total_pedido:,.0f}</p>
+                <p style="color: #856404;"><strong>⚠️ Importante:</strong> Incluye el número de pedido #{pedido.id} en el mensaje de la transferencia.</p>
+            </div>
+            
+            <div style="background: #d4edda; padding: 20px; border-radius: 5px; margin: 20px 0;">
+                <h3 style="margin-top: 0;">📦 Dirección de Envío</h3>
+                <p>{pedido.direccion}</p>
+                <p>{pedido.comuna}, {pedido.region}</p>
+            </div>
+            
+            {seguimiento_html}
+            <p>Si tienes alguna duda, contáctanos a: ventas.tresenuno@gmail.com</p>
+        </body>
+    </html>
+    """
+
+    return CorreoSaliente(
+        tipo='confirmacion_pedido',
+        pedido=pedido,
+        destinatarios=[pedido.correo_cliente],
+        asunto=f"Pedido #{pedido.id} - Confirmación y Datos de Pago",
+        html=mensaje_html,
+        contiene_secreto=bool(token_seguimiento),
+    )
+
+
+def construir_correo_admin_nuevo_pedido(pedido):
+    """Notificación al administrador sobre un nuevo pedido (pedido con detalles precargados)"""
+    detalles = pedido.detalles.all()
+    productos_texto = "\n".join([f"- {d.cantidad} x {d.producto.nombre} - ${d.precio_compra:,.0f}" for d in detalles])
+
+    mensaje = f"""
+    Nuevo pedido en Tres En Uno
+    
+    PEDIDO #{pedido.id}
+    Total: ${pedido.total_pedido:,.0f}
+    
+    CLIENTE:
+    Nombre: {pedido.nombre_cliente}
+    Email: {pedido.correo_cliente}
+    Teléfono: {pedido.telefono_cliente}
+    
+    DIRECCIÓN:
+    {pedido.direccion}
+    {pedido.comuna}, {pedido.region}
+    
+    PRODUCTOS:
+    {productos_texto}
+    """
+
+    return CorreoSaliente(
+        tipo='admin_nuevo_pedido',
+        pedido=pedido,
+        destinatarios=[CORREO_VENTAS],
+        asunto=f"🛒 Nuevo Pedido #{pedido.id} - {pedido.nombre_cliente}",
+        texto=mensaje,
+    )
+
+
+def construir_correo_password_reset(email, reset_url):
+    """Correo de recuperación de contraseña"""
+    mensaje_html = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="text-align: center; margin-bottom: 30px;">
+                <h2 style="color: #28a745;">Restablecer Contraseña</h2>
+            </div>
+            
+            <p>Hola,</p>
+            
+            <p>Recibimos una solicitud para restablecer la contraseña de tu cuenta en Tres En Uno.</p>
+            
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="{reset_url}" 
+                   style="background: #28a745; color: white; padding: 15px 30px; 
+                          text-decoration: none; border-radius: 5px; display: inline-block;
+                          font-weight: bold;">
+                    Restablecer mi contraseña
+                </a>
+            </div>
+            
+            <p>O copia y pega este enlace en tu navegador:</p>
+            <p style="background: #f8f9fa; padding: 10px; border-radius: 5px; word-break: break-all;">
+                {reset_url}
+            </p>
+            
+            <p style="color: #6c757d; font-size: 14px; margin-top: 30px;">
+                Si no solicitaste este cambio, puedes ignorar este correo de forma segura.
+            </p>
+            
+            <hr style="margin: 30px 0; border: none; border-top: 1px solid #e9ecef;">
+            
+            <p style="color: #6c757d; font-size: 12px; text-align: center;">
+                Tres En Uno - Cultivos Orgánicos<br>
+                Este es un correo automático, por favor no respondas a este mensaje.
+            </p>
+        </body>
+    </html>
+    """
+
+    return CorreoSaliente(
+        tipo='password_reset',
+        destinatarios=[email],
+        asunto="Restablecer contraseña - Tres en Uno",
+        html=mensaje_html,
+        contiene_secreto=True,
+    )
+
+
+MENSAJES_ESTADO = {
+    'pagado': ('Pago confirmado', 'Recibimos el pago de tu pedido. Pronto comenzaremos a prepararlo.'),
+    'preparando': ('Preparando tu pedido', 'Estamos preparando tu pedido para el envío.'),
+    'enviado': ('Pedido enviado', 'Tu pedido va en camino.'),
+    'completado': ('Pedido entregado', 'Tu pedido fue entregado. ¡Gracias por comprar en Tres En Uno!'),
+    'cancelado': ('Pedido cancelado', 'Tu pedido fue cancelado. Si tienes dudas, responde a ventas.tresenuno@gmail.com.'),
+}
+
+
+def construir_correo_cambio_estado(pedido):
+    """Aviso al cliente de que su pedido cambió de estado"""
+    titulo, mensaje = MENSAJES_ESTADO[pedido.estado_pedido]
+    seguimiento = ""
+    if pedido.estado_pedido == 'enviado' and pedido.numero_seguimiento:
+        seguimiento = f"<p><strong>Número de seguimiento:</strong> {pedido.numero_seguimiento}</p>"
+
+    mensaje_html = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <h2 style="color: #28a745;">{titulo}</h2>
+            <p>Hola {pedido.nombre_cliente},</p>
+            <p>{mensaje}</p>
+            <p><strong>Pedido:</strong> #{pedido.id} - Total: ${pedido.total_pedido:,.0f}</p>
+            {seguimiento}
+            <hr style="margin: 30px 0; border: none; border-top: 1px solid #e9ecef;">
+            <p style="color: #6c757d; font-size: 12px; text-align: center;">
+                Tres En Uno - Cultivos Orgánicos<br>
+                Este es un correo automático, por favor no respondas a este mensaje.
+            </p>
+        </body>
+    </html>
+    """
+
+    return CorreoSaliente(
+        tipo='cambio_estado',
+        pedido=pedido,
+        destinatarios=[pedido.correo_cliente],
+        asunto=f"Pedido #{pedido.id} - {titulo}",
+        html=mensaje_html,
+    )
+
+
+# ===== ENCOLADO =====
+
+def encolar_correos(correos):
+    """Guarda en la bandeja de salida una lista de CorreoSaliente sin guardar"""
+    ahora = timezone.now()
+    for correo in correos:
+        correo.proximo_intento = ahora
+    return CorreoSaliente.objects.bulk_create(correos)
+
+
+def encolar_correos_nuevo_pedido(pedido, token_seguimiento=None):
+    """Encola la confirmación al cliente y el aviso a ventas de un pedido nuevo"""
+    # Ambos mensajes recorren los detalles: cargarlos una sola vez con sus productos
+    pedido = Pedido.objects.con_detalles().get(pk=pedido.pk)
+    return encolar_correos([
+        construir_correo_confirmacion_pedido(pedido, token_seguimiento=token_seguimiento),
+        construir_correo_admin_nuevo_pedido(pedido),
+    ])
+
+
+def encolar_correos_cambio_estado(pedido_ids):
+    """Encola en un solo INSERT los avisos de cambio de estado de varios pedidos"""
+    pedidos = Pedido.objects.filter(pk__in=pedido_ids).only(
+        'id', 'estado_pedido', 'nombre_cliente', 'correo_cliente', 'total_pedido', 'numero_seguimiento'
+    )
+    return encolar_correos([construir_correo_cambio_estado(pedido) for pedido in pedidos])
+
+
+# ===== ENTREGA =====
+
+def calcular_espera_reintento(intentos):
+    """Backoff exponencial con jitter: ~1, 2, 4, 8... minutos (máximo 1 hora)"""
+    base = getattr(settings, 'CORREOS_BACKOFF_SEGUNDOS', 60)
+    segundos = min(base * (2 ** max(intentos - 1, 0)), 3600)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def reclamar_pendientes(limite):
+    """
+    Toma un lote de correos pendientes cuyo próximo intento ya venció.
+    Se usa SKIP LOCKED para que varios workers no tomen los mismos correos, y
+    se corre proximo_intento hacia adelante como "lease": si el worker muere,
+    el correo vuelve a quedar disponible al vencer ese plazo.
+    """
+    ahora = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'CORREOS_LEASE_SEGUNDOS', 300))
+
+    with transaction.atomic():
+        correos = list(
+            CorreoSaliente.objects.select_for_update(skip_locked=True)
+            .filter(estado='pendiente', proximo_intento__lte=ahora)
+            .order_by('proximo_intento')[:limite]
+        )
+        for correo in correos:
+            correo.intentos += 1
+            correo.proximo_intento = ahora + lease
+        CorreoSaliente.objects.bulk_update(correos, ['intentos', 'proximo_intento'])
+
+    return correos
+
+
+def _enviar(proveedor, correo):
+    try:
+        proveedor.enviar(correo)
+        return None
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+
+
+def procesar_pendientes(limite=50, concurrencia=4, proveedor=None):
+    """
+    Envía un lote de correos pendientes con `concurrencia` hilos.
+    Las llamadas HTTP se hacen en los hilos; la base de datos solo se toca
+    desde el hilo principal. Retorna (enviados, fallidos).
+    """
+    proveedor = proveedor or obtener_proveedor()
+    correos = reclamar_pendientes(limite)
+    if not correos:
+        return 0, 0
+
+    max_intentos = getattr(settings, 'CORREOS_MAX_INTENTOS', 5)
+
+    with ThreadPoolExecutor(max_workers=max(concurrencia, 1)) as executor:
+        errores = list(executor.map(lambda correo: _enviar(proveedor, correo), correos))
+
+    ahora = timezone.now()
+    enviados = fallidos = 0
+
+    for correo, error in zip(correos, errores):
+        if error is None:
+            correo.estado = 'enviado'
+            correo.fecha_envio = ahora
+            correo.ultimo_error = ''
+            enviados += 1
+            logger.info(f"Correo #{correo.id} ({correo.tipo}) enviado")
+        else:
+            correo.ultimo_error = error[:1000]
+            if correo.intentos >= max_intentos:
+                correo.estado = 'fallido'
+                logger.error(f"Correo #{correo.id} ({correo.tipo}) descartado tras {correo.intentos} intentos: {error}")
+            else:
+                correo.proximo_intento = ahora + calcular_espera_reintento(correo.intentos)
+                logger.warning(f"Error al enviar correo #{correo.id} (intento {correo.intentos}): {error}")
+            fallidos += 1
+
+        if correo.contiene_secreto and correo.estado != 'pendiente':
+            correo.html = correo.texto = ''
+
+    CorreoSaliente.objects.bulk_update(
+        correos, ['estado', 'fecha_envio', 'ultimo_error', 'proximo_intento', 'html', 'texto']
+    )
+    return enviados, fallidos
@@ -0,0 +1,186 @@
+# miapp/eventos.py
+"""
+Estado de los pedidos en vivo (Server-Sent Events).
+
+Publicación: `publicar_cambios_estado` se llama desde la señal
+`pedidos_cambiaron_estado` (acciones del admin y Pedido.marcar_como_*).
+En PostgreSQL usa pg_notify, que es transaccional: el aviso solo sale si el
+cambio se confirma y llega a todos los procesos. En otras bases se entrega al
+broker local del proceso al confirmar la transacción (desarrollo y tests).
+
+Suscripción: cada proceso ASGI mantiene UNA conexión con LISTEN y reparte los
+avisos a las colas asyncio de los clientes conectados a ese proceso.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from .models import Pedido
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'pedidos_estado'
+
+# Milisegundos que espera EventSource antes de reconectarse
+REINTENTO_MS = 5000
+
+
+class BrokerLocal:
+    """Reparte los avisos a las colas de los clientes conectados, por usuario"""
+
+    def __init__(self):
+        self._colas = defaultdict(set)
+        self._loop = None
+
+    def suscribir(self, usuario_id):
+        self._loop = asyncio.get_running_loop()
+        cola = asyncio.Queue(maxsize=100)
+        self._colas[usuario_id].add(cola)
+        return cola
+
+    def desuscribir(self, usuario_id, cola):
+        colas = self._colas.get(usuario_id)
+        if colas is None:
+            return
+        colas.discard(cola)
+        if not colas:
+            del self._colas[usuario_id]
+
+    def conectados(self):
+        return sum(len(colas) for colas in self._colas.values())
+
+    def entregar(self, mensaje):
+        """Se puede llamar desde cualquier hilo: la entrega corre en el loop"""
+        if self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._entregar, mensaje)
+        except RuntimeError:
+            # Loop cerrado: no quedan clientes conectados en este proceso
+            self._loop = None
+
+    def _entregar(self, mensaje):
+        for cola in list(self._colas.get(mensaje['usuario'], ())):
+            try:
+                cola.put_nowait(mensaje)
+            except asyncio.QueueFull:
+                logger.warning(f"Cliente SSE del usuario {mensaje['usuario']} no consume eventos, aviso descartado")
+
+
+broker = BrokerLocal()
+
+
+class OyentePostgres:
+    """
+    Conexión LISTEN compartida por el proceso. Se registra en el loop con
+    add_reader, así que no ocupa un hilo; si la conexión se cae, se reabre
+    con la siguiente suscripción.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._conexion = None
+        self._bloqueo = asyncio.Lock()
+
+    async def iniciar(self):
+        async with self._bloqueo:
+            if self._conexion is not None:
+                return
+            self._conexion = await sync_to_async(self._conectar, thread_sensitive=False)()
+            asyncio.get_running_loop().add_reader(self._conexion.fileno(), self._leer)
+            logger.info(f"Escuchando avisos en el canal {CANAL}")
+
+    def _conectar(self):
+        # Conexión propia (fuera del pool de Django), siempre en autocommit
+        envoltorio = connections.create_connection('default')
+        envoltorio.connect()
+        conexion = envoltorio.connection
+        conexion.autocommit = True
+        with conexion.cursor() as cursor:
+            cursor.execute(f'LISTEN {CANAL}')
+        return conexion
+
+    def _leer(self):
+        try:
+            self._conexion.poll()
+        except Exception as e:
+            logger.error(f"Conexión LISTEN perdida: {e}")
+            asyncio.get_running_loop().remove_reader(self._conexion.fileno())
+            self._conexion = None
+            return
+
+        while self._conexion.notifies:
+            aviso = self._conexion.notifies.pop(0)
+            self.broker._entregar(json.loads(aviso.payload))
+
+
+_oyente = OyentePostgres(broker)
+
+
+def publicar_cambios_estado(cambios, estado_nuevo):
+    """
+    Publica un aviso por pedido con usuario (los invitados no tienen sesión
+    que escuche). cambios: [(pedido_id, estado_anterior)].
+    """
+    usuarios = dict(
+        Pedido.objects.filter(pk__in=[pk for pk, _ in cambios], usuario__isnull=False)
+        .values_list('pk', 'usuario_id')
+    )
+    nombre_estado = dict(Pedido.ESTADOS)[estado_nuevo]
+    mensajes = [
+        {
+            'pedido': pedido_id,
+            'usuario': usuarios[pedido_id],
+            'estado': estado_nuevo,
+            'estado_display': nombre_estado,
+            'anterior': estado_anterior,
+        }
+        for pedido_id, estado_anterior in cambios
+        if pedido_id in usuarios
+    ]
+    if not mensajes:
+        return
+
+    if connection.vendor == 'postgresql':
+        # Un solo viaje; NOTIFY se entrega al confirmar la transacción
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, aviso) FROM unnest(%s::text[]) AS aviso',
+                [CANAL, [json.dumps(mensaje) for mensaje in mensajes]]
+            )
+    else:
+        transaction.on_commit(lambda: [broker.entregar(mensaje) for mensaje in mensajes])
+
+
+async def suscribir(usuario_id):
+    if connection.vendor == 'postgresql':
+        await _oyente.iniciar()
+    return broker.suscribir(usuario_id)
+
+
+async def flujo_eventos(usuario_id, latido=None):
+    """
+    Genera el stream SSE de un usuario: un evento 'estado' por cambio y un
+    comentario de latido cada `latido` segundos para que los proxies no
+    corten la conexión inactiva.
+    """
+    if latido is None:
+        latido = getattr(settings, 'SSE_LATIDO_SEGUNDOS', 20)
+
+    cola = await suscribir(usuario_id)
+    try:
+        yield f'retry: {REINTENTO_MS}\n\n'
+        while True:
+            try:
+                mensaje = await asyncio.wait_for(cola.get(), timeout=latido)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            yield f'event: estado\ndata: {json.dumps(mensaje)}\n\n'
+    finally:
+        broker.desuscribir(usuario_id, cola)
@@ -0,0 +1,192 @@
+# miapp/exportacion.py
+"""
+Exportación de ventas: una fila por línea de pedido (DetallePedido) con los
+datos del pedido y la copia de los datos del cliente.
+
+Las filas salen de una sola consulta con `values_list().iterator()`, así que
+la memoria es constante sin importar el tamaño del rango exportado: en
+PostgreSQL se leen con un cursor del lado del servidor, de a `lote` filas.
+
+Bajo ASGI la descarga usa `afilas_ventas`: cada lote es una consulta aparte
+(paginación por clave) hecha con sync_to_async, y el CSV se genera con un
+generador asíncrono. Un iterador síncrono en un StreamingHttpResponse servido
+por ASGI se consume completo en memoria antes de enviarse.
+"""
+import csv
+from itertools import chain
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DetallePedido
+
+# (encabezado, campo de DetallePedido)
+COLUMNAS = [
+    ('Pedido', 'pedido_id'),
+    ('Fecha', 'fecha_pedido'),
+    ('Estado', 'pedido__estado_pedido'),
+    ('Método de pago', 'pedido__metodo_pago'),
+    ('Cliente', 'pedido__nombre_cliente'),
+    ('Correo', 'pedido__correo_cliente'),
+    ('Teléfono', 'pedido__telefono_cliente'),
+    ('Dirección', 'pedido__direccion'),
+    ('Comuna', 'pedido__comuna'),
+    ('Región', 'pedido__region'),
+    ('Código postal', 'pedido__codigo_postal'),
+    ('Total pedido', 'pedido__total_pedido'),
+    ('Producto ID', 'producto_id'),
+    ('Producto', 'producto__nombre'),
+    ('Cantidad', 'cantidad'),
+    ('Precio unitario', 'precio_compra'),
+]
+
+CAMPOS = [campo for _, campo in COLUMNAS]
+
+FORMATOS = ('csv', 'excel')
+
+
+class ParametrosInvalidos(ValueError):
+    """Fecha u opción de exportación no válida"""
+
+
+def rango_fechas(desde=None, hasta=None):
+    """
+    Convierte fechas 'AAAA-MM-DD' (ambas inclusivas) en el intervalo
+    [inicio, fin) en la zona horaria del sitio. None deja el extremo abierto.
+    """
+    limites = []
+    for valor, dias in ((desde, 0), (hasta, 1)):
+        if not valor:
+            limites.append(None)
+            continue
+        try:
+            fecha = parse_date(valor) if isinstance(valor, str) else valor
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise ParametrosInvalidos(f'Fecha no válida: {valor} (formato AAAA-MM-DD)')
+        limites.append(timezone.make_aware(datetime.combine(fecha + timedelta(days=dias), time.min)))
+    return tuple(limites)
+
+
+def consulta_ventas(desde=None, hasta=None, estados=None):
+    """
+    Líneas de venta filtradas, en el orden del archivo. Filtra por la fecha
+    desnormalizada del detalle (usa su índice y, con tablas particionadas,
+    solo lee las particiones del rango).
+    """
+    inicio, fin = rango_fechas(desde, hasta)
+    detalles = DetallePedido.objects.all()
+    if inicio:
+        detalles = detalles.filter(fecha_pedido__gte=inicio)
+    if fin:
+        detalles = detalles.filter(fecha_pedido__lt=fin)
+    if estados:
+        detalles = detalles.filter(pedido__estado_pedido__in=estados)
+
+    return detalles.order_by('fecha_pedido', 'pedido_id', 'id')
+
+
+def filas_ventas(desde=None, hasta=None, estados=None, lote=2000):
+    """Itera las líneas de venta como tuplas en el orden de COLUMNAS"""
+    return consulta_ventas(desde, hasta, estados).values_list(*CAMPOS).iterator(chunk_size=lote)
+
+
+def lote_ventas(detalles, despues=None, lote=2000):
+    """
+    Hasta `lote` filas de `detalles` (ordenado como en consulta_ventas) que
+    siguen a la clave (fecha_pedido, pedido_id, id) `despues`. Cada fila lleva
+    el id del detalle al final.
+    """
+    if despues:
+        fecha, pedido_id, detalle_id = despues
+        detalles = detalles.filter(
+            Q(fecha_pedido__gt=fecha)
+            | Q(fecha_pedido=fecha, pedido_id__gt=pedido_id)
+            | Q(fecha_pedido=fecha, pedido_id=pedido_id, id__gt=detalle_id)
+        )
+    return list(detalles.values_list(*CAMPOS, 'id')[:lote])
+
+
+async def afilas_ventas(detalles, lote=2000):
+    """Versión asíncrona de filas_ventas: recibe el resultado de consulta_ventas"""
+    indice_fecha, indice_pedido = CAMPOS.index('fecha_pedido'), CAMPOS.index('pedido_id')
+    despues = None
+    while True:
+        filas = await sync_to_async(lote_ventas)(detalles, despues, lote)
+        for fila in filas:
+            yield fila[:-1]
+        if len(filas) < lote:
+            return
+        ultima = filas[-1]
+        despues = (ultima[indice_fecha], ultima[indice_pedido], ultima[-1])
+
+
+class _Eco:
+    """Buffer de csv.writer que devuelve la línea en vez de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def generar_csv(filas, formato='csv'):
+    """
+    Retorna un generador del archivo línea por línea (str); asíncrono si
+    `filas` lo es. El formato 'excel' antepone el BOM UTF-8, usa ';' como
+    separador y coma decimal, que es lo que Excel en español espera.
+    """
+    if formato not in FORMATOS:
+        raise ParametrosInvalidos(f'Formato no válido: {formato} (opciones: {", ".join(FORMATOS)})')
+    excel = formato == 'excel'
+    if hasattr(filas, '__aiter__'):
+        return _alineas_csv(filas, excel)
+    return _lineas_csv(filas, excel)
+
+
+# Un texto que empieza así se evalúa como fórmula al abrir el archivo en una planilla
+INICIOS_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _celda_segura(valor):
+    """Antepone ' a los textos (ingresados por clientes) que una planilla tomaría como fórmula"""
+    if isinstance(valor, str) and valor.startswith(INICIOS_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def _formateador(excel):
+    """(líneas de encabezado, función que convierte una fila en su línea)"""
+    escritor = csv.writer(_Eco(), delimiter=';' if excel else ',')
+    indice_fecha = CAMPOS.index('fecha_pedido')
+
+    def linea(fila):
+        fila = [_celda_segura(valor) for valor in fila]
+        fila[indice_fecha] = timezone.localtime(fila[indice_fecha]).strftime('%Y-%m-%d %H:%M:%S')
+        if excel:
+            fila = [str(valor).replace('.', ',') if isinstance(valor, Decimal) else valor for valor in fila]
+        return escritor.writerow(fila)
+
+    encabezado = escritor.writerow([encabezado for encabezado, _ in COLUMNAS])
+    return (['\ufeff'] if excel else []) + [encabezado], linea
+
+
+def _lineas_csv(filas, excel):
+    encabezado, linea = _formateador(excel)
+    return chain(encabezado, map(linea, filas))
+
+
+async def _alineas_csv(filas, excel):
+    encabezado, linea = _formateador(excel)
+    for texto in encabezado:
+        yield texto
+    async for fila in filas:
+        yield linea(fila)
+
+
+def nombre_archivo(desde=None, hasta=None):
+    partes = ['ventas', desde or 'inicio', hasta or timezone.localdate().isoformat()]
+    return '_'.join(str(parte) for parte in partes) + '.csv'
@@ -0,0 +1,619 @@
+# miapp/inventario.py
+"""
+Operaciones de inventario: reservas temporales de stock, descuento de stock
+al confirmar un pedido y libro de movimientos con contadores fragmentados
+para productos muy vendidos.
+"""
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DetallePedido, FragmentoStock, MovimientoInventario, Producto, ReservaStock
+
+logger = logging.getLogger(__name__)
+
+
+class StockInsuficiente(ValueError):
+    """No hay stock suficiente (descontando reservas de otros carritos)"""
+
+    def __init__(self, producto, disponible):
+        self.producto = producto
+        self.disponible = disponible
+        super().__init__(
+            f'Stock insuficiente para {producto.nombre}. '
+            f'Solo hay {disponible} unidades disponibles.'
+        )
+
+
+class ConflictoStock(Exception):
+    """El checkout optimista agotó sus reintentos por escrituras concurrentes"""
+
+
+def reservas_activas():
+    """Indica si el modo de reservas de stock está habilitado"""
+    return getattr(settings, 'RESERVAS_STOCK_ACTIVAS', False)
+
+
+def checkout_optimista():
+    """Indica si el checkout usa concurrencia optimista (columna version) en vez de bloqueos"""
+    return getattr(settings, 'CHECKOUT_ESTRATEGIA', 'pesimista') == 'optimista'
+
+
+def calcular_expiracion_reserva():
+    minutos = getattr(settings, 'RESERVA_STOCK_MINUTOS', 15)
+    return timezone.now() + timedelta(minutes=minutos)
+
+
+def stock_actual(producto_ids):
+    """
+    Retorna {producto_id: stock}. En productos fragmentados el stock real es la
+    suma de sus fragmentos (stock_disponible puede estar desfasado hasta la
+    próxima compactación).
+    """
+    stock = dict(
+        Producto.objects.filter(pk__in=producto_ids).values_list('id', 'stock_disponible')
+    )
+    stock.update(
+        FragmentoStock.objects.filter(producto_id__in=producto_ids)
+        .values('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values_list('producto_id', 'total')
+    )
+    return stock
+
+
+def anotar_stock_actual(queryset):
+    """
+    Anota `stock_real` en un queryset de productos: la suma de los fragmentos
+    si el producto está fragmentado, o stock_disponible si no. Sirve para
+    filtrar y listar sin una consulta por producto.
+    """
+    fragmentos = (
+        FragmentoStock.objects.filter(producto_id=OuterRef('pk'))
+        .values('producto_id')
+        .annotate(total=Sum('cantidad'))
+        .values('total')
+    )
+    return queryset.annotate(
+        stock_real=Coalesce(Subquery(fragmentos, output_field=IntegerField()), F('stock_disponible'))
+    )
+
+
+def stock_reservado(producto_ids, excluir_clave=None):
+    """
+    Retorna {producto_id: cantidad} con las reservas vigentes de los productos,
+    opcionalmente excluyendo las del propio carrito.
+    """
+    reservas = ReservaStock.objects.vigentes().filter(producto_id__in=producto_ids)
+    if excluir_clave:
+        reservas = reservas.exclude(clave_carrito=excluir_clave)
+
+    return dict(
+        reservas.values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total')
+    )
+
+
+def reservar_stock(clave_carrito, cantidades):
+    """
+    Crea o actualiza las reservas del carrito con las cantidades indicadas
+    ({producto_id: cantidad}). El stock disponible es el stock del producto
+    menos las reservas vigentes de otros carritos.
+    Lanza StockInsuficiente si alguna cantidad no se puede reservar.
+    """
+    if not cantidades:
+        return
+
+    expira_en = calcular_expiracion_reserva()
+
+    with transaction.atomic():
+        # Bloqueo breve y en orden de id para evitar deadlocks entre carritos
+        productos = list(
+            Producto.objects.select_for_update()
+            .filter(pk__in=cantidades.keys())
+            .order_by('pk')
+            .only('id', 'nombre', 'stock_disponible')
+        )
+        reservado_otros = stock_reservado(cantidades.keys(), excluir_clave=clave_carrito)
+        stock = stock_actual(cantidades.keys())
+
+        for producto in productos:
+            cantidad = cantidades[producto.id]
+            disponible = stock[producto.id] - reservado_otros.get(producto.id, 0)
+
+            if cantidad > disponible:
+                raise StockInsuficiente(producto, max(disponible, 0))
+
+            ReservaStock.objects.update_or_create(
+                producto=producto,
+                clave_carrito=clave_carrito,
+                defaults={'cantidad': cantidad, 'expira_en': expira_en}
+            )
+
+        # Mantener vivas el resto de las reservas vigentes del carrito
+        ReservaStock.objects.vigentes().filter(
+            clave_carrito=clave_carrito
+        ).update(expira_en=expira_en)
+
+
+def liberar_reservas(clave_carrito, producto_ids=None):
+    """Libera las reservas de un carrito (todas o solo de ciertos productos)"""
+    reservas = ReservaStock.objects.filter(clave_carrito=clave_carrito)
+    if producto_ids is not None:
+        reservas = reservas.filter(producto_id__in=producto_ids)
+    eliminadas, _ = reservas.delete()
+    return eliminadas
+
+
+def liberar_reservas_vencidas():
+    """Elimina en bloque todas las reservas expiradas"""
+    eliminadas, _ = ReservaStock.objects.vencidas().delete()
+    if eliminadas:
+        logger.info(f"Reservas vencidas liberadas: {eliminadas}")
+    return eliminadas
+
+
+def _descontar_condicional(producto_id, cantidad):
+    """UPDATE ... SET stock = stock - n WHERE stock >= n. Retorna filas afectadas."""
+    return Producto.objects.filter(
+        pk=producto_id,
+        stock_fragmentado=False,
+        stock_disponible__gte=cantidad
+    ).update(stock_disponible=F('stock_disponible') - cantidad, version=F('version') + 1)
+
+
+def _descontar_fragmentos(producto_id, cantidad):
+    """
+    Descuenta de un fragmento al azar con un UPDATE condicional, sin bloquear
+    la fila del producto. Si ningún fragmento alcanza por sí solo, bloquea los
+    fragmentos del producto en orden y reparte el descuento entre ellos.
+    Retorna False si no hay stock suficiente.
+    """
+    indices = list(
+        FragmentoStock.objects.filter(producto_id=producto_id, cantidad__gte=cantidad)
+        .values_list('indice', flat=True)
+    )
+    random.shuffle(indices)
+    for indice in indices:
+        if FragmentoStock.objects.filter(
+            producto_id=producto_id,
+            indice=indice,
+            cantidad__gte=cantidad
+        ).update(cantidad=F('cantidad') - cantidad):
+            return True
+
+    fragmentos = list(
+        FragmentoStock.objects.select_for_update()
+        .filter(producto_id=producto_id)
+        .order_by('indice')
+    )
+    if sum(fragmento.cantidad for fragmento in fragmentos) < cantidad:
+        return False
+
+    restante = cantidad
+    for fragmento in fragmentos:
+        tomar = min(fragmento.cantidad, restante)
+        if tomar:
+            FragmentoStock.objects.filter(pk=fragmento.pk).update(cantidad=F('cantidad') - tomar)
+            restante -= tomar
+        if not restante:
+            break
+    return True
+
+
+def _productos_fragmentados(producto_ids):
+    return set(
+        Producto.objects.filter(pk__in=producto_ids, stock_fragmentado=True).values_list('id', flat=True)
+    )
+
+
+def _descontar_sin_bloqueo(producto_id, cantidad, fragmentado):
+    """
+    Descuenta con UPDATE condicionales, del contador que corresponda al producto.
+    Retorna 'fragmentos' o 'producto' según de dónde descontó, o None si no alcanza.
+    """
+    if fragmentado and _descontar_fragmentos(producto_id, cantidad):
+        return 'fragmentos'
+    if _descontar_condicional(producto_id, cantidad):
+        return 'producto'
+    # El producto pudo cambiar de modo entre la lectura y el descuento
+    if not fragmentado and Producto.objects.filter(pk=producto_id, stock_fragmentado=True).exists():
+        if _descontar_fragmentos(producto_id, cantidad):
+            return 'fragmentos'
+    return None
+
+
+def _registrar_ventas(cantidades, fragmentados, pedido):
+    MovimientoInventario.objects.bulk_create([
+        MovimientoInventario(
+            producto_id=producto_id,
+            tipo='venta',
+            cantidad=-cantidad,
+            pedido=pedido,
+            compactado=producto_id not in fragmentados
+        )
+        for producto_id, cantidad in sorted(cantidades.items())
+    ])
+
+
+def descontar_stock(cantidades, pedido=None):
+    """
+    Descuenta el stock de un pedido ({producto_id: cantidad}) y registra las
+    ventas en el libro de movimientos.
+    Bloquea los productos normales en un solo SELECT ... FOR UPDATE ordenado
+    por id (orden fijo entre checkouts concurrentes = sin deadlocks) y los
+    descuenta con un único UPDATE usando CASE. Los productos fragmentados no
+    se bloquean: se descuenta de uno de sus fragmentos.
+    Debe llamarse dentro de una transacción, lo más tarde posible para acortar
+    el tiempo que se mantienen los bloqueos.
+    """
+    if not cantidades:
+        return
+
+    fragmentados = _productos_fragmentados(cantidades.keys())
+    normales = [producto_id for producto_id in cantidades if producto_id not in fragmentados]
+
+    productos = {
+        producto.id: producto
+        for producto in Producto.objects.select_for_update()
+        .filter(pk__in=normales)
+        .order_by('pk')
+        .only('id', 'nombre', 'stock_disponible', 'stock_fragmentado')
+    }
+
+    # Un producto pudo pasar a fragmentado antes de obtener el bloqueo
+    for producto in list(productos.values()):
+        if producto.stock_fragmentado:
+            fragmentados.add(producto.id)
+            del productos[producto.id]
+
+    for producto_id in sorted(normales):
+        if producto_id in fragmentados:
+            continue
+        producto = productos.get(producto_id)
+        if producto is None:
+            raise ValueError(f'Producto no encontrado (id {producto_id})')
+        if producto.stock_disponible < cantidades[producto_id]:
+            raise StockInsuficiente(producto, producto.stock_disponible)
+
+    if productos:
+        Producto.objects.filter(pk__in=productos.keys()).update(
+            stock_disponible=Case(
+                *[
+                    When(pk=producto_id, then=F('stock_disponible') - Value(cantidades[producto_id]))
+                    for producto_id in productos
+                ],
+                output_field=IntegerField()
+            ),
+            version=F('version') + 1
+        )
+
+    for producto_id in sorted(fragmentados):
+        if not _descontar_fragmentos(producto_id, cantidades[producto_id]):
+            _lanzar_stock_insuficiente(producto_id)
+
+    _registrar_ventas(cantidades, fragmentados, pedido)
+
+
+class _VersionCambiada(Exception):
+    pass
+
+
+def _descontar_versionado(cantidades, pedido):
+    """
+    Un intento del checkout optimista: lee los productos sin bloquear y
+    descuenta con UPDATE ... WHERE version = <leída>. Si otra transacción
+    cambió el producto entre medio, el UPDATE no afecta filas y se lanza
+    _VersionCambiada para reintentar.
+    """
+    productos = Producto.objects.filter(pk__in=cantidades.keys()).only(
+        'id', 'nombre', 'stock_disponible', 'stock_fragmentado', 'version'
+    ).in_bulk()
+
+    for producto_id in sorted(cantidades):
+        producto = productos.get(producto_id)
+        if producto is None:
+            raise ValueError(f'Producto no encontrado (id {producto_id})')
+        if not producto.stock_fragmentado and producto.stock_disponible < cantidades[producto_id]:
+            raise StockInsuficiente(producto, producto.stock_disponible)
+
+    fragmentados = {producto_id for producto_id, producto in productos.items() if producto.stock_fragmentado}
+
+    for producto_id in sorted(cantidades):
+        producto = productos[producto_id]
+        if producto.stock_fragmentado:
+            if not _descontar_fragmentos(producto_id, cantidades[producto_id]):
+                _lanzar_stock_insuficiente(producto_id)
+        elif not Producto.objects.filter(
+            pk=producto_id,
+            version=producto.version,
+            stock_fragmentado=False
+        ).update(
+            stock_disponible=F('stock_disponible') - cantidades[producto_id],
+            version=F('version') + 1
+        ):
+            raise _VersionCambiada(producto_id)
+
+    _registrar_ventas(cantidades, fragmentados, pedido)
+
+
+def descontar_stock_optimista(cantidades, pedido=None):
+    """
+    Alternativa a descontar_stock sin SELECT ... FOR UPDATE (CHECKOUT_ESTRATEGIA
+    = 'optimista'). Cada intento corre en un savepoint; ante un conflicto de
+    versión se deshace y se reintenta con backoff exponencial y jitter, hasta
+    CHECKOUT_REINTENTOS veces. Lanza ConflictoStock si no lo logra.
+    """
+    if not cantidades:
+        return
+
+    reintentos = getattr(settings, 'CHECKOUT_REINTENTOS', 5)
+    espera_base = getattr(settings, 'CHECKOUT_BACKOFF_MS', 10) / 1000
+
+    for intento in range(reintentos + 1):
+        try:
+            with transaction.atomic():
+                _descontar_versionado(cantidades, pedido)
+            return
+        except _VersionCambiada as e:
+            logger.info(f"Conflicto de versión en producto #{e.args[0]} (intento {intento + 1})")
+            if intento < reintentos:
+                time.sleep(random.uniform(0, espera_base * 2 ** intento))
+
+    raise ConflictoStock('Hay mucha demanda de estos productos en este momento. Intenta nuevamente.')
+
+
+def _lanzar_stock_insuficiente(producto_id):
+    producto = Producto.objects.only('id', 'nombre').get(pk=producto_id)
+    raise StockInsuficiente(producto, max(stock_actual([producto_id]).get(producto_id, 0), 0))
+
+
+def confirmar_reservas(clave_carrito, cantidades, pedido=None):
+    """
+    Confirma las reservas del carrito al hacer checkout: descuenta el stock
+    con UPDATE condicionales (sin SELECT ... FOR UPDATE), registra las ventas
+    y elimina las reservas.
+    Si alguna reserva expiró, se intenta reservar de nuevo antes de descontar.
+    Debe llamarse dentro de una transacción.
+    """
+    reservadas = dict(
+        ReservaStock.objects.vigentes().filter(
+            clave_carrito=clave_carrito,
+            producto_id__in=cantidades.keys()
+        ).values_list('producto_id', 'cantidad')
+    )
+    faltantes = {
+        producto_id: cantidad
+        for producto_id, cantidad in cantidades.items()
+        if reservadas.get(producto_id, 0) < cantidad
+    }
+    if faltantes:
+        reservar_stock(clave_carrito, faltantes)
+
+    fragmentados = _productos_fragmentados(cantidades.keys())
+    descontados_de_fragmentos = set()
+    for producto_id in sorted(cantidades):
+        origen = _descontar_sin_bloqueo(producto_id, cantidades[producto_id], producto_id in fragmentados)
+        if origen is None:
+            _lanzar_stock_insuficiente(producto_id)
+        if origen == 'fragmentos':
+            descontados_de_fragmentos.add(producto_id)
+
+    _registrar_ventas(cantidades, descontados_de_fragmentos, pedido)
+    liberar_reservas(clave_carrito, cantidades.keys())
+
+
+def reponer_stock_pedidos(pedido_ids):
+    """
+    Devuelve al inventario el stock de pedidos cancelados. Agrega las
+    cantidades por producto y las repone con un único UPDATE (CASE con
+    F() + total por producto); en productos fragmentados suma a un fragmento.
+    Registra un movimiento 'cancelacion' por producto y pedido.
+    Debe llamarse dentro de la transacción que cancela los pedidos.
+    """
+    lineas = defaultdict(int)
+    for pedido_id, producto_id, cantidad in DetallePedido.objects.filter(
+        pedido_id__in=pedido_ids
+    ).values_list('pedido_id', 'producto_id', 'cantidad'):
+        lineas[(pedido_id, producto_id)] += cantidad
+    if not lineas:
+        return
+
+    totales = defaultdict(int)
+    for (_, producto_id), cantidad in lineas.items():
+        totales[producto_id] += cantidad
+
+    # Mismo orden de bloqueo que el checkout: por id, solo productos normales
+    normales = list(
+        Producto.objects.select_for_update()
+        .filter(pk__in=totales.keys(), stock_fragmentado=False)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+    if normales:
+        Producto.objects.filter(pk__in=normales).update(
+            stock_disponible=Case(
+                *[
+                    When(pk=producto_id, then=F('stock_disponible') + Value(totales[producto_id]))
+                    for producto_id in normales
+                ],
+                output_field=IntegerField()
+            ),
+            version=F('version') + 1
+        )
+
+    fragmentados = set(totales) - set(normales)
+    for producto_id in sorted(fragmentados):
+        fragmento = FragmentoStock.objects.filter(producto_id=producto_id).order_by('cantidad').first()
+        FragmentoStock.objects.filter(pk=fragmento.pk).update(cantidad=F('cantidad') + totales[producto_id])
+
+    MovimientoInventario.objects.bulk_create([
+        MovimientoInventario(
+            producto_id=producto_id,
+            tipo='cancelacion',
+            cantidad=cantidad,
+            pedido_id=pedido_id,
+            compactado=producto_id not in fragmentados
+        )
+        for (pedido_id, producto_id), cantidad in sorted(lineas.items())
+    ])
+
+
+# ===============================================
+# LIBRO DE MOVIMIENTOS Y CONTADORES FRAGMENTADOS
+# ===============================================
+
+def registrar_movimiento(producto, cantidad, tipo, pedido=None, nota=''):
+    """
+    Aplica un movimiento de stock (cantidad con signo) y lo registra en el
+    libro. Las salidas usan UPDATE condicionales, así el stock nunca queda
+    negativo. Lanza StockInsuficiente si no alcanza.
+    """
+    with transaction.atomic():
+        # Bloquear el producto fija su modo (normal o fragmentado) mientras dure el movimiento
+        fragmentado = Producto.objects.select_for_update().values_list(
+            'stock_fragmentado', flat=True
+        ).get(pk=producto.pk)
+
+        if cantidad < 0:
+            if fragmentado:
+                aplicado = _descontar_fragmentos(producto.pk, -cantidad)
+            else:
+                aplicado = _descontar_condicional(producto.pk, -cantidad)
+            if not aplicado:
+                _lanzar_stock_insuficiente(producto.pk)
+        elif fragmentado:
+            fragmento = FragmentoStock.objects.filter(producto=producto).order_by('cantidad').first()
+            FragmentoStock.objects.filter(pk=fragmento.pk).update(cantidad=F('cantidad') + cantidad)
+        else:
+            Producto.objects.filter(pk=producto.pk).update(
+                stock_disponible=F('stock_disponible') + cantidad,
+                version=F('version') + 1
+            )
+
+        return MovimientoInventario.objects.create(
+            producto=producto,
+            tipo=tipo,
+            cantidad=cantidad,
+            pedido=pedido,
+            nota=nota,
+            compactado=not fragmentado
+        )
+
+
+def _repartir(total, fragmentos):
+    base, resto = divmod(max(total, 0), fragmentos)
+    return [base + (1 if indice < resto else 0) for indice in range(fragmentos)]
+
+
+def activar_fragmentos(producto_id, fragmentos=None):
+    """Pasa un producto a contador fragmentado repartiendo su stock actual"""
+    fragmentos = fragmentos or getattr(settings, 'STOCK_FRAGMENTOS', 8)
+
+    with transaction.atomic():
+        producto = Producto.objects.select_for_update().get(pk=producto_id)
+        if producto.stock_fragmentado:
+            return False
+
+        FragmentoStock.objects.bulk_create([
+            FragmentoStock(producto=producto, indice=indice, cantidad=cantidad)
+            for indice, cantidad in enumerate(_repartir(producto.stock_disponible, fragmentos))
+        ])
+        Producto.objects.filter(pk=producto_id).update(stock_fragmentado=True, version=F('version') + 1)
+    return True
+
+
+def desactivar_fragmentos(producto_id):
+    """Vuelve al contador único: compacta los movimientos y elimina los fragmentos"""
+    with transaction.atomic():
+        producto = Producto.objects.select_for_update().get(pk=producto_id)
+        if not producto.stock_fragmentado:
+            return False
+
+        _compactar_producto(producto, rebalancear=False)
+        # Los fragmentos son la fuente de verdad mientras el producto está fragmentado
+        total = FragmentoStock.objects.filter(
+            producto_id=producto_id
+        ).aggregate(total=Sum('cantidad'))['total'] or 0
+        FragmentoStock.objects.filter(producto_id=producto_id).delete()
+        Producto.objects.filter(pk=producto_id).update(
+            stock_fragmentado=False,
+            stock_disponible=total,
+            version=F('version') + 1
+        )
+    return True
+
+
+def _compactar_producto(producto, rebalancear=True):
+    """
+    Pliega los movimientos pendientes de un producto (ya bloqueado) en
+    stock_disponible y, opcionalmente, reparte el stock parejo entre sus
+    fragmentos. Retorna la cantidad de movimientos compactados.
+    """
+    fragmentos = []
+    if producto.stock_fragmentado:
+        # Bloquear los fragmentos primero: así las ventas en curso terminan de
+        # escribir su movimiento antes de leer los pendientes
+        fragmentos = list(
+            FragmentoStock.objects.select_for_update()
+            .filter(producto_id=producto.pk)
+            .order_by('indice')
+        )
+
+    pendientes = list(
+        MovimientoInventario.objects.filter(producto_id=producto.pk, compactado=False)
+        .values_list('id', 'cantidad')
+    )
+    if pendientes:
+        MovimientoInventario.objects.filter(pk__in=[pk for pk, _ in pendientes]).update(compactado=True)
+        Producto.objects.filter(pk=producto.pk).update(
+            stock_disponible=F('stock_disponible') + sum(cantidad for _, cantidad in pendientes),
+            version=F('version') + 1
+        )
+
+    if fragmentos:
+        total = sum(fragmento.cantidad for fragmento in fragmentos)
+        stock = Producto.objects.values_list('stock_disponible', flat=True).get(pk=producto.pk)
+        if stock != total:
+            logger.warning(
+                f"Inventario descuadrado en producto #{producto.pk}: "
+                f"stock compactado {stock}, fragmentos {total}"
+            )
+        if rebalancear:
+            for fragmento, cantidad in zip(fragmentos, _repartir(total, len(fragmentos))):
+                fragmento.cantidad = cantidad
+            FragmentoStock.objects.bulk_update(fragmentos, ['cantidad'])
+
+    return len(pendientes)
+
+
+def compactar_inventario(rebalancear=True):
+    """
+    Compacta el libro de movimientos: por cada producto con movimientos
+    pendientes, los suma a stock_disponible en una transacción corta.
+    Retorna la cantidad de movimientos compactados.
+    """
+    producto_ids = set(
+        MovimientoInventario.objects.filter(compactado=False).values_list('producto_id', flat=True)
+    )
+    if rebalancear:
+        producto_ids |= set(
+            Producto.objects.filter(stock_fragmentado=True).values_list('id', flat=True)
+        )
+
+    compactados = 0
+    for producto_id in sorted(producto_ids):
+        with transaction.atomic():
+            producto = Producto.objects.select_for_update().only('id', 'stock_fragmentado').get(pk=producto_id)
+            compactados += _compactar_producto(producto, rebalancear=rebalancear)
+
+    if compactados:
+        logger.info(f"Movimientos de inventario compactados: {compactados}")
+    return compactados
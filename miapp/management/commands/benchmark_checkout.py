@@ -0,0 +1,332 @@
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import override_settings
+
+from miapp.inventario import activar_fragmentos, stock_actual
+from miapp.resumenes import recalcular_pedidos
+from miapp.models import (
+    Categoria, Producto, Pedido, DetallePedido, CorreoSaliente, ReservaStock, MovimientoInventario
+)
+
+
+DATOS_CHECKOUT = {
+    'nombre_cliente': 'Comprador Benchmark',
+    'correo_cliente': 'benchmark@example.com',
+    'telefono_cliente': '912345678',
+    'direccion': 'Calle Benchmark 123',
+    'region': 'Metropolitana',
+    'comuna': 'Santiago',
+}
+
+
+class MedidorSQL:
+    """
+    Envuelve la ejecución de SQL de un hilo para medir el tiempo de espera
+    por bloqueos (SELECT ... FOR UPDATE y UPDATE sobre productos) y contar
+    deadlocks, errores de bloqueo y conflictos de versión (checkout optimista).
+    """
+
+    def __init__(self):
+        self.espera_bloqueos = 0.0
+        self.deadlocks = 0
+        self.errores_bloqueo = 0
+        self.conflictos_version = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            resultado = execute(sql, params, many, context)
+            if 'PRODUCTOS' in sql.upper() and '"VERSION" = %S' in sql.upper() and context['cursor'].rowcount == 0:
+                self.conflictos_version += 1
+            return resultado
+        except Exception as e:
+            mensaje = str(e).lower()
+            if 'deadlock' in mensaje:
+                self.deadlocks += 1
+            elif 'locked' in mensaje or 'could not serialize' in mensaje:
+                self.errores_bloqueo += 1
+            raise
+        finally:
+            sql_normalizado = sql.upper()
+            if 'FOR UPDATE' in sql_normalizado or sql_normalizado.startswith('UPDATE "PRODUCTOS"'):
+                self.espera_bloqueos += time.perf_counter() - inicio
+
+
+def ejecutar_comprador(producto_ids, cantidad):
+    """
+    Simula un comprador: arma su carrito y hace checkout.
+    Retorna las métricas de esa sesión (solo se mide el checkout).
+    """
+    cliente = Client()
+    operaciones = [
+        {'accion': 'add', 'producto_id': producto_id, 'cantidad': cantidad}
+        for producto_id in producto_ids
+    ]
+    respuesta_carrito = cliente.patch(
+        '/api/cart/',
+        data=json.dumps({'operaciones': operaciones}),
+        content_type='application/json'
+    )
+    if respuesta_carrito.status_code != 200:
+        connection.close()
+        return {'estado': 'sin_stock_en_carrito', 'latencia': None, 'espera_bloqueos': 0.0,
+                'deadlocks': 0, 'errores_bloqueo': 0, 'conflictos_version': 0}
+
+    medidor = MedidorSQL()
+    inicio = time.perf_counter()
+    with connection.execute_wrapper(medidor):
+        respuesta = cliente.post(
+            '/api/checkout/',
+            data=json.dumps(DATOS_CHECKOUT),
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=str(uuid.uuid4())
+        )
+    latencia = time.perf_counter() - inicio
+
+    if respuesta.status_code == 201:
+        estado = 'exitoso'
+    elif respuesta.status_code == 400:
+        estado = 'rechazado'
+    elif respuesta.status_code == 409:
+        estado = 'conflicto'
+    else:
+        estado = 'error'
+
+    # Cada hilo abre su propia conexión; cerrarla para no agotar el pool
+    connection.close()
+    return {
+        'estado': estado,
+        'latencia': latencia,
+        'espera_bloqueos': medidor.espera_bloqueos,
+        'deadlocks': medidor.deadlocks,
+        'errores_bloqueo': medidor.errores_bloqueo,
+        'conflictos_version': medidor.conflictos_version,
+    }
+
+
+def inicializar_proceso():
+    # Las conexiones heredadas del proceso padre no se pueden compartir
+    connections.close_all()
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de contención del checkout: crea productos de prueba, ejecuta N '
+        'sesiones de compra concurrentes y reporta throughput, latencias, espera por '
+        'bloqueos, deadlocks y sobreventa en JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compradores', type=int, default=100, help='Sesiones de checkout a ejecutar.')
+        parser.add_argument('--concurrencia', type=int, default=8, help='Sesiones simultáneas.')
+        parser.add_argument('--modo', choices=['hilos', 'procesos'], default='hilos')
+        parser.add_argument('--productos', type=int, default=3, help='Productos a crear.')
+        parser.add_argument('--stock', type=int, default=50, help='Stock inicial de cada producto.')
+        parser.add_argument('--cantidad', type=int, default=1, help='Unidades por producto en cada carrito.')
+        parser.add_argument('--lineas', type=int, default=1, help='Productos distintos por carrito.')
+        parser.add_argument(
+            '--escenario',
+            choices=['caliente', 'uniforme'],
+            default='caliente',
+            help='caliente: todos compran los mismos productos; uniforme: productos al azar.'
+        )
+        parser.add_argument(
+            '--estrategia',
+            choices=['pesimista', 'optimista'],
+            help='Estrategia del checkout (por defecto, la de CHECKOUT_ESTRATEGIA).'
+        )
+        parser.add_argument(
+            '--fragmentos',
+            type=int,
+            default=0,
+            help='Si es mayor que 0, los productos usan contador fragmentado con esa cantidad de fragmentos.'
+        )
+        parser.add_argument('--etiqueta', default='', help='Nombre de la corrida (para comparar resultados).')
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON (además de stdout).')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--conservar', action='store_true', help='No eliminar los datos generados.')
+        parser.add_argument('--forzar', action='store_true', help='Permite ejecutar con DEBUG=False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forzar']:
+            raise CommandError(
+                'El benchmark crea y elimina pedidos en la base configurada. '
+                'Úsalo contra una base local o agrega --forzar.'
+            )
+        if options['lineas'] > options['productos']:
+            raise CommandError('--lineas no puede ser mayor que --productos.')
+
+        random.seed(options['semilla'])
+        categoria, productos = self.crear_datos(options)
+        producto_ids = [producto.id for producto in productos]
+        pedidos_previos = set(Pedido.objects.values_list('id', flat=True))
+
+        carritos = [self.elegir_productos(producto_ids, options) for _ in range(options['compradores'])]
+
+        try:
+            resultados, duracion = self.ejecutar(carritos, options)
+            reporte = self.construir_reporte(
+                resultados, duracion, productos, pedidos_previos, options
+            )
+        finally:
+            if not options['conservar']:
+                self.limpiar(categoria, productos, pedidos_previos)
+
+        salida = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(salida)
+        self.stdout.write(salida)
+
+    def crear_datos(self, options):
+        sufijo = uuid.uuid4().hex[:8]
+        categoria = Categoria.objects.create(
+            nombre=f'Benchmark {sufijo}',
+            descripcion='Categoría temporal del benchmark de checkout'
+        )
+        productos = [
+            Producto.objects.create(
+                nombre=f'Benchmark {sufijo} #{i + 1}',
+                descripcion='Producto temporal del benchmark de checkout',
+                precio_unitario=1000,
+                stock_disponible=options['stock'],
+                categoria=categoria
+            )
+            for i in range(options['productos'])
+        ]
+        if options['fragmentos']:
+            for producto in productos:
+                activar_fragmentos(producto.id, options['fragmentos'])
+        return categoria, productos
+
+    def elegir_productos(self, producto_ids, options):
+        if options['escenario'] == 'caliente':
+            return producto_ids[:options['lineas']]
+        return random.sample(producto_ids, options['lineas'])
+
+    def ejecutar(self, carritos, options):
+        executor_clase = ThreadPoolExecutor if options['modo'] == 'hilos' else ProcessPoolExecutor
+        executor_kwargs = {'max_workers': options['concurrencia']}
+        if options['modo'] == 'procesos':
+            executor_kwargs['initializer'] = inicializar_proceso
+            connections.close_all()
+
+        hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+        estrategia = options['estrategia'] or settings.CHECKOUT_ESTRATEGIA
+        with override_settings(ALLOWED_HOSTS=hosts, CHECKOUT_ESTRATEGIA=estrategia):
+            inicio = time.perf_counter()
+            with executor_clase(**executor_kwargs) as executor:
+                futuros = [
+                    executor.submit(ejecutar_comprador, carrito, options['cantidad'])
+                    for carrito in carritos
+                ]
+                resultados = [futuro.result() for futuro in futuros]
+            duracion = time.perf_counter() - inicio
+
+        return resultados, duracion
+
+    def construir_reporte(self, resultados, duracion, productos, pedidos_previos, options):
+        latencias = [r['latencia'] for r in resultados if r['latencia'] is not None]
+        latencias_exitosas = [r['latencia'] for r in resultados if r['estado'] == 'exitoso']
+        conteo = {}
+        for resultado in resultados:
+            conteo[resultado['estado']] = conteo.get(resultado['estado'], 0) + 1
+
+        # Sobreventa: unidades vendidas por sobre el stock inicial
+        vendidos = dict(
+            DetallePedido.objects.filter(producto__in=productos)
+            .exclude(pedido_id__in=pedidos_previos)
+            .values('producto_id')
+            .annotate(total=Sum('cantidad'))
+            .values_list('producto_id', 'total')
+        )
+        stock_final = stock_actual([p.id for p in productos])
+        sobreventa = sum(max(0, vendidos.get(p.id, 0) - options['stock']) for p in productos)
+        inconsistencias = sum(
+            1 for p in productos if options['stock'] - vendidos.get(p.id, 0) != stock_final[p.id]
+        )
+        exitosos = conteo.get('exitoso', 0)
+
+        def en_ms(valor):
+            return round(valor * 1000, 3) if valor is not None else None
+
+        return {
+            'etiqueta': options['etiqueta'],
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'configuracion': {
+                'base_de_datos': connection.vendor,
+                'modo': options['modo'],
+                'compradores': options['compradores'],
+                'concurrencia': options['concurrencia'],
+                'productos': options['productos'],
+                'stock_inicial': options['stock'],
+                'cantidad_por_linea': options['cantidad'],
+                'lineas_por_carrito': options['lineas'],
+                'escenario': options['escenario'],
+                'estrategia': options['estrategia'] or settings.CHECKOUT_ESTRATEGIA,
+                'reservas_stock': getattr(settings, 'RESERVAS_STOCK_ACTIVAS', False),
+                'fragmentos': options['fragmentos'],
+            },
+            'resultados': {
+                'duracion_s': round(duracion, 3),
+                'checkouts_exitosos': exitosos,
+                'checkouts_rechazados': conteo.get('rechazado', 0),
+                'checkouts_con_conflicto': conteo.get('conflicto', 0),
+                'checkouts_con_error': conteo.get('error', 0),
+                'sin_stock_en_carrito': conteo.get('sin_stock_en_carrito', 0),
+                'throughput_por_s': round(exitosos / duracion, 3) if duracion else None,
+                'latencia_ms': {
+                    'p50': en_ms(percentil(latencias, 50)),
+                    'p95': en_ms(percentil(latencias, 95)),
+                    'p99': en_ms(percentil(latencias, 99)),
+                    'max': en_ms(max(latencias) if latencias else None),
+                },
+                'latencia_exitosos_ms': {
+                    'p50': en_ms(percentil(latencias_exitosas, 50)),
+                    'p95': en_ms(percentil(latencias_exitosas, 95)),
+                    'p99': en_ms(percentil(latencias_exitosas, 99)),
+                },
+                'espera_bloqueos_ms': {
+                    'total': en_ms(sum(r['espera_bloqueos'] for r in resultados)),
+                    'p95_por_checkout': en_ms(percentil([r['espera_bloqueos'] for r in resultados], 95)),
+                },
+                'deadlocks': sum(r['deadlocks'] for r in resultados),
+                'errores_bloqueo': sum(r['errores_bloqueo'] for r in resultados),
+                'conflictos_version': sum(r['conflictos_version'] for r in resultados),
+                'sobreventa_unidades': sobreventa,
+                'productos_stock_negativo': sum(1 for stock in stock_final.values() if stock < 0),
+                'productos_stock_inconsistente': inconsistencias,
+            },
+        }
+
+    def limpiar(self, categoria, productos, pedidos_previos):
+        pedidos = Pedido.objects.filter(detalles__producto__in=productos).exclude(
+            pk__in=pedidos_previos
+        ).distinct()
+        pedido_ids = list(pedidos.values_list('pk', flat=True))
+        CorreoSaliente.objects.filter(pedido__in=pedido_ids).delete()
+        # Restar los pedidos del benchmark de los resúmenes del dashboard al borrarlos
+        with recalcular_pedidos(pedido_ids):
+            Pedido.objects.filter(pk__in=pedido_ids).delete()
+        ReservaStock.objects.filter(producto__in=productos).delete()
+        MovimientoInventario.objects.filter(producto__in=productos).delete()
+        Producto.objects.filter(pk__in=[p.id for p in productos]).delete()
+        categoria.delete()
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from miapp.analitica import calcular_analitica_clientes
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la analítica de clientes del dashboard (puntajes RFM, cohortes '
+        'mensuales y recompra). Pensado para ejecutarse una vez al día.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Considera solo pedidos desde este día (AAAA-MM-DD). Por defecto, todo el historial.')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = parse_date(options['desde'])
+            except ValueError:
+                desde = None
+            if desde is None:
+                raise CommandError(f'Fecha no válida en --desde: {options["desde"]}')
+
+        inicio = time.monotonic()
+        clientes, cohortes = calcular_analitica_clientes(desde=desde)
+        self.stdout.write(
+            f'{clientes} cliente(s) con RFM y {cohortes} fila(s) de cohortes '
+            f'en {time.monotonic() - inicio:.1f} s.'
+        )
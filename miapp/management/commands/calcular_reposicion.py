@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp.reposicion import DIAS_HISTORIA, calcular_reposicion
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula la velocidad de venta y el punto de reorden de los productos '
+        'activos. Pensado para ejecutarse una vez al día.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=DIAS_HISTORIA,
+            help=f'Días de historia de ventas a considerar (por defecto {DIAS_HISTORIA}).'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor a 0')
+        total = calcular_reposicion(dias=options['dias'])
+        self.stdout.write(f'{total} producto(s) con sugerencia de reposición.')
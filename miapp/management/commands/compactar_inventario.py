@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from miapp.inventario import activar_fragmentos, compactar_inventario, desactivar_fragmentos
+
+
+class Command(BaseCommand):
+    help = (
+        'Compacta el libro de movimientos de inventario en stock_disponible y '
+        'reparte el stock de los productos fragmentados entre sus fragmentos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Segundos entre compactaciones. Si es 0, se ejecuta una sola vez.'
+        )
+        parser.add_argument(
+            '--sin-rebalancear',
+            action='store_true',
+            help='Solo pliega los movimientos, sin repartir de nuevo los fragmentos.'
+        )
+        parser.add_argument(
+            '--fragmentar',
+            type=int,
+            nargs='+',
+            metavar='PRODUCTO_ID',
+            help='Pasa los productos indicados a contador fragmentado y termina.'
+        )
+        parser.add_argument(
+            '--fragmentos',
+            type=int,
+            help='Cantidad de fragmentos al usar --fragmentar (por defecto STOCK_FRAGMENTOS).'
+        )
+        parser.add_argument(
+            '--desfragmentar',
+            type=int,
+            nargs='+',
+            metavar='PRODUCTO_ID',
+            help='Vuelve los productos indicados a contador único y termina.'
+        )
+
+    def handle(self, *args, **options):
+        if options['fragmentar'] or options['desfragmentar']:
+            for producto_id in options['fragmentar'] or []:
+                activar_fragmentos(producto_id, options['fragmentos'])
+                self.stdout.write(f'Producto #{producto_id}: contador fragmentado.')
+            for producto_id in options['desfragmentar'] or []:
+                desactivar_fragmentos(producto_id)
+                self.stdout.write(f'Producto #{producto_id}: contador único.')
+            return
+
+        intervalo = options['intervalo']
+
+        while True:
+            compactados = compactar_inventario(rebalancear=not options['sin_rebalancear'])
+            if compactados or not intervalo:
+                self.stdout.write(f'{compactados} movimiento(s) compactado(s).')
+
+            if not intervalo:
+                break
+            time.sleep(intervalo)
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from miapp.correos import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la bandeja de salida (con reintentos y backoff)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=50,
+            help='Cantidad máxima de correos por lote.'
+        )
+        parser.add_argument(
+            '--concurrencia',
+            type=int,
+            default=4,
+            help='Cantidad de envíos simultáneos al proveedor.'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=0,
+            help='Segundos de espera cuando no hay correos. Si es 0, procesa un lote y termina.'
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+
+        while True:
+            enviados, fallidos = procesar_pendientes(
+                limite=options['lote'],
+                concurrencia=options['concurrencia']
+            )
+            if enviados or fallidos or not intervalo:
+                self.stdout.write(f'{enviados} correo(s) enviado(s), {fallidos} con error.')
+
+            if not intervalo:
+                break
+            # Si el lote vino lleno probablemente quedan más: seguir sin esperar
+            if enviados + fallidos < options['lote']:
+                time.sleep(intervalo)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp.exportacion import FORMATOS, ParametrosInvalidos, filas_ventas, generar_csv
+
+
+class Command(BaseCommand):
+    help = 'Exporta las líneas de venta a CSV en streaming (memoria constante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial AAAA-MM-DD (inclusiva)')
+        parser.add_argument('--hasta', help='Fecha final AAAA-MM-DD (inclusiva)')
+        parser.add_argument(
+            '--estado',
+            action='append',
+            default=[],
+            help='Estado del pedido a incluir (repetible). Por defecto, todos.'
+        )
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--salida', help='Archivo de destino. Por defecto, la salida estándar.')
+        parser.add_argument('--lote', type=int, default=2000, help='Filas leídas por viaje a la base')
+
+    def handle(self, *args, **options):
+        try:
+            lineas = generar_csv(
+                filas_ventas(options['desde'], options['hasta'], options['estado'], lote=options['lote']),
+                formato=options['formato']
+            )
+        except ParametrosInvalidos as e:
+            raise CommandError(str(e))
+
+        if not options['salida']:
+            for linea in lineas:
+                self.stdout.write(linea, ending='')
+            return
+
+        with open(options['salida'], 'w', encoding='utf-8', newline='') as archivo:
+            archivo.writelines(lineas)
+        self.stderr.write(f"Ventas exportadas a {options['salida']}.")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from miapp.inventario import liberar_reservas_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Libera en bloque las reservas de stock vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=0,
+            help='Segundos entre barridos. Si es 0, se ejecuta una sola vez.'
+        )
+
+    def handle(self, *args, **options):
+        intervalo = options['intervalo']
+
+        while True:
+            eliminadas = liberar_reservas_vencidas()
+            self.stdout.write(f'{eliminadas} reserva(s) vencida(s) liberada(s).')
+
+            if not intervalo:
+                break
+            time.sleep(intervalo)
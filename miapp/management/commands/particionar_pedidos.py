@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from miapp.particiones import (
+    ParticionesNoSoportadas,
+    archivar_particiones,
+    convertir_a_particionadas,
+    crear_particiones_futuras,
+    estado_particiones,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Particionamiento mensual (PostgreSQL) de pedidos y detalle_pedidos. '
+        '"convertir" migra las tablas una sola vez; "crear" y "archivar" deben '
+        'programarse mensualmente (p. ej. con un scheduler).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'accion',
+            choices=['convertir', 'crear', 'archivar', 'estado'],
+            help='convertir: tablas comunes -> particionadas; crear: particiones futuras; '
+                 'archivar: mueve particiones antiguas al esquema de archivo; estado: lista particiones.'
+        )
+        parser.add_argument(
+            '--meses-adelante',
+            type=int,
+            help='Meses futuros con partición creada (por defecto PARTICIONES_MESES_ADELANTE).'
+        )
+        parser.add_argument(
+            '--retencion-meses',
+            type=int,
+            help='Meses que se mantienen en las tablas activas (por defecto PARTICIONES_RETENCION_MESES).'
+        )
+        parser.add_argument(
+            '--esquema',
+            help='Esquema de archivo (por defecto PARTICIONES_ESQUEMA_ARCHIVO).'
+        )
+
+    def handle(self, *args, **options):
+        accion = options['accion']
+
+        try:
+            if accion == 'convertir':
+                convertidas = convertir_a_particionadas(options['meses_adelante'])
+                if convertidas:
+                    self.stdout.write(self.style.SUCCESS(f'Tablas particionadas: {", ".join(convertidas)}'))
+                else:
+                    self.stdout.write('Las tablas ya estaban particionadas.')
+
+            elif accion == 'crear':
+                creadas = crear_particiones_futuras(options['meses_adelante'])
+                self.stdout.write(f'{len(creadas)} partición(es) creada(s). {" ".join(creadas)}')
+
+            elif accion == 'archivar':
+                archivadas = archivar_particiones(options['retencion_meses'], options['esquema'])
+                self.stdout.write(f'{len(archivadas)} partición(es) archivada(s). {" ".join(archivadas)}')
+
+            else:
+                estado = estado_particiones()
+                if not estado:
+                    self.stdout.write('Las tablas no están particionadas.')
+                for tabla, particiones in estado.items():
+                    self.stdout.write(tabla)
+                    for nombre, mes, filas in particiones:
+                        self.stdout.write(f'  {nombre:<32} {mes or "default"!s:<12} ~{filas} filas')
+
+        except ParticionesNoSoportadas as e:
+            raise CommandError(str(e))
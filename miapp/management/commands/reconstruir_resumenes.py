@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from miapp.resumenes import reconstruir_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los resúmenes diarios de ventas del dashboard desde los pedidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día a recalcular (AAAA-MM-DD). Por defecto, desde el inicio.')
+        parser.add_argument('--hasta', help='Último día a recalcular (AAAA-MM-DD). Por defecto, hasta hoy.')
+
+    def handle(self, *args, **options):
+        fechas = {}
+        for opcion in ('desde', 'hasta'):
+            if options[opcion]:
+                try:
+                    fechas[opcion] = parse_date(options[opcion])
+                except ValueError:
+                    fechas[opcion] = None
+                if fechas[opcion] is None:
+                    raise CommandError(f'Fecha no válida en --{opcion}: {options[opcion]}')
+
+        dias, productos = reconstruir_resumenes(**fechas)
+        self.stdout.write(f'{dias} resumen(es) diario(s) y {productos} resumen(es) por producto reconstruido(s).')
@@ -0,0 +1,222 @@
+# miapp/metricas.py
+"""
+Métricas del dashboard de administración, una por panel.
+
+Cada métrica se calcula desde los resúmenes diarios (miapp/resumenes.py) para
+un rango de días y se cachea con su propio TTL: el dashboard carga la página
+de inmediato y pide cada panel en paralelo a /admin/dashboard/datos/<métrica>/.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import (
+    Cliente, ClienteRFM, CohorteMensual, Pedido, Producto, VentaDiaria, VentaDiariaProducto
+)
+from .particiones import inicio_mes, sumar_meses
+from .resumenes import ESTADOS_VENDIDOS
+
+# Rango por defecto y máximo (en días) que acepta un panel
+DIAS_POR_DEFECTO = 30
+DIAS_MAXIMOS = 366
+
+COLORES_ESTADOS = {
+    'pendiente_pago': '#ffc107',
+    'pagado': '#28a745',
+    'preparando': '#17a2b8',
+    'enviado': '#007bff',
+    'completado': '#6c757d',
+    'cancelado': '#dc3545',
+}
+
+
+class RangoInvalido(ValueError):
+    """Fechas mal escritas, invertidas o rango demasiado largo"""
+
+
+def rango_dias(desde=None, hasta=None):
+    """Convierte 'AAAA-MM-DD' en (desde, hasta) inclusivos; por defecto los últimos 30 días"""
+    try:
+        hasta = parse_date(hasta) if hasta else timezone.localdate()
+        desde = parse_date(desde) if desde else hasta - timedelta(days=DIAS_POR_DEFECTO)
+    except ValueError:
+        desde = hasta = None
+    if desde is None or hasta is None:
+        raise RangoInvalido('Fecha no válida (formato AAAA-MM-DD)')
+    if desde > hasta:
+        raise RangoInvalido('"desde" es posterior a "hasta"')
+    if (hasta - desde).days > DIAS_MAXIMOS:
+        raise RangoInvalido(f'El rango no puede superar {DIAS_MAXIMOS} días')
+    return desde, hasta
+
+
+def _vendidos(modelo, desde, hasta):
+    return modelo.objects.filter(estado_pedido__in=ESTADOS_VENDIDOS, dia__gte=desde, dia__lte=hasta)
+
+
+# ===== MÉTRICAS =====
+
+def indicadores(desde, hasta):
+    """Tarjetas superiores: ventas y pedidos del rango, pendientes, productos y clientes"""
+    totales = VentaDiaria.objects.filter(dia__gte=desde, dia__lte=hasta).aggregate(
+        ventas=Sum('monto', filter=Q(estado_pedido__in=ESTADOS_VENDIDOS)),
+        pedidos=Sum('pedidos'),
+    )
+    return {
+        'ventas': float(totales['ventas'] or 0),
+        'pedidos': totales['pedidos'] or 0,
+        'pedidos_pendientes': Pedido.objects.filter(estado_pedido='pendiente_pago').count(),
+        'total_productos': Producto.objects.filter(activo=True).count(),
+        'total_clientes': Cliente.objects.filter(is_active=True).count(),
+    }
+
+
+def serie_ventas(desde, hasta):
+    """Ventas por día en una consulta agrupada; los días sin ventas van en 0"""
+    por_dia = dict(
+        _vendidos(VentaDiaria, desde, hasta)
+        .values('dia').annotate(total=Sum('monto')).order_by()
+        .values_list('dia', 'total')
+    )
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    return {
+        'labels': [dia.strftime('%d/%m') for dia in dias],
+        'data': [float(por_dia.get(dia, 0)) for dia in dias],
+    }
+
+
+def pedidos_por_estado(desde, hasta):
+    filas = (
+        VentaDiaria.objects.filter(dia__gte=desde, dia__lte=hasta)
+        .values('estado_pedido').annotate(total=Sum('pedidos'))
+        .filter(total__gt=0).order_by('-total')
+    )
+    nombres = dict(Pedido.ESTADOS)
+    return {
+        'labels': [nombres.get(fila['estado_pedido'], fila['estado_pedido']) for fila in filas],
+        'data': [fila['total'] for fila in filas],
+        'background': [COLORES_ESTADOS.get(fila['estado_pedido'], '#6c757d') for fila in filas],
+    }
+
+
+def ventas_por_categoria(desde, hasta):
+    filas = (
+        _vendidos(VentaDiariaProducto, desde, hasta)
+        .values('categoria__nombre').annotate(total_vendido=Sum('unidades'))
+        .order_by('-total_vendido')[:5]
+    )
+    return {
+        'labels': [fila['categoria__nombre'] or 'Sin categoría' for fila in filas],
+        'data': [fila['total_vendido'] for fila in filas],
+    }
+
+
+def top_productos(desde, hasta):
+    filas = (
+        _vendidos(VentaDiariaProducto, desde, hasta)
+        .values('producto__nombre').annotate(total_vendido=Sum('unidades'))
+        .order_by('-total_vendido')[:5]
+    )
+    return {
+        'productos': [
+            {'nombre': fila['producto__nombre'], 'total_vendido': fila['total_vendido']} for fila in filas
+        ]
+    }
+
+
+def comparacion_semanal(desde, hasta):
+    """Últimos 7 días hasta `hasta` contra los 7 anteriores (ignora `desde`)"""
+    inicio_semana = hasta - timedelta(days=6)
+    inicio_anterior = inicio_semana - timedelta(days=7)
+    totales = _vendidos(VentaDiaria, inicio_anterior, hasta).aggregate(
+        semana=Sum('monto', filter=Q(dia__gte=inicio_semana)),
+        anterior=Sum('monto', filter=Q(dia__lt=inicio_semana)),
+    )
+    semana = float(totales['semana'] or 0)
+    anterior = float(totales['anterior'] or 0)
+    if anterior > 0:
+        cambio = (semana - anterior) / anterior * 100
+    else:
+        cambio = 100 if semana > 0 else 0
+    return {
+        'ventas_semana': semana,
+        'ventas_semana_anterior': anterior,
+        'cambio_porcentaje': round(cambio, 1),
+    }
+
+
+def segmentos_clientes(desde, hasta):
+    """Clientes por segmento RFM y tasa de recompra (ignora el rango: es el último cálculo)"""
+    filas = ClienteRFM.objects.values('segmento').annotate(total=Count('pk')).order_by('-total')
+    totales = ClienteRFM.objects.aggregate(clientes=Count('pk'), recurrentes=Count('pk', filter=Q(frecuencia__gte=2)))
+    nombres = dict(ClienteRFM.SEGMENTOS)
+    return {
+        'labels': [nombres.get(fila['segmento'], fila['segmento']) for fila in filas],
+        'data': [fila['total'] for fila in filas],
+        'tasa_recompra': round(totales['recurrentes'] / totales['clientes'] * 100, 1) if totales['clientes'] else 0,
+    }
+
+
+def cohortes_clientes(desde, hasta, meses=12):
+    """
+    Retención de las últimas `meses` cohortes hasta `hasta`: porcentaje de la
+    cohorte que compró en cada mes siguiente, y su tasa de recompra.
+    """
+    inicio = sumar_meses(inicio_mes(hasta), 1 - meses)
+    filas = CohorteMensual.objects.filter(cohorte__gte=inicio, cohorte__lte=hasta)
+    recurrentes = dict(
+        ClienteRFM.objects.filter(primera_compra__gte=inicio, primera_compra__lte=hasta, frecuencia__gte=2)
+        .annotate(cohorte=TruncMonth('primera_compra')).values('cohorte')
+        .annotate(total=Count('pk')).order_by().values_list('cohorte', 'total')
+    )
+
+    cohortes = {}
+    for fila in filas:
+        cohortes.setdefault(fila.cohorte, {})[fila.mes] = fila.clientes
+    resultado = []
+    for cohorte, por_mes in sorted(cohortes.items()):
+        tamano = por_mes.get(0, 0)
+        if not tamano:
+            continue
+        ultimo_mes = max(por_mes)
+        resultado.append({
+            'cohorte': cohorte.strftime('%Y-%m'),
+            'clientes': tamano,
+            'retencion': [round(por_mes.get(mes, 0) / tamano * 100, 1) for mes in range(ultimo_mes + 1)],
+            'tasa_recompra': round(recurrentes.get(cohorte, 0) / tamano * 100, 1),
+        })
+    return {'cohortes': resultado}
+
+
+# nombre en la URL: (función, TTL por defecto en segundos)
+METRICAS = {
+    'indicadores': (indicadores, 60),
+    'ventas': (serie_ventas, 300),
+    'estados': (pedidos_por_estado, 120),
+    'categorias': (ventas_por_categoria, 600),
+    'productos': (top_productos, 600),
+    'semanal': (comparacion_semanal, 300),
+    # Se recalculan una vez al día (calcular_analitica_clientes)
+    'segmentos': (segmentos_clientes, 3600),
+    'cohortes': (cohortes_clientes, 3600),
+}
+
+
+def obtener_metrica(nombre, desde, hasta):
+    """
+    Datos de la métrica, cacheados por rango. El TTL se puede ajustar por
+    métrica con el setting DASHBOARD_TTL_SEGUNDOS = {'ventas': 60, ...}.
+    """
+    funcion, ttl = METRICAS[nombre]
+    ttl = getattr(settings, 'DASHBOARD_TTL_SEGUNDOS', {}).get(nombre, ttl)
+    clave = f'dashboard:{nombre}:{desde.isoformat()}:{hasta.isoformat()}'
+    datos = cache.get(clave)
+    if datos is None:
+        datos = funcion(desde, hasta)
+        cache.set(clave, datos, ttl)
+    return datos
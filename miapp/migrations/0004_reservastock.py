@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0003_alter_producto_imagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave_carrito', models.CharField(db_index=True, help_text='Sesión y carrito dueños de la reserva', max_length=100, verbose_name='Clave del carrito')),
+                ('cantidad', models.PositiveIntegerField(verbose_name='Cantidad reservada')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('expira_en', models.DateTimeField(db_index=True, verbose_name='Expira en')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='miapp.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de stock',
+                'verbose_name_plural': 'Reservas de stock',
+                'db_table': 'reservas_stock',
+                'indexes': [models.Index(fields=['producto', 'expira_en'], name='reservas_st_product_896dbf_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'clave_carrito'), name='reserva_unica_por_carrito')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0005_correosaliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='Clave de idempotencia'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='hash_solicitud',
+            field=models.CharField(blank=True, help_text='SHA-256 de los datos del checkout asociados a la clave de idempotencia', max_length=64, verbose_name='Hash de la solicitud'),
+        ),
+        migrations.AddConstraint(
+            model_name='pedido',
+            constraint=models.UniqueConstraint(fields=('clave_idempotencia', 'fecha_pedido'), name='pedidos_clave_idempotencia_uniq'),
+        ),
+    ]
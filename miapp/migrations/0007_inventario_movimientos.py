@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0006_pedido_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock_fragmentado',
+            field=models.BooleanField(default=False, help_text='Productos muy vendidos: el stock vive en fragmentos y se compacta periódicamente', verbose_name='Contador fragmentado'),
+        ),
+        migrations.CreateModel(
+            name='FragmentoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.PositiveSmallIntegerField(verbose_name='Índice')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fragmentos', to='miapp.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Fragmento de stock',
+                'verbose_name_plural': 'Fragmentos de stock',
+                'db_table': 'fragmentos_stock',
+                'constraints': [models.UniqueConstraint(fields=('producto', 'indice'), name='fragmento_unico_por_producto'), models.CheckConstraint(condition=models.Q(('cantidad__gte', 0)), name='fragmento_cantidad_no_negativa')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('venta', 'Venta'), ('reposicion', 'Reposición'), ('cancelacion', 'Cancelación'), ('ajuste', 'Ajuste manual')], max_length=20, verbose_name='Tipo')),
+                ('cantidad', models.IntegerField(help_text='Positiva si entra stock, negativa si sale', verbose_name='Cantidad')),
+                ('nota', models.CharField(blank=True, max_length=255, verbose_name='Nota')),
+                ('compactado', models.BooleanField(default=False, help_text='Ya está reflejado en el stock disponible del producto', verbose_name='Compactado')),
+                ('fecha', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_inventario', to='miapp.pedido', verbose_name='Pedido')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='miapp.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de inventario',
+                'verbose_name_plural': 'Movimientos de inventario',
+                'db_table': 'movimientos_inventario',
+                'ordering': ['-fecha'],
+                'indexes': [models.Index(fields=['producto', '-fecha'], name='movimientos_product_247093_idx'), models.Index(condition=models.Q(('compactado', False)), fields=['producto'], name='movimientos_pendientes_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0007_inventario_movimientos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Se incrementa en cada cambio de stock (checkout optimista)', verbose_name='Versión'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:39
+
+from django.db import migrations, models
+
+
+def copiar_fecha_pedido(apps, schema_editor):
+    DetallePedido = apps.get_model('miapp', 'DetallePedido')
+    Pedido = apps.get_model('miapp', 'Pedido')
+    DetallePedido.objects.update(
+        fecha_pedido=models.Subquery(
+            Pedido.objects.filter(pk=models.OuterRef('pedido_id')).values('fecha_pedido')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0008_producto_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='fecha_pedido',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Fecha del pedido'),
+        ),
+        migrations.RunPython(copiar_fecha_pedido, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='detallepedido',
+            name='fecha_pedido',
+            field=models.DateTimeField(editable=False, help_text='Copia de pedido.fecha_pedido: permite filtrar por fecha sin join y particionar la tabla por mes', verbose_name='Fecha del pedido'),
+        ),
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(fields=['fecha_pedido'], name='detalle_ped_fecha_p_b3e84c_idx'),
+        ),
+    ]
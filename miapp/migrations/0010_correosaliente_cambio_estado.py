@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0009_detallepedido_fecha_pedido'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='correosaliente',
+            name='tipo',
+            field=models.CharField(choices=[('confirmacion_pedido', 'Confirmación de pedido'), ('admin_nuevo_pedido', 'Aviso de nuevo pedido'), ('cambio_estado', 'Cambio de estado del pedido'), ('password_reset', 'Restablecer contraseña')], max_length=50, verbose_name='Tipo'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:45
+
+from django.db import migrations, models
+
+# Columnas de búsqueda libre del admin. El índice es sobre UPPER(col::text)
+# porque así compila Django `icontains` en PostgreSQL.
+COLUMNAS_TRIGRAMA = [
+    ('pedidos', 'nombre_cliente'),
+    ('pedidos', 'correo_cliente'),
+    ('pedidos', 'telefono_cliente'),
+    ('clientes', 'nombre'),
+    ('clientes', 'correo'),
+    ('clientes', 'telefono'),
+]
+
+
+def crear_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for tabla, columna in COLUMNAS_TRIGRAMA:
+            # CONCURRENTLY no está permitido en tablas particionadas (particionar_pedidos)
+            cursor.execute(
+                'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+                [tabla]
+            )
+            concurrente = '' if cursor.fetchone()[0] else 'CONCURRENTLY '
+            cursor.execute(
+                f'CREATE INDEX {concurrente}IF NOT EXISTS "{tabla}_{columna}_trgm" '
+                f'ON "{tabla}" USING gin ((UPPER("{columna}"::text)) gin_trgm_ops)'
+            )
+
+
+def eliminar_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for tabla, columna in COLUMNAS_TRIGRAMA:
+            cursor.execute(f'DROP INDEX IF EXISTS "{tabla}_{columna}_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    # Los índices se crean sin bloquear escrituras (CREATE INDEX CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0010_correosaliente_cambio_estado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['numero_seguimiento'], name='pedidos_numero__167790_idx'),
+        ),
+        migrations.RunPython(crear_indices_trigrama, eliminar_indices_trigrama),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:48
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0011_busqueda_trigrama'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='token_seguimiento_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 del token del enlace de seguimiento enviado al cliente', db_index=True, max_length=64, null=True, verbose_name='Hash del token de seguimiento'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(django.db.models.functions.text.Lower('correo_cliente'), models.F('numero_seguimiento'), name='pedidos_correo_seguim_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def cargar_resumenes(apps, schema_editor):
+    """Carga inicial desde los pedidos existentes (luego: reconstruir_resumenes)"""
+    Pedido = apps.get_model('miapp', 'Pedido')
+    DetallePedido = apps.get_model('miapp', 'DetallePedido')
+    VentaDiaria = apps.get_model('miapp', 'VentaDiaria')
+    VentaDiariaProducto = apps.get_model('miapp', 'VentaDiariaProducto')
+
+    VentaDiaria.objects.bulk_create([
+        VentaDiaria(**fila)
+        for fila in Pedido.objects.annotate(dia=TruncDate('fecha_pedido'))
+        .values('dia', 'estado_pedido')
+        .annotate(pedidos=models.Count('id'), monto=models.Sum('total_pedido')).order_by()
+    ], batch_size=1000)
+
+    monto_linea = models.ExpressionWrapper(
+        models.F('cantidad') * models.F('precio_compra'), output_field=models.DecimalField()
+    )
+    VentaDiariaProducto.objects.bulk_create([
+        VentaDiariaProducto(
+            dia=fila['dia'],
+            estado_pedido=fila['pedido__estado_pedido'],
+            producto_id=fila['producto_id'],
+            categoria_id=fila['producto__categoria_id'],
+            unidades=fila['unidades'],
+            monto=fila['monto'],
+        )
+        for fila in DetallePedido.objects.annotate(dia=TruncDate('fecha_pedido'))
+        .values('dia', 'pedido__estado_pedido', 'producto_id', 'producto__categoria_id')
+        .annotate(unidades=models.Sum('cantidad'), monto=models.Sum(monto_linea)).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0012_pedido_seguimiento_invitados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Día')),
+                ('estado_pedido', models.CharField(choices=[('pendiente_pago', 'Pendiente de Pago'), ('pagado', 'Pagado'), ('preparando', 'Preparando Envío'), ('enviado', 'Enviado'), ('completado', 'Completado'), ('cancelado', 'Cancelado')], max_length=20, verbose_name='Estado')),
+                ('pedidos', models.IntegerField(default=0, verbose_name='Pedidos')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+            ],
+            options={
+                'verbose_name': 'Venta diaria',
+                'verbose_name_plural': 'Ventas diarias',
+                'db_table': 'ventas_diarias',
+                'ordering': ['-dia'],
+                'constraints': [models.UniqueConstraint(fields=('dia', 'estado_pedido'), name='venta_diaria_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VentaDiariaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Día')),
+                ('estado_pedido', models.CharField(choices=[('pendiente_pago', 'Pendiente de Pago'), ('pagado', 'Pagado'), ('preparando', 'Preparando Envío'), ('enviado', 'Enviado'), ('completado', 'Completado'), ('cancelado', 'Cancelado')], max_length=20, verbose_name='Estado')),
+                ('unidades', models.IntegerField(default=0, verbose_name='Unidades')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+                ('categoria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ventas_diarias', to='miapp.categoria', verbose_name='Categoría')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='miapp.producto', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Venta diaria por producto',
+                'verbose_name_plural': 'Ventas diarias por producto',
+                'db_table': 'ventas_diarias_producto',
+                'ordering': ['-dia'],
+                'indexes': [models.Index(fields=['dia', 'categoria'], name='ventas_diar_dia_452383_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dia', 'estado_pedido', 'producto'), name='venta_diaria_producto_unica')],
+            },
+        ),
+        migrations.RunPython(cargar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-19 09:10
+
+from django.db import migrations
+
+# Columnas de productos que busca el autocompletado del admin (detalles y ofertas).
+# Mismo formato que en 0011: UPPER(col::text), como compila `icontains`.
+COLUMNAS_TRIGRAMA = [
+    ('productos', 'nombre'),
+    ('productos', 'descripcion'),
+]
+
+
+def crear_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for tabla, columna in COLUMNAS_TRIGRAMA:
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{tabla}_{columna}_trgm" '
+                f'ON "{tabla}" USING gin ((UPPER("{columna}"::text)) gin_trgm_ops)'
+            )
+
+
+def eliminar_indices_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for tabla, columna in COLUMNAS_TRIGRAMA:
+            cursor.execute(f'DROP INDEX IF EXISTS "{tabla}_{columna}_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('miapp', '0013_ventas_diarias'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices_trigrama, eliminar_indices_trigrama),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0014_busqueda_trigrama_productos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClienteRFM',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rfm', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Cliente')),
+                ('primera_compra', models.DateField(verbose_name='Primera compra')),
+                ('ultima_compra', models.DateField(verbose_name='Última compra')),
+                ('recencia_dias', models.IntegerField(verbose_name='Días desde la última compra')),
+                ('frecuencia', models.IntegerField(verbose_name='Pedidos')),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Monto total')),
+                ('puntaje_r', models.PositiveSmallIntegerField(verbose_name='R')),
+                ('puntaje_f', models.PositiveSmallIntegerField(verbose_name='F')),
+                ('puntaje_m', models.PositiveSmallIntegerField(verbose_name='M')),
+                ('segmento', models.CharField(choices=[('campeones', 'Campeones'), ('leales', 'Leales'), ('nuevos', 'Nuevos'), ('potenciales', 'Potenciales'), ('en_riesgo', 'En riesgo'), ('perdidos', 'Perdidos')], db_index=True, max_length=20, verbose_name='Segmento')),
+                ('fecha_calculo', models.DateTimeField(verbose_name='Calculado el')),
+            ],
+            options={
+                'verbose_name': 'RFM de cliente',
+                'verbose_name_plural': 'RFM de clientes',
+                'db_table': 'clientes_rfm',
+            },
+        ),
+        migrations.CreateModel(
+            name='CohorteMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohorte', models.DateField(verbose_name='Cohorte (primer día del mes)')),
+                ('mes', models.PositiveSmallIntegerField(verbose_name='Meses desde la primera compra')),
+                ('clientes', models.IntegerField(default=0, verbose_name='Clientes activos')),
+                ('pedidos', models.IntegerField(default=0, verbose_name='Pedidos')),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto')),
+            ],
+            options={
+                'verbose_name': 'Cohorte mensual',
+                'verbose_name_plural': 'Cohortes mensuales',
+                'db_table': 'cohortes_mensuales',
+                'ordering': ['cohorte', 'mes'],
+                'constraints': [models.UniqueConstraint(fields=('cohorte', 'mes'), name='cohorte_mes_unica')],
+            },
+        ),
+    ]
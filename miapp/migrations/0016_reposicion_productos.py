@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0015_analitica_clientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReposicionProducto',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reposicion', serialize=False, to='miapp.producto', verbose_name='Producto')),
+                ('velocidad_diaria', models.FloatField(default=0, verbose_name='Unidades por día')),
+                ('desviacion_diaria', models.FloatField(default=0, verbose_name='Desviación diaria')),
+                ('punto_reorden', models.IntegerField(default=0, verbose_name='Punto de reorden')),
+                ('dias_historia', models.PositiveSmallIntegerField(verbose_name='Días de historia')),
+                ('fecha_calculo', models.DateTimeField(verbose_name='Calculado el')),
+            ],
+            options={
+                'verbose_name': 'Reposición de producto',
+                'verbose_name_plural': 'Reposición de productos',
+                'db_table': 'reposicion_productos',
+            },
+        ),
+    ]
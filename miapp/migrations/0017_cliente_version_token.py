@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miapp', '0016_reposicion_productos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='version_token',
+            field=models.PositiveIntegerField(default=0, verbose_name='Versión de tokens'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Lower
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.exceptions import ValidationError
@@ -46,6 +47,8 @@ class Cliente(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True, verbose_name="Activo")
     is_staff = models.BooleanField(default=False, verbose_name="Es staff")
     is_superuser = models.BooleanField(default=False, verbose_name="Es superusuario")
+    # Va en los JWT emitidos: al incrementarla se revocan todos (ver miapp/autenticacion.py)
+    version_token = models.PositiveIntegerField(default=0, verbose_name="Versión de tokens")
 
     @property
     def email(self):
@@ -67,6 +70,17 @@ class Cliente(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return f"{self.nombre} ({self.correo})"
 
+    def set_password(self, raw_password):
+        # Cambiar la contraseña revoca los tokens JWT emitidos (al guardar)
+        super().set_password(raw_password)
+        self.version_token += 1
+
+    def invalidar_tokens(self):
+        """Revoca todos los tokens JWT del cliente (cerrar sesión en todos lados)"""
+        self.version_token = models.F('version_token') + 1
+        self.save(update_fields=['version_token'])
+        self.refresh_from_db(fields=['version_token'])
+
 
 # ------------------------------------------------
 # MODELO CATEGORIA
@@ -173,6 +187,17 @@ class Producto(models.Model):
         verbose_name="Stock disponible",
         help_text="Cantidad disponible en inventario"
     )
+    stock_fragmentado = models.BooleanField(
+        default=False,
+        verbose_name="Contador fragmentado",
+        help_text="Productos muy vendidos: el stock vive en fragmentos y se compacta periódicamente"
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Versión",
+        help_text="Se incrementa en cada cambio de stock (checkout optimista)"
+    )
     
     # ForeignKey corregida (sin prefijo id_)
     categoria = models.ForeignKey(
@@ -250,24 +275,94 @@ class Producto(models.Model):
             fecha_fin__gte=now
         ).exists()
 
-    def reducir_stock(self, cantidad):
-        """Reduce el stock del producto"""
-        if cantidad > self.stock_disponible:
-            raise ValidationError(
-                f'No hay suficiente stock. Disponible: {self.stock_disponible}'
-            )
-        self.stock_disponible -= cantidad
-        self.save(update_fields=['stock_disponible'])
+    def reducir_stock(self, cantidad, tipo='venta', pedido=None):
+        """Reduce el stock del producto registrando el movimiento"""
+        from .inventario import StockInsuficiente, registrar_movimiento
+        try:
+            registrar_movimiento(self, -cantidad, tipo, pedido=pedido)
+        except StockInsuficiente as e:
+            raise ValidationError(f'No hay suficiente stock. Disponible: {e.disponible}')
+        self.refresh_from_db(fields=['stock_disponible'])
 
-    def aumentar_stock(self, cantidad):
-        """Aumenta el stock del producto"""
-        self.stock_disponible += cantidad
-        self.save(update_fields=['stock_disponible'])
+    def aumentar_stock(self, cantidad, tipo='reposicion', pedido=None):
+        """Aumenta el stock del producto registrando el movimiento"""
+        from .inventario import registrar_movimiento
+        registrar_movimiento(self, cantidad, tipo, pedido=pedido)
+        self.refresh_from_db(fields=['stock_disponible'])
 
 
 # ------------------------------------------------
 # MODELO PEDIDO
 # ------------------------------------------------
+class PedidoQuerySet(models.QuerySet):
+    
+    # estado nuevo: (estados desde los que se permite, campo de fecha a registrar)
+    TRANSICIONES = {
+        'pagado': (['pendiente_pago'], 'fecha_pago'),
+        'preparando': (['pagado'], None),
+        'enviado': (['pagado', 'preparando'], 'fecha_envio'),
+        'completado': (['enviado'], 'fecha_entrega'),
+        'cancelado': (['pendiente_pago', 'pagado'], None),
+    }
+    
+    def cambiar_estado(self, estado_nuevo, **campos):
+        """
+        Transición masiva de estado: bloquea los pedidos elegibles del queryset,
+        los actualiza con un solo UPDATE y emite `pedidos_cambiaron_estado` con
+        los cambios (repone stock al cancelar y encola las notificaciones).
+        Retorna la cantidad de pedidos actualizados.
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from .signals import pedidos_cambiaron_estado
+        
+        estados_origen, campo_fecha = self.TRANSICIONES[estado_nuevo]
+        if campo_fecha:
+            campos[campo_fecha] = timezone.now()
+        
+        with transaction.atomic():
+            cambios = list(
+                self.filter(estado_pedido__in=estados_origen)
+                .select_for_update()
+                .order_by('pk')
+                .values_list('pk', 'estado_pedido')
+            )
+            if not cambios:
+                return 0
+            
+            Pedido.objects.filter(pk__in=[pk for pk, _ in cambios]).update(
+                estado_pedido=estado_nuevo, **campos
+            )
+            pedidos_cambiaron_estado.send(sender=Pedido, cambios=cambios, estado_nuevo=estado_nuevo)
+        
+        return len(cambios)
+    
+    def con_detalles(self):
+        """
+        Precarga los detalles con su producto: un pedido de cualquier tamaño
+        se renderiza con dos consultas (pedido + detalles con producto).
+        """
+        return self.prefetch_related(
+            models.Prefetch(
+                'detalles',
+                queryset=DetallePedido.objects.select_related('producto').order_by('id')
+            )
+        )
+    
+    def con_cantidad_items(self):
+        """
+        Anota `cantidad_items` (suma de cantidades de los detalles) con una
+        subconsulta por pedido: no agrupa la tabla completa, así un LIMIT sobre
+        el listado solo calcula la suma de los pedidos de la página.
+        """
+        cantidades = DetallePedido.objects.filter(
+            pedido=models.OuterRef('pk')
+        ).order_by().values('pedido').annotate(total=models.Sum('cantidad')).values('total')
+        return self.annotate(
+            cantidad_items=Coalesce(models.Subquery(cantidades), 0)
+        )
+
+
 class Pedido(models.Model):
     
     ESTADOS = [
@@ -353,6 +448,36 @@ class Pedido(models.Model):
         verbose_name="Número de seguimiento",
         help_text="Número de seguimiento del envío"
     )
+    
+    # Idempotencia del checkout (header Idempotency-Key). Única junto con
+    # fecha_pedido (ver Meta), que es lo que admite la tabla particionada
+    clave_idempotencia = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        verbose_name="Clave de idempotencia"
+    )
+    hash_solicitud = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="Hash de la solicitud",
+        help_text="SHA-256 de los datos del checkout asociados a la clave de idempotencia"
+    )
+    
+    # Seguimiento sin cuenta: el token va en el correo de confirmación, aquí solo su hash.
+    # Índice simple y no único: con `pedidos` particionada un UNIQUE debería incluir
+    # fecha_pedido (un token de 256 bits aleatorios no necesita la restricción)
+    token_seguimiento_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Hash del token de seguimiento",
+        help_text="SHA-256 del token del enlace de seguimiento enviado al cliente"
+    )
+
+    objects = PedidoQuerySet.as_manager()
 
     class Meta:
         db_table = 'pedidos'
@@ -363,6 +488,17 @@ class Pedido(models.Model):
             models.Index(fields=['-fecha_pedido']),
             models.Index(fields=['estado_pedido']),
             models.Index(fields=['usuario', '-fecha_pedido']),
+            # Búsqueda exacta por número de seguimiento en el admin
+            models.Index(fields=['numero_seguimiento']),
+            # Seguimiento de invitados: correo (normalizado) + número de seguimiento
+            models.Index(Lower('correo_cliente'), 'numero_seguimiento', name='pedidos_correo_seguim_idx'),
+        ]
+        constraints = [
+            # Una restricción única en una tabla particionada debe incluir fecha_pedido;
+            # el checkout serializa cada clave con un advisory lock y la busca antes de crear
+            models.UniqueConstraint(
+                fields=['clave_idempotencia', 'fecha_pedido'], name='pedidos_clave_idempotencia_uniq'
+            ),
         ]
 
     def __str__(self):
@@ -370,34 +506,41 @@ class Pedido(models.Model):
     
     def es_invitado(self):
         """Retorna True si el pedido fue hecho por un invitado"""
-        return self.usuario is None
+        return self.usuario_id is None
     
     def puede_cancelar(self):
         """Determina si el pedido puede ser cancelado"""
         return self.estado_pedido in ['pendiente_pago', 'pagado']
     
+    def _cambiar_estado(self, estado_nuevo, **campos):
+        """Aplica la transición o lanza ValidationError si el estado actual no la permite"""
+        if not Pedido.objects.filter(pk=self.pk).cambiar_estado(estado_nuevo, **campos):
+            actual = Pedido.objects.filter(pk=self.pk).values_list('estado_pedido', flat=True).first()
+            raise ValidationError(
+                f'El pedido #{self.pk} no puede pasar de "{actual}" a "{estado_nuevo}".'
+            )
+        self.refresh_from_db(fields=['estado_pedido', 'fecha_pago', 'fecha_envio', 'fecha_entrega', 'numero_seguimiento'])
+    
     def marcar_como_pagado(self):
         """Marca el pedido como pagado y registra la fecha"""
-        from django.utils import timezone
-        self.estado_pedido = 'pagado'
-        self.fecha_pago = timezone.now()
-        self.save(update_fields=['estado_pedido', 'fecha_pago'])
+        self._cambiar_estado('pagado')
+    
+    def marcar_como_preparando(self):
+        """Marca el pedido pagado como en preparación"""
+        self._cambiar_estado('preparando')
     
     def marcar_como_enviado(self, numero_seguimiento=None):
         """Marca el pedido como enviado"""
-        from django.utils import timezone
-        self.estado_pedido = 'enviado'
-        self.fecha_envio = timezone.now()
-        if numero_seguimiento:
-            self.numero_seguimiento = numero_seguimiento
-        self.save(update_fields=['estado_pedido', 'fecha_envio', 'numero_seguimiento'])
+        campos = {'numero_seguimiento': numero_seguimiento} if numero_seguimiento else {}
+        self._cambiar_estado('enviado', **campos)
 
     def marcar_como_completado(self):
         """Marca el pedido como completado"""
-        from django.utils import timezone
-        self.estado_pedido = 'completado'
-        self.fecha_entrega = timezone.now()
-        self.save(update_fields=['estado_pedido', 'fecha_entrega'])
+        self._cambiar_estado('completado')
+    
+    def cancelar(self):
+        """Cancela el pedido y repone el stock"""
+        self._cambiar_estado('cancelado')
 
 
 # ------------------------------------------------
@@ -423,6 +566,11 @@ class DetallePedido(models.Model):
         verbose_name="Precio de compra",
         help_text="Precio al momento de la compra (snapshot)"
     )
+    fecha_pedido = models.DateTimeField(
+        editable=False,
+        verbose_name="Fecha del pedido",
+        help_text="Copia de pedido.fecha_pedido: permite filtrar por fecha sin join y particionar la tabla por mes"
+    )
 
     class Meta:
         db_table = 'detalle_pedidos'
@@ -431,6 +579,7 @@ class DetallePedido(models.Model):
         indexes = [
             models.Index(fields=['pedido']),
             models.Index(fields=['producto']),
+            models.Index(fields=['fecha_pedido']),
         ]
 
     def __str__(self):
@@ -450,6 +599,11 @@ class DetallePedido(models.Model):
                 'cantidad': 'La cantidad debe ser mayor a 0.'
             })
 
+    def save(self, *args, **kwargs):
+        if self.fecha_pedido is None:
+            self.fecha_pedido = self.pedido.fecha_pedido
+        super().save(*args, **kwargs)
+
 
 # ------------------------------------------------
 # MODELO OFERTA
@@ -519,4 +673,389 @@ class Oferta(models.Model):
             descuento = ((self.producto.precio_unitario - self.precio_oferta) / 
                         self.producto.precio_unitario) * 100
             return round(descuento, 2)
-        return 0
\ No newline at end of file
+        return 0
+
+# ------------------------------------------------
+# MODELO RESERVA DE STOCK
+# ------------------------------------------------
+class ReservaStockQuerySet(models.QuerySet):
+    
+    def vigentes(self):
+        """Reservas que todavía no expiran"""
+        from django.utils import timezone
+        return self.filter(expira_en__gt=timezone.now())
+    
+    def vencidas(self):
+        """Reservas expiradas, pendientes de liberar"""
+        from django.utils import timezone
+        return self.filter(expira_en__lte=timezone.now())
+
+
+class ReservaStock(models.Model):
+    """
+    Reserva temporal de stock creada al agregar un producto al carrito
+    (solo cuando RESERVAS_STOCK_ACTIVAS está habilitado).
+    """
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='reservas',
+        verbose_name="Producto"
+    )
+    clave_carrito = models.CharField(
+        max_length=100,
+        db_index=True,
+        verbose_name="Clave del carrito",
+        help_text="Sesión y carrito dueños de la reserva"
+    )
+    cantidad = models.PositiveIntegerField(verbose_name="Cantidad reservada")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+    expira_en = models.DateTimeField(db_index=True, verbose_name="Expira en")
+
+    objects = ReservaStockQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'reservas_stock'
+        verbose_name = 'Reserva de stock'
+        verbose_name_plural = 'Reservas de stock'
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'clave_carrito'], name='reserva_unica_por_carrito'),
+        ]
+        indexes = [
+            models.Index(fields=['producto', 'expira_en']),
+        ]
+
+    def __str__(self):
+        return f"Reserva: {self.cantidad} x {self.producto_id} ({self.clave_carrito})"
+
+
+# ------------------------------------------------
+# MODELO CORREO SALIENTE (OUTBOX)
+# ------------------------------------------------
+class CorreoSaliente(models.Model):
+    """
+    Bandeja de salida de correos transaccionales. Se escribe en la misma
+    transacción que el pedido y la entrega el comando `enviar_correos`.
+    """
+    
+    TIPOS = [
+        ('confirmacion_pedido', 'Confirmación de pedido'),
+        ('admin_nuevo_pedido', 'Aviso de nuevo pedido'),
+        ('cambio_estado', 'Cambio de estado del pedido'),
+        ('password_reset', 'Restablecer contraseña'),
+    ]
+    
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    ]
+    
+    tipo = models.CharField(max_length=50, choices=TIPOS, verbose_name="Tipo")
+    pedido = models.ForeignKey(
+        Pedido,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='correos',
+        verbose_name="Pedido"
+    )
+    destinatarios = models.JSONField(verbose_name="Destinatarios")
+    asunto = models.CharField(max_length=255, verbose_name="Asunto")
+    html = models.TextField(blank=True, verbose_name="Contenido HTML")
+    texto = models.TextField(blank=True, verbose_name="Contenido texto")
+    contiene_secreto = models.BooleanField(
+        default=False,
+        verbose_name="Contiene secreto",
+        help_text="Lleva un enlace secreto: el contenido se borra al enviarlo o descartarlo"
+    )
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='pendiente',
+        verbose_name="Estado"
+    )
+    intentos = models.PositiveIntegerField(default=0, verbose_name="Intentos")
+    proximo_intento = models.DateTimeField(verbose_name="Próximo intento")
+    ultimo_error = models.TextField(blank=True, verbose_name="Último error")
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
+    fecha_envio = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de envío")
+
+    class Meta:
+        db_table = 'correos_salientes'
+        verbose_name = 'Correo saliente'
+        verbose_name_plural = 'Correos salientes'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {', '.join(self.destinatarios)} ({self.get_estado_display()})"
+
+
+# ------------------------------------------------
+# MODELO MOVIMIENTO DE INVENTARIO
+# ------------------------------------------------
+class MovimientoInventario(models.Model):
+    """
+    Libro de movimientos de stock (solo se agregan filas). En productos
+    fragmentados los movimientos quedan pendientes hasta que el comando
+    `compactar_inventario` los pliega en `stock_disponible`.
+    """
+    
+    TIPOS = [
+        ('venta', 'Venta'),
+        ('reposicion', 'Reposición'),
+        ('cancelacion', 'Cancelación'),
+        ('ajuste', 'Ajuste manual'),
+    ]
+    
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,  # las ventas (DetallePedido) ya protegen el producto
+        related_name='movimientos',
+        verbose_name="Producto"
+    )
+    tipo = models.CharField(max_length=20, choices=TIPOS, verbose_name="Tipo")
+    cantidad = models.IntegerField(
+        verbose_name="Cantidad",
+        help_text="Positiva si entra stock, negativa si sale"
+    )
+    pedido = models.ForeignKey(
+        Pedido,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='movimientos_inventario',
+        verbose_name="Pedido"
+    )
+    nota = models.CharField(max_length=255, blank=True, verbose_name="Nota")
+    compactado = models.BooleanField(
+        default=False,
+        verbose_name="Compactado",
+        help_text="Ya está reflejado en el stock disponible del producto"
+    )
+    fecha = models.DateTimeField(auto_now_add=True, verbose_name="Fecha")
+
+    class Meta:
+        db_table = 'movimientos_inventario'
+        verbose_name = 'Movimiento de inventario'
+        verbose_name_plural = 'Movimientos de inventario'
+        ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', '-fecha']),
+            models.Index(
+                fields=['producto'],
+                condition=models.Q(compactado=False),
+                name='movimientos_pendientes_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.cantidad:+d} x {self.producto_id}"
+
+
+# ------------------------------------------------
+# MODELO FRAGMENTO DE STOCK
+# ------------------------------------------------
+class FragmentoStock(models.Model):
+    """
+    Contador parcial del stock de un producto fragmentado. Las ventas
+    descuentan de un fragmento al azar, así los checkouts concurrentes no
+    compiten por la misma fila. El stock real es la suma de los fragmentos.
+    """
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='fragmentos',
+        verbose_name="Producto"
+    )
+    indice = models.PositiveSmallIntegerField(verbose_name="Índice")
+    cantidad = models.IntegerField(default=0, verbose_name="Cantidad")
+
+    class Meta:
+        db_table = 'fragmentos_stock'
+        verbose_name = 'Fragmento de stock'
+        verbose_name_plural = 'Fragmentos de stock'
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'indice'], name='fragmento_unico_por_producto'),
+            models.CheckConstraint(condition=models.Q(cantidad__gte=0), name='fragmento_cantidad_no_negativa'),
+        ]
+
+    def __str__(self):
+        return f"Fragmento {self.indice} de {self.producto_id}: {self.cantidad}"
+
+
+# ------------------------------------------------
+# RESÚMENES DIARIOS DE VENTAS
+# ------------------------------------------------
+class VentaDiaria(models.Model):
+    """
+    Pedidos y monto por día (fecha local del pedido) y estado. Se mantiene
+    incrementalmente (ver miapp/resumenes.py) y se puede reconstruir con
+    el comando `reconstruir_resumenes`.
+    """
+    dia = models.DateField(verbose_name="Día")
+    estado_pedido = models.CharField(max_length=20, choices=Pedido.ESTADOS, verbose_name="Estado")
+    pedidos = models.IntegerField(default=0, verbose_name="Pedidos")
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Monto")
+
+    class Meta:
+        db_table = 'ventas_diarias'
+        verbose_name = 'Venta diaria'
+        verbose_name_plural = 'Ventas diarias'
+        ordering = ['-dia']
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'estado_pedido'], name='venta_diaria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.estado_pedido}: {self.pedidos} pedido(s)"
+
+
+class VentaDiariaProducto(models.Model):
+    """Unidades y monto vendidos por día, estado del pedido y producto (con su categoría)"""
+    dia = models.DateField(verbose_name="Día")
+    estado_pedido = models.CharField(max_length=20, choices=Pedido.ESTADOS, verbose_name="Estado")
+    producto = models.ForeignKey(
+        Producto,
+        on_delete=models.CASCADE,
+        related_name='ventas_diarias',
+        verbose_name="Producto"
+    )
+    categoria = models.ForeignKey(
+        Categoria,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ventas_diarias',
+        verbose_name="Categoría"
+    )
+    unidades = models.IntegerField(default=0, verbose_name="Unidades")
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Monto")
+
+    class Meta:
+        db_table = 'ventas_diarias_producto'
+        verbose_name = 'Venta diaria por producto'
+        verbose_name_plural = 'Ventas diarias por producto'
+        ordering = ['-dia']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dia', 'estado_pedido', 'producto'], name='venta_diaria_producto_unica'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['dia', 'categoria']),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.estado_pedido} {self.producto_id}: {self.unidades}"
+
+
+# ------------------------------------------------
+# ANALÍTICA DE CLIENTES (RFM Y COHORTES)
+# ------------------------------------------------
+class ClienteRFM(models.Model):
+    """
+    Recencia, frecuencia y monto de cada cliente con compras, con sus puntajes
+    (1 a 5, por quintil) y segmento. Lo recalcula completo el comando
+    `calcular_analitica_clientes` (ver miapp/analitica.py).
+    """
+    SEGMENTOS = [
+        ('campeones', 'Campeones'),
+        ('leales', 'Leales'),
+        ('nuevos', 'Nuevos'),
+        ('potenciales', 'Potenciales'),
+        ('en_riesgo', 'En riesgo'),
+        ('perdidos', 'Perdidos'),
+    ]
+
+    cliente = models.OneToOneField(
+        Cliente,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rfm',
+        verbose_name="Cliente"
+    )
+    primera_compra = models.DateField(verbose_name="Primera compra")
+    ultima_compra = models.DateField(verbose_name="Última compra")
+    recencia_dias = models.IntegerField(verbose_name="Días desde la última compra")
+    frecuencia = models.IntegerField(verbose_name="Pedidos")
+    monto = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Monto total")
+    puntaje_r = models.PositiveSmallIntegerField(verbose_name="R")
+    puntaje_f = models.PositiveSmallIntegerField(verbose_name="F")
+    puntaje_m = models.PositiveSmallIntegerField(verbose_name="M")
+    segmento = models.CharField(max_length=20, choices=SEGMENTOS, db_index=True, verbose_name="Segmento")
+    fecha_calculo = models.DateTimeField(verbose_name="Calculado el")
+
+    class Meta:
+        db_table = 'clientes_rfm'
+        verbose_name = 'RFM de cliente'
+        verbose_name_plural = 'RFM de clientes'
+
+    def __str__(self):
+        return f"{self.cliente_id}: R{self.puntaje_r} F{self.puntaje_f} M{self.puntaje_m} ({self.segmento})"
+
+
+class CohorteMensual(models.Model):
+    """
+    Clientes de una cohorte (mes de su primera compra) que volvieron a
+    comprar `mes` meses después, con sus pedidos y monto. mes=0 es la cohorte
+    completa.
+    """
+    cohorte = models.DateField(verbose_name="Cohorte (primer día del mes)")
+    mes = models.PositiveSmallIntegerField(verbose_name="Meses desde la primera compra")
+    clientes = models.IntegerField(default=0, verbose_name="Clientes activos")
+    pedidos = models.IntegerField(default=0, verbose_name="Pedidos")
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Monto")
+
+    class Meta:
+        db_table = 'cohortes_mensuales'
+        verbose_name = 'Cohorte mensual'
+        verbose_name_plural = 'Cohortes mensuales'
+        ordering = ['cohorte', 'mes']
+        constraints = [
+            models.UniqueConstraint(fields=['cohorte', 'mes'], name='cohorte_mes_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.cohorte:%Y-%m} +{self.mes}: {self.clientes} cliente(s)"
+
+
+# ------------------------------------------------
+# SUGERENCIAS DE REPOSICIÓN
+# ------------------------------------------------
+class ReposicionProducto(models.Model):
+    """
+    Velocidad de venta de un producto y su punto de reorden, calculados cada
+    noche por el comando `calcular_reposicion` (ver miapp/reposicion.py).
+    Los días hasta agotar se estiman con el stock del momento.
+    """
+    producto = models.OneToOneField(
+        Producto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='reposicion',
+        verbose_name="Producto"
+    )
+    velocidad_diaria = models.FloatField(default=0, verbose_name="Unidades por día")
+    desviacion_diaria = models.FloatField(default=0, verbose_name="Desviación diaria")
+    punto_reorden = models.IntegerField(default=0, verbose_name="Punto de reorden")
+    dias_historia = models.PositiveSmallIntegerField(verbose_name="Días de historia")
+    fecha_calculo = models.DateTimeField(verbose_name="Calculado el")
+
+    class Meta:
+        db_table = 'reposicion_productos'
+        verbose_name = 'Reposición de producto'
+        verbose_name_plural = 'Reposición de productos'
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.velocidad_diaria:.2f}/día, reorden en {self.punto_reorden}"
+
+    def dias_hasta_agotar(self, stock):
+        """Días que dura `stock` al ritmo de venta actual (None si no se vende)"""
+        if self.velocidad_diaria <= 0:
+            return None
+        return stock / self.velocidad_diaria
@@ -0,0 +1,317 @@
+# miapp/particiones.py
+"""
+Particionamiento por mes (PostgreSQL) de `pedidos` y `detalle_pedidos`.
+
+Ambas tablas se particionan por rango de `fecha_pedido` (en detalle_pedidos es
+la copia desnormalizada del pedido), así los filtros por fecha del dashboard,
+`inicio` y el admin solo leen las particiones del período consultado.
+
+Limitaciones de PostgreSQL que asume este módulo:
+- La clave primaria y las restricciones únicas deben incluir la columna de
+  partición: la PK pasa a ser (id, fecha_pedido). La de idempotencia ya se
+  declara así en el modelo; el checkout serializa cada clave con un advisory lock.
+- Una clave foránea hacia una tabla particionada (PostgreSQL 12+) tiene que
+  referenciar una clave única que incluya la columna de partición. La FK de
+  detalle_pedidos se recrea como (pedido_id, fecha_pedido) → pedidos (id,
+  fecha_pedido) gracias a su copia de la fecha (FK_COMPUESTAS). Las tablas sin
+  esa copia (correos_salientes, movimientos_inventario) pierden la FK de la
+  base; Django sigue resolviendo esas relaciones y sus SET NULL en el ORM.
+"""
+import logging
+import re
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# (tabla, columna de partición), en el orden en que se convierten
+TABLAS_PARTICIONADAS = [
+    ('pedidos', 'fecha_pedido'),
+    ('detalle_pedidos', 'fecha_pedido'),
+]
+
+# FK recreadas hacia tablas particionadas: (nombre, tabla, columnas, tabla referenciada, columnas)
+FK_COMPUESTAS = [
+    ('detalle_pedidos_pedido_fecha_fk', 'detalle_pedidos', ('pedido_id', 'fecha_pedido'),
+     'pedidos', ('id', 'fecha_pedido')),
+]
+
+PATRON_PARTICION = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+class ParticionesNoSoportadas(Exception):
+    """La base de datos configurada no es PostgreSQL"""
+
+
+def _q(nombre):
+    return connection.ops.quote_name(nombre)
+
+
+def _validar_motor():
+    if connection.vendor != 'postgresql':
+        raise ParticionesNoSoportadas(
+            f'El particionamiento requiere PostgreSQL (base actual: {connection.vendor}).'
+        )
+
+
+def inicio_mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+
+def sumar_meses(mes, cantidad):
+    indice = mes.year * 12 + mes.month - 1 + cantidad
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def nombre_particion(tabla, mes):
+    return f'{tabla}_p{mes:%Y_%m}'
+
+
+def _limite(mes):
+    # Límites en UTC: fecha_pedido es timestamptz
+    return f"'{mes.isoformat()} 00:00:00+00'"
+
+
+def esta_particionada(cursor, tabla):
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+        [tabla]
+    )
+    return cursor.fetchone()[0]
+
+
+def listar_particiones(cursor, tabla):
+    """Retorna [(nombre, mes o None si es la partición por defecto, filas estimadas)]"""
+    cursor.execute(
+        """
+        SELECT c.relname, c.reltuples::bigint
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname
+        """,
+        [tabla]
+    )
+    particiones = []
+    for nombre, filas in cursor.fetchall():
+        coincidencia = PATRON_PARTICION.search(nombre)
+        mes = date(int(coincidencia.group(1)), int(coincidencia.group(2)), 1) if coincidencia else None
+        particiones.append((nombre, mes, max(filas, 0)))
+    return particiones
+
+
+def _crear_particion(cursor, tabla, columna, mes):
+    """
+    Crea la partición del mes. Si la partición por defecto tiene filas de ese
+    rango (se insertaron antes de que existiera), se mueven a la nueva.
+    """
+    particion = nombre_particion(tabla, mes)
+    desde, hasta = _limite(mes), _limite(sumar_meses(mes, 1))
+
+    cursor.execute(f'CREATE TABLE {_q(particion)} (LIKE {_q(tabla)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'''
+        WITH movidas AS (
+            DELETE FROM {_q(tabla + '_default')}
+            WHERE {_q(columna)} >= {desde} AND {_q(columna)} < {hasta}
+            RETURNING *
+        )
+        INSERT INTO {_q(particion)} SELECT * FROM movidas
+        '''
+    )
+    cursor.execute(
+        f'ALTER TABLE {_q(tabla)} ATTACH PARTITION {_q(particion)} FOR VALUES FROM ({desde}) TO ({hasta})'
+    )
+    logger.info(f"Partición creada: {particion}")
+    return particion
+
+
+def _convertir_tabla(cursor, tabla, columna, meses_adelante):
+    """Reemplaza una tabla común por una particionada por mes con los mismos datos"""
+    legado = f'{tabla}_sin_particionar'
+    cursor.execute(f'LOCK TABLE {_q(tabla)} IN ACCESS EXCLUSIVE MODE')
+
+    # Restricciones e índices a recrear sobre la tabla particionada
+    cursor.execute(
+        """
+        SELECT conname, contype, pg_get_constraintdef(oid),
+               ARRAY(
+                   SELECT attname::text FROM pg_attribute
+                   WHERE attrelid = conrelid AND attnum = ANY(conkey)
+               )
+        FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f')
+        """,
+        [tabla]
+    )
+    restricciones = cursor.fetchall()
+    nombres_restricciones = {nombre for nombre, _, _, _ in restricciones}
+
+    cursor.execute(
+        'SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s',
+        [tabla]
+    )
+    indices = [
+        (nombre, definicion) for nombre, definicion in cursor.fetchall()
+        if nombre not in nombres_restricciones
+    ]
+
+    # Las FK que apuntan a esta tabla referencian solo el id, que deja de ser
+    # único por sí solo: se eliminan y las de FK_COMPUESTAS se recrean al final
+    cursor.execute(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+        [tabla]
+    )
+    for tabla_origen, nombre in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {tabla_origen} DROP CONSTRAINT {_q(nombre)}')
+        logger.warning(f"FK {nombre} de {tabla_origen} hacia {tabla} eliminada")
+
+    cursor.execute(f'SELECT MIN({_q(columna)}), MAX(id) FROM {_q(tabla)}')
+    fecha_minima, id_maximo = cursor.fetchone()
+
+    cursor.execute(f'ALTER TABLE {_q(tabla)} RENAME TO {_q(legado)}')
+    cursor.execute(
+        f'''
+        CREATE TABLE {_q(tabla)} (
+            LIKE {_q(legado)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS
+        ) PARTITION BY RANGE ({_q(columna)})
+        '''
+    )
+    # Si el id venía de un serial, su secuencia se elimina junto con la tabla original
+    cursor.execute(f'ALTER TABLE {_q(tabla)} ALTER COLUMN id DROP DEFAULT')
+    cursor.execute(f'CREATE TABLE {_q(tabla + "_default")} PARTITION OF {_q(tabla)} DEFAULT')
+
+    mes_actual = inicio_mes(timezone.now())
+    mes = inicio_mes(fecha_minima) if fecha_minima else mes_actual
+    while mes <= sumar_meses(mes_actual, meses_adelante):
+        _crear_particion(cursor, tabla, columna, mes)
+        mes = sumar_meses(mes, 1)
+
+    cursor.execute(f'INSERT INTO {_q(tabla)} SELECT * FROM {_q(legado)}')
+    cursor.execute(f'DROP TABLE {_q(legado)}')
+
+    # La identidad del id se pierde con LIKE: secuencia propia continuando desde el máximo
+    secuencia = f'{tabla}_id_seq'
+    cursor.execute(f'CREATE SEQUENCE {_q(secuencia)} OWNED BY {_q(tabla)}.id')
+    cursor.execute('SELECT setval(%s, %s, false)', [secuencia, (id_maximo or 0) + 1])
+    cursor.execute(f"ALTER TABLE {_q(tabla)} ALTER COLUMN id SET DEFAULT nextval('{secuencia}')")
+
+    for nombre, tipo, definicion, columnas in restricciones:
+        if tipo == 'f':
+            cursor.execute(f'ALTER TABLE {_q(tabla)} ADD CONSTRAINT {_q(nombre)} {definicion}')
+            continue
+        if columna not in columnas:
+            columnas = list(columnas) + [columna]
+        clausula = 'PRIMARY KEY' if tipo == 'p' else 'UNIQUE'
+        cursor.execute(
+            f'ALTER TABLE {_q(tabla)} ADD CONSTRAINT {_q(nombre)} '
+            f'{clausula} ({", ".join(_q(c) for c in columnas)})'
+        )
+
+    for nombre, definicion in indices:
+        if definicion.startswith('CREATE UNIQUE INDEX') and columna not in definicion:
+            logger.warning(f"Índice único {nombre} omitido: no incluye la columna de partición")
+            continue
+        cursor.execute(definicion)
+
+
+def _crear_fk_compuestas(cursor):
+    """Crea las FK_COMPUESTAS que falten (validan las filas existentes)"""
+    for nombre, tabla, columnas, referenciada, referenciadas in FK_COMPUESTAS:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname = %s)',
+            [tabla, nombre]
+        )
+        if cursor.fetchone()[0]:
+            continue
+        cursor.execute(
+            f'ALTER TABLE {_q(tabla)} ADD CONSTRAINT {_q(nombre)} '
+            f'FOREIGN KEY ({", ".join(_q(c) for c in columnas)}) '
+            f'REFERENCES {_q(referenciada)} ({", ".join(_q(c) for c in referenciadas)}) '
+            f'DEFERRABLE INITIALLY DEFERRED'
+        )
+        logger.info(f"FK {nombre} creada: {tabla} {columnas} -> {referenciada} {referenciadas}")
+
+
+def convertir_a_particionadas(meses_adelante=None):
+    """
+    Convierte `pedidos` y `detalle_pedidos` a tablas particionadas por mes,
+    en una sola transacción (bloquea ambas tablas mientras copia los datos).
+    Retorna las tablas convertidas.
+    """
+    _validar_motor()
+    if meses_adelante is None:
+        meses_adelante = getattr(settings, 'PARTICIONES_MESES_ADELANTE', 3)
+
+    convertidas = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for tabla, columna in TABLAS_PARTICIONADAS:
+            if esta_particionada(cursor, tabla):
+                continue
+            _convertir_tabla(cursor, tabla, columna, meses_adelante)
+            convertidas.append(tabla)
+        _crear_fk_compuestas(cursor)
+    return convertidas
+
+
+def crear_particiones_futuras(meses_adelante=None):
+    """Crea las particiones que falten desde el mes actual hasta `meses_adelante`"""
+    _validar_motor()
+    if meses_adelante is None:
+        meses_adelante = getattr(settings, 'PARTICIONES_MESES_ADELANTE', 3)
+
+    mes_actual = inicio_mes(timezone.now())
+    creadas = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for tabla, columna in TABLAS_PARTICIONADAS:
+            if not esta_particionada(cursor, tabla):
+                continue
+            existentes = {mes for _, mes, _ in listar_particiones(cursor, tabla)}
+            for desplazamiento in range(meses_adelante + 1):
+                mes = sumar_meses(mes_actual, desplazamiento)
+                if mes not in existentes:
+                    creadas.append(_crear_particion(cursor, tabla, columna, mes))
+    return creadas
+
+
+def archivar_particiones(retencion_meses=None, esquema=None):
+    """
+    Separa las particiones más antiguas que `retencion_meses` y las mueve al
+    esquema de archivo: dejan de aparecer en las consultas sobre `pedidos`
+    pero siguen disponibles como tablas (archivo.pedidos_p2023_01, ...).
+    """
+    _validar_motor()
+    if retencion_meses is None:
+        retencion_meses = getattr(settings, 'PARTICIONES_RETENCION_MESES', 24)
+    esquema = esquema or getattr(settings, 'PARTICIONES_ESQUEMA_ARCHIVO', 'archivo')
+
+    limite = sumar_meses(inicio_mes(timezone.now()), -retencion_meses)
+    archivadas = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {_q(esquema)}')
+        # Detalles primero: un mes archivado se lleva pedidos y detalles juntos
+        for tabla, _ in reversed(TABLAS_PARTICIONADAS):
+            if not esta_particionada(cursor, tabla):
+                continue
+            for particion, mes, _ in listar_particiones(cursor, tabla):
+                if mes is None or mes >= limite:
+                    continue
+                cursor.execute(f'ALTER TABLE {_q(tabla)} DETACH PARTITION {_q(particion)}')
+                cursor.execute(f'ALTER TABLE {_q(particion)} SET SCHEMA {_q(esquema)}')
+                archivadas.append(particion)
+                logger.info(f"Partición archivada: {esquema}.{particion}")
+    return archivadas
+
+
+def estado_particiones():
+    """Retorna {tabla: [(partición, mes, filas estimadas)]} de las tablas particionadas"""
+    _validar_motor()
+    with connection.cursor() as cursor:
+        return {
+            tabla: listar_particiones(cursor, tabla)
+            for tabla, _ in TABLAS_PARTICIONADAS
+            if esta_particionada(cursor, tabla)
+        }
@@ -0,0 +1,186 @@
+# miapp/resumenes.py
+"""
+Resúmenes diarios de ventas para el dashboard.
+
+`VentaDiaria` (día, estado) y `VentaDiariaProducto` (día, estado, producto)
+se mantienen con sumas incrementales: un pedido nuevo suma en su estado
+inicial y un cambio de estado mueve sus montos del estado anterior al nuevo.
+Eliminar un pedido o editar sus líneas desde el admin pasa por
+`recalcular_pedidos`, que los resta antes y los vuelve a sumar después.
+Los incrementos son upserts aditivos (INSERT ... ON CONFLICT DO UPDATE), así
+dos transacciones que tocan el mismo día no se pisan.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+
+from .models import DetallePedido, Pedido, VentaDiaria, VentaDiariaProducto
+
+# Estados que cuentan como venta en los indicadores
+ESTADOS_VENDIDOS = ['pagado', 'preparando', 'enviado', 'completado']
+
+_MONTO_LINEA = ExpressionWrapper(F('cantidad') * F('precio_compra'), output_field=DecimalField())
+
+
+def _sumas_pedidos(pedido_ids):
+    """{dia: (pedidos, monto)} de los pedidos dados, sin importar su estado"""
+    filas = (
+        Pedido.objects.filter(pk__in=pedido_ids)
+        .annotate(dia=TruncDate('fecha_pedido'))
+        .values('dia')
+        .annotate(pedidos=Count('id'), monto=Sum('total_pedido'))
+        .order_by()
+    )
+    return {fila['dia']: (fila['pedidos'], fila['monto']) for fila in filas}
+
+
+def _sumas_productos(pedido_ids):
+    """{(dia, producto, categoria): (unidades, monto)} de las líneas de los pedidos"""
+    filas = (
+        DetallePedido.objects.filter(pedido_id__in=pedido_ids)
+        .annotate(dia=TruncDate('fecha_pedido'))
+        .values('dia', 'producto_id', 'producto__categoria_id')
+        .annotate(unidades=Sum('cantidad'), monto=Sum(_MONTO_LINEA))
+        .order_by()
+    )
+    return {
+        (fila['dia'], fila['producto_id'], fila['producto__categoria_id']): (fila['unidades'], fila['monto'])
+        for fila in filas
+    }
+
+
+def _acumular(modelo, claves, medidas, filas, extras=()):
+    """
+    Upsert aditivo: suma `medidas` a la fila de cada clave o la crea (con
+    las columnas `extras`, que no se modifican después). Cada fila trae los
+    valores en el orden claves + extras + medidas. Se insertan ordenadas por
+    clave para que dos transacciones bloqueen las filas en el mismo orden.
+    """
+    if not filas:
+        return
+    q = connection.ops.quote_name
+    tabla = q(modelo._meta.db_table)
+    columnas = list(claves) + list(extras) + list(medidas)
+    valores = ', '.join(['(' + ', '.join(['%s'] * len(columnas)) + ')'] * len(filas))
+    actualizar = ', '.join(f'{q(m)} = {tabla}.{q(m)} + excluded.{q(m)}' for m in medidas)
+    sql = (
+        f'INSERT INTO {tabla} ({", ".join(q(c) for c in columnas)}) VALUES {valores} '
+        f'ON CONFLICT ({", ".join(q(c) for c in claves)}) DO UPDATE SET {actualizar}'
+    )
+    filas = sorted(filas, key=lambda fila: tuple(str(valor) for valor in fila[:len(claves)]))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [valor for fila in filas for valor in fila])
+
+
+def _aplicar(pedido_ids, estado, signo):
+    """Suma (signo=1) o resta (signo=-1) los pedidos en el estado dado"""
+    _acumular(
+        VentaDiaria, ['dia', 'estado_pedido'], ['pedidos', 'monto'],
+        [
+            (dia, estado, signo * pedidos, signo * monto)
+            for dia, (pedidos, monto) in _sumas_pedidos(pedido_ids).items()
+        ]
+    )
+    _acumular(
+        VentaDiariaProducto, ['dia', 'estado_pedido', 'producto_id'], ['unidades', 'monto'],
+        [
+            (dia, estado, producto_id, categoria_id, signo * unidades, signo * monto)
+            for (dia, producto_id, categoria_id), (unidades, monto) in _sumas_productos(pedido_ids).items()
+        ],
+        extras=['categoria_id']
+    )
+
+
+def registrar_pedidos_nuevos(pedido_ids, estado='pendiente_pago'):
+    """Suma pedidos recién creados en su estado inicial"""
+    with transaction.atomic():
+        _aplicar(pedido_ids, estado, 1)
+
+
+def mover_pedidos(cambios, estado_nuevo):
+    """
+    Traslada los montos de los pedidos que cambiaron de estado.
+    cambios: [(pedido_id, estado_anterior)], como en `pedidos_cambiaron_estado`.
+    """
+    por_estado = defaultdict(list)
+    for pedido_id, estado_anterior in cambios:
+        por_estado[estado_anterior].append(pedido_id)
+
+    with transaction.atomic():
+        for estado_anterior, pedido_ids in sorted(por_estado.items()):
+            _aplicar(pedido_ids, estado_anterior, -1)
+            _aplicar(pedido_ids, estado_nuevo, 1)
+
+
+def _aplicar_en_su_estado(pedido_ids, signo):
+    por_estado = defaultdict(list)
+    for pedido_id, estado in Pedido.objects.filter(pk__in=pedido_ids).values_list('pk', 'estado_pedido'):
+        por_estado[estado].append(pedido_id)
+    for estado, ids in sorted(por_estado.items()):
+        _aplicar(ids, estado, signo)
+
+
+@contextmanager
+def recalcular_pedidos(pedido_ids):
+    """
+    Resta los pedidos de los resúmenes, ejecuta el bloque y los vuelve a sumar
+    con sus datos nuevos (los eliminados en el bloque ya no suman).
+    """
+    pedido_ids = list(pedido_ids)
+    with transaction.atomic():
+        _aplicar_en_su_estado(pedido_ids, -1)
+        yield
+        _aplicar_en_su_estado(pedido_ids, 1)
+
+
+def reconstruir_resumenes(desde=None, hasta=None):
+    """
+    Recalcula los resúmenes desde los pedidos (días `desde`..`hasta`, ambos
+    inclusivos; None = sin límite). Retorna (filas de VentaDiaria, filas de
+    VentaDiariaProducto) escritas.
+    """
+    pedidos = Pedido.objects.annotate(dia=TruncDate('fecha_pedido'))
+    detalles = DetallePedido.objects.annotate(dia=TruncDate('fecha_pedido'))
+    resumenes = [VentaDiaria.objects.all(), VentaDiariaProducto.objects.all()]
+    if desde:
+        pedidos, detalles = pedidos.filter(dia__gte=desde), detalles.filter(dia__gte=desde)
+        resumenes = [r.filter(dia__gte=desde) for r in resumenes]
+    if hasta:
+        pedidos, detalles = pedidos.filter(dia__lte=hasta), detalles.filter(dia__lte=hasta)
+        resumenes = [r.filter(dia__lte=hasta) for r in resumenes]
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Los incrementos concurrentes esperan y se aplican sobre lo reconstruido
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {VentaDiaria._meta.db_table}, {VentaDiariaProducto._meta.db_table} '
+                    'IN SHARE ROW EXCLUSIVE MODE'
+                )
+
+        dias = [
+            VentaDiaria(**fila)
+            for fila in pedidos.values('dia', 'estado_pedido')
+            .annotate(pedidos=Count('id'), monto=Sum('total_pedido')).order_by()
+        ]
+        productos = [
+            VentaDiariaProducto(
+                dia=fila['dia'],
+                estado_pedido=fila['pedido__estado_pedido'],
+                producto_id=fila['producto_id'],
+                categoria_id=fila['producto__categoria_id'],
+                unidades=fila['unidades'],
+                monto=fila['monto'],
+            )
+            for fila in detalles.values('dia', 'pedido__estado_pedido', 'producto_id', 'producto__categoria_id')
+            .annotate(unidades=Sum('cantidad'), monto=Sum(_MONTO_LINEA)).order_by()
+        ]
+
+        for resumen in resumenes:
+            resumen.delete()
+        VentaDiaria.objects.bulk_create(dias, batch_size=1000)
+        VentaDiariaProducto.objects.bulk_create(productos, batch_size=1000)
+    return len(dias), len(productos)
@@ -0,0 +1,61 @@
+# miapp/seguimiento.py
+"""
+Seguimiento de pedidos sin cuenta (invitados).
+
+Un pedido se encuentra por id + correo, número de seguimiento + correo o por
+el token del enlace enviado en la confirmación. Cada forma es una consulta por
+índice: la clave primaria, (LOWER(correo_cliente), numero_seguimiento) o el
+hash único del token. Las respuestas se cachean unos segundos para que los
+reintentos y recargas no lleguen a la base.
+"""
+import hashlib
+import json
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import Lower
+
+from .models import Pedido
+
+
+def hash_token_seguimiento(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def generar_token_seguimiento():
+    """Retorna (token, hash). Solo el hash se guarda en el pedido"""
+    token = secrets.token_urlsafe(24)
+    return token, hash_token_seguimiento(token)
+
+
+def buscar_pedido(pedido_id=None, numero_seguimiento=None, correo=None, token=None):
+    """Retorna el pedido (con detalles precargados) o None si no calza"""
+    pedidos = Pedido.objects.con_detalles()
+    if token:
+        return pedidos.filter(token_seguimiento_hash=hash_token_seguimiento(token)).first()
+
+    if not correo or not (pedido_id or numero_seguimiento):
+        return None
+    # Mismo LOWER() que el índice pedidos_correo_seguim_idx
+    pedidos = pedidos.alias(correo_normalizado=Lower('correo_cliente')).filter(
+        correo_normalizado=correo.strip().lower()
+    )
+    if pedido_id:
+        return pedidos.filter(pk=pedido_id).first()
+    return pedidos.filter(numero_seguimiento=numero_seguimiento.strip()).order_by('-fecha_pedido').first()
+
+
+def consultar_seguimiento(serializar, **criterios):
+    """
+    Datos de seguimiento cacheados por `SEGUIMIENTO_CACHE_SEGUNDOS`; None si
+    no hay pedido (también se cachea, para que insistir no llegue a la base).
+    """
+    huella = hashlib.sha256(json.dumps(criterios, sort_keys=True, default=str).encode()).hexdigest()
+    clave = f'seguimiento:{huella}'
+    datos = cache.get(clave)
+    if datos is None:
+        pedido = buscar_pedido(**criterios)
+        datos = dict(serializar(pedido)) if pedido else {}
+        cache.set(clave, datos, getattr(settings, 'SEGUIMIENTO_CACHE_SEGUNDOS', 30))
+    return datos or None
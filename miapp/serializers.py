@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework import exceptions 
 from .models import Cliente, Producto, Categoria, Oferta, Pedido, DetallePedido
+from .inventario import stock_actual
 from django.utils import timezone
 from django.templatetags.static import static
 
@@ -176,6 +177,7 @@ class ProductoSerializer(serializers.ModelSerializer):
     ofertas_activas = serializers.SerializerMethodField()
     precio_final = serializers.SerializerMethodField()
     tiene_oferta = serializers.SerializerMethodField()
+    stock_disponible = serializers.SerializerMethodField()
     
     class Meta:
         model = Producto
@@ -199,6 +201,10 @@ class ProductoSerializer(serializers.ModelSerializer):
             'imagen': {'write_only': True}
         }
     
+    def get_stock_disponible(self, obj):
+        """Stock real (incluye los fragmentos) si la vista lo anotó"""
+        return getattr(obj, 'stock_real', obj.stock_disponible)
+    
     def get_imagen_url(self, obj):
         """
         Retorna la URL completa de la imagen usando static()
@@ -262,6 +268,7 @@ class ProductoListSerializer(serializers.ModelSerializer):
     descuento_porcentaje = serializers.SerializerMethodField()
     ahorro = serializers.SerializerMethodField()
     categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
+    stock_disponible = serializers.SerializerMethodField()
     
     class Meta:
         model = Producto
@@ -280,6 +287,10 @@ class ProductoListSerializer(serializers.ModelSerializer):
             'activo'
         ]
     
+    def get_stock_disponible(self, obj):
+        """Stock real (incluye los fragmentos) si la vista lo anotó"""
+        return getattr(obj, 'stock_real', obj.stock_disponible)
+    
     def get_imagen_url(self, obj):
         """
         Retorna la URL de la imagen usando static()
@@ -382,9 +393,10 @@ class CarritoItemSerializer(serializers.Serializer):
         
         try:
             producto = Producto.objects.get(pk=producto_id)
-            if cantidad > producto.stock_disponible:
+            disponible = stock_actual([producto.id])[producto.id]
+            if cantidad > disponible:
                 raise serializers.ValidationError({
-                    'cantidad': f'Stock insuficiente. Solo hay {producto.stock_disponible} unidades disponibles.'
+                    'cantidad': f'Stock insuficiente. Solo hay {disponible} unidades disponibles.'
                 })
         except Producto.DoesNotExist:
             raise serializers.ValidationError({'producto_id': 'El producto no existe.'})
@@ -392,6 +404,37 @@ class CarritoItemSerializer(serializers.Serializer):
         return data
 
 
+class CarritoOperacionSerializer(serializers.Serializer):
+    """Serializer para una operación dentro de un lote de cambios del carrito"""
+    ACCIONES = [
+        ('add', 'Agregar'),
+        ('set', 'Fijar cantidad'),
+        ('remove', 'Eliminar'),
+    ]
+    
+    accion = serializers.ChoiceField(choices=ACCIONES)
+    producto_id = serializers.IntegerField()
+    cantidad = serializers.IntegerField(min_value=1, required=False)
+    
+    def validate(self, data):
+        """Valida que 'set' indique cantidad y asigna 1 por defecto a 'add'"""
+        if data['accion'] == 'set' and 'cantidad' not in data:
+            raise serializers.ValidationError({
+                'cantidad': 'La cantidad es obligatoria para la acción "set".'
+            })
+        if data['accion'] == 'add':
+            data.setdefault('cantidad', 1)
+        return data
+
+
+class CarritoLoteSerializer(serializers.Serializer):
+    """
+    Serializer para PATCH /api/cart: lista de operaciones a aplicar en bloque.
+    No consulta la base de datos; el stock se valida en la vista con una sola query.
+    """
+    operaciones = CarritoOperacionSerializer(many=True, allow_empty=False, max_length=100)
+
+
 class CarritoSerializer(serializers.Serializer):
     """Serializer para el carrito completo"""
     items = CarritoItemSerializer(many=True)
@@ -513,9 +556,12 @@ class PedidoSerializer(serializers.ModelSerializer):
 
 
 class PedidoListSerializer(serializers.ModelSerializer):
-    """Serializer simplificado para listar pedidos"""
+    """
+    Serializer simplificado para listar pedidos.
+    Espera el queryset anotado con `Pedido.objects.con_cantidad_items()`.
+    """
     estado_display = serializers.CharField(source='get_estado_pedido_display', read_only=True)
-    cantidad_items = serializers.SerializerMethodField()
+    cantidad_items = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Pedido
@@ -527,10 +573,47 @@ class PedidoListSerializer(serializers.ModelSerializer):
             'estado_display',
             'cantidad_items'
         ]
+
+
+class SeguimientoConsultaSerializer(serializers.Serializer):
+    """Datos para buscar un pedido sin cuenta: id o número de seguimiento + correo, o token"""
+    pedido = serializers.IntegerField(source='pedido_id', required=False, min_value=1)
+    numero_seguimiento = serializers.CharField(required=False, max_length=100)
+    correo = serializers.EmailField(required=False)
+    token = serializers.CharField(required=False, max_length=64)
     
-    def get_cantidad_items(self, obj):
-        """Cuenta la cantidad total de items en el pedido"""
-        return sum(detalle.cantidad for detalle in obj.detalles.all())
+    def validate(self, data):
+        if data.get('token'):
+            return {'token': data['token']}
+        if data.get('correo') and (data.get('pedido_id') or data.get('numero_seguimiento')):
+            return data
+        raise serializers.ValidationError(
+            'Indica el número de pedido o de seguimiento junto con tu correo.'
+        )
+
+
+class SeguimientoPedidoSerializer(serializers.ModelSerializer):
+    """Estado del pedido para el cliente, sin sus datos de contacto"""
+    estado_display = serializers.CharField(source='get_estado_pedido_display', read_only=True)
+    detalles = DetallePedidoSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Pedido
+        fields = [
+            'id',
+            'fecha_pedido',
+            'estado_pedido',
+            'estado_display',
+            'total_pedido',
+            'metodo_pago',
+            'numero_seguimiento',
+            'fecha_pago',
+            'fecha_envio',
+            'fecha_entrega',
+            'comuna',
+            'region',
+            'detalles'
+        ]
 
 
 # ===== SERIALIZER PARA ACTUALIZAR PERFIL =====
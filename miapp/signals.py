@@ -0,0 +1,64 @@
+# miapp/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .catalogo import incrementar_version_catalogo
+from .correos import encolar_correos_cambio_estado
+from .eventos import publicar_cambios_estado
+from .inventario import reponer_stock_pedidos
+from .autenticacion import olvidar_estado_cliente
+from .models import Producto, Oferta, Categoria, Pedido, Cliente
+from .resumenes import mover_pedidos
+
+# Enviada por PedidoQuerySet.cambiar_estado dentro de la transacción del UPDATE.
+# cambios: [(pedido_id, estado_anterior)], estado_nuevo: str
+pedidos_cambiaron_estado = Signal()
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Oferta)
+@receiver(post_delete, sender=Oferta)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_version_catalogo(sender, update_fields=None, **kwargs):
+    """Cambios de precios, ofertas o disponibilidad invalidan los resúmenes de carrito"""
+    # Los movimientos de stock no cambian precios ni totales
+    if update_fields is not None and set(update_fields) <= {'stock_disponible'}:
+        return
+    incrementar_version_catalogo()
+
+
+@receiver(pedidos_cambiaron_estado, sender=Pedido)
+def reponer_stock_cancelados(sender, cambios, estado_nuevo, **kwargs):
+    """Los pedidos cancelados devuelven su stock (descontado en el checkout)"""
+    if estado_nuevo == 'cancelado':
+        reponer_stock_pedidos([pedido_id for pedido_id, _ in cambios])
+
+
+@receiver(pedidos_cambiaron_estado, sender=Pedido)
+def notificar_cambio_estado(sender, cambios, estado_nuevo, **kwargs):
+    """Encola en un solo lote el aviso al cliente de cada pedido que cambió"""
+    encolar_correos_cambio_estado([pedido_id for pedido_id, _ in cambios])
+
+
+@receiver(pedidos_cambiaron_estado, sender=Pedido)
+def publicar_estado_en_vivo(sender, cambios, estado_nuevo, **kwargs):
+    """Avisa a los clientes conectados por SSE (ver miapp/eventos.py)"""
+    publicar_cambios_estado(cambios, estado_nuevo)
+
+
+@receiver(pedidos_cambiaron_estado, sender=Pedido)
+def actualizar_resumenes_ventas(sender, cambios, estado_nuevo, **kwargs):
+    """Traslada los pedidos al nuevo estado en los resúmenes diarios del dashboard"""
+    mover_pedidos(cambios, estado_nuevo)
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def olvidar_version_token(sender, instance, **kwargs):
+    """La próxima request con JWT de este cliente relee su versión y estado"""
+    olvidar_estado_cliente(instance.pk)
+    # Y otra vez al confirmar, por si otra request cacheó el valor anterior entretanto
+    transaction.on_commit(lambda: olvidar_estado_cliente(instance.pk))
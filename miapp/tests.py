@@ -1,9 +1,37 @@
 # tests.py - COMPLETO Y CORREGIDO
 
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.core.management import call_command, CommandError
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.db.models import F, ProtectedError
 from django.contrib.auth import get_user_model
-from .models import Producto, Categoria, Pedido, DetallePedido
+from django.utils import timezone
+from datetime import timedelta
+from .models import (
+    Producto, Categoria, Pedido, DetallePedido, Oferta, ReservaStock, CorreoSaliente,
+    MovimientoInventario, FragmentoStock, VentaDiaria, VentaDiariaProducto, ClienteRFM, CohorteMensual,
+    ReposicionProducto
+)
+from .inventario import liberar_reservas_vencidas, activar_fragmentos, compactar_inventario, stock_actual
+from .eventos import broker, flujo_eventos
+from .seguimiento import generar_token_seguimiento
+from .resumenes import registrar_pedidos_nuevos
+from .paginacion import PaginadorEstimado
+from .particiones import crear_particiones_futuras, estado_particiones
+from .analitica import calcular_analitica_clientes
+from .reposicion import calcular_reposicion
+from . import exportacion
+from .autenticacion import TokenCliente
+from .correos import ProveedorFalso, procesar_pendientes, encolar_correos, construir_correo_password_reset
 import json
+from io import StringIO
+from asgiref.sync import async_to_sync, sync_to_async
+from unittest import mock, skipUnless
+from rest_framework.throttling import ScopedRateThrottle
+from rest_framework_simplejwt.tokens import RefreshToken
 
 User = get_user_model()
 
@@ -112,4 +140,1317 @@ class TestsCriticos(TestCase):
         )
         
         # Debe fallar (400 o 404)
-        self.assertIn(response.status_code, [400, 404, 422])
\ No newline at end of file
+        self.assertIn(response.status_code, [400, 404, 422])
+
+class CarritoLoteTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Lote', activa=True)
+        self.tomate = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=10,
+            categoria=self.categoria
+        )
+        self.lechuga = Producto.objects.create(
+            nombre='Lechuga',
+            descripcion='Lechuga de prueba',
+            precio_unitario=800,
+            stock_disponible=3,
+            categoria=self.categoria
+        )
+    
+    def patch_carrito(self, operaciones):
+        return self.client.patch('/api/cart/',
+            data=json.dumps({'operaciones': operaciones}),
+            content_type='application/json'
+        )
+    
+    def test_lote_aplica_todas_las_operaciones(self):
+        """Verifica que add/set/remove se aplican en una sola llamada"""
+        response = self.patch_carrito([
+            {'accion': 'add', 'producto_id': self.tomate.id, 'cantidad': 2},
+            {'accion': 'add', 'producto_id': self.tomate.id, 'cantidad': 1},
+            {'accion': 'set', 'producto_id': self.lechuga.id, 'cantidad': 3},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['carrito']['cantidad_items'], 6)
+        
+        response = self.patch_carrito([
+            {'accion': 'remove', 'producto_id': self.lechuga.id},
+        ])
+        self.assertEqual(response.json()['carrito']['cantidad_items'], 3)
+    
+    def test_lote_con_error_no_modifica_carrito(self):
+        """Si una operación excede el stock, ninguna se aplica"""
+        response = self.patch_carrito([
+            {'accion': 'add', 'producto_id': self.tomate.id, 'cantidad': 2},
+            {'accion': 'set', 'producto_id': self.lechuga.id, 'cantidad': 4},
+        ])
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.json()['cantidad_items'], 0)
+
+
+class CarritoResumenTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Resumen', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=10,
+            categoria=self.categoria
+        )
+        self.client.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': 2}),
+            content_type='application/json'
+        )
+    
+    def test_resumen_sin_consultar_productos(self):
+        """El resumen se sirve desde la sesión (solo la query de la sesión)"""
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/summary/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'cantidad_items': 2, 'total': '2000.00'})
+        
+        # Con el mismo ETag se responde 304
+        etag = response['ETag']
+        response = self.client.get('/api/cart/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        # Lista de etiquetas y etiqueta débil; una subcadena del ETag no coincide
+        for cabecera, codigo in [(f'"otro", W/{etag}', 304), ('*', 304), (etag[:-3] + '"', 200), (f'x{etag}x', 200)]:
+            response = self.client.get('/api/cart/summary/', HTTP_IF_NONE_MATCH=cabecera)
+            self.assertEqual(response.status_code, codigo, cabecera)
+    
+    def test_resumen_se_recalcula_si_cambia_catalogo(self):
+        """Un cambio de precio invalida el resumen guardado"""
+        etag = self.client.get('/api/cart/summary/')['ETag']
+        
+        self.producto.precio_unitario = 1500
+        self.producto.save()
+        
+        response = self.client.get('/api/cart/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], '3000.00')
+
+
+@override_settings(RESERVAS_STOCK_ACTIVAS=True)
+class ReservasStockTests(TestCase):
+    
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre='Reservas', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=10,
+            categoria=self.categoria
+        )
+        self.comprador_a = Client()
+        self.comprador_b = Client()
+    
+    def agregar(self, cliente, cantidad):
+        return cliente.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': cantidad}),
+            content_type='application/json'
+        )
+    
+    def test_reserva_descuenta_stock_disponible_para_otros(self):
+        """Lo reservado por un carrito no está disponible para otro"""
+        self.assertEqual(self.agregar(self.comprador_a, 8).status_code, 200)
+        self.assertEqual(self.agregar(self.comprador_b, 3).status_code, 400)
+        
+        # Al vencer la reserva, el barrido la libera y el stock vuelve a estar disponible
+        ReservaStock.objects.update(expira_en=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(liberar_reservas_vencidas(), 1)
+        self.assertEqual(self.agregar(self.comprador_b, 3).status_code, 200)
+    
+    def test_checkout_confirma_reserva(self):
+        """El checkout descuenta el stock y elimina la reserva"""
+        self.agregar(self.comprador_a, 4)
+        
+        response = self.comprador_a.post('/api/checkout/',
+            data=json.dumps({
+                'nombre_cliente': 'Invitado',
+                'correo_cliente': 'invitado@test.com',
+                'telefono_cliente': '912345678',
+                'direccion': 'Calle 123',
+                'region': 'Metropolitana',
+                'comuna': 'Santiago',
+            }),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 6)
+        self.assertFalse(ReservaStock.objects.exists())
+
+
+DATOS_CHECKOUT = {
+    'nombre_cliente': 'Invitado',
+    'correo_cliente': 'invitado@test.com',
+    'telefono_cliente': '912345678',
+    'direccion': 'Calle 123',
+    'region': 'Metropolitana',
+    'comuna': 'Santiago',
+}
+
+
+class CheckoutStockTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Checkout', activa=True)
+        self.tomate = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=5,
+            categoria=self.categoria
+        )
+        self.lechuga = Producto.objects.create(
+            nombre='Lechuga',
+            descripcion='Lechuga de prueba',
+            precio_unitario=800,
+            stock_disponible=5,
+            categoria=self.categoria
+        )
+        self.client.patch('/api/cart/',
+            data=json.dumps({'operaciones': [
+                {'accion': 'add', 'producto_id': self.tomate.id, 'cantidad': 2},
+                {'accion': 'add', 'producto_id': self.lechuga.id, 'cantidad': 3},
+            ]}),
+            content_type='application/json'
+        )
+    
+    def checkout(self):
+        return self.client.post('/api/checkout/',
+            data=json.dumps(DATOS_CHECKOUT),
+            content_type='application/json'
+        )
+    
+    def test_checkout_descuenta_stock_y_crea_detalles(self):
+        """El checkout crea todos los detalles y descuenta el stock de cada producto"""
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.detalles.count(), 2)
+        self.tomate.refresh_from_db()
+        self.lechuga.refresh_from_db()
+        self.assertEqual(self.tomate.stock_disponible, 3)
+        self.assertEqual(self.lechuga.stock_disponible, 2)
+    
+    def test_checkout_sin_stock_no_crea_pedido(self):
+        """Si un producto se queda sin stock, la transacción completa se revierte"""
+        Producto.objects.filter(pk=self.lechuga.pk).update(stock_disponible=1)
+        
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Pedido.objects.exists())
+        self.tomate.refresh_from_db()
+        self.assertEqual(self.tomate.stock_disponible, 5)
+
+
+@override_settings(EMAIL_PROVEEDOR='fake', CORREOS_MAX_INTENTOS=2)
+class CorreosSalientesTests(TestCase):
+    
+    def setUp(self):
+        ProveedorFalso.enviados.clear()
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Correos', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=5,
+            categoria=self.categoria
+        )
+        self.client.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': 1}),
+            content_type='application/json'
+        )
+    
+    def test_checkout_encola_correos_sin_enviarlos(self):
+        """El checkout solo encola; el worker los entrega"""
+        response = self.client.post('/api/checkout/',
+            data=json.dumps(DATOS_CHECKOUT),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CorreoSaliente.objects.filter(estado='pendiente').count(), 2)
+        self.assertEqual(ProveedorFalso.enviados, [])
+        
+        self.assertEqual(procesar_pendientes(concurrencia=2), (2, 0))
+        self.assertEqual(len(ProveedorFalso.enviados), 2)
+        self.assertEqual(CorreoSaliente.objects.filter(estado='enviado').count(), 2)
+        # El enlace de seguimiento del invitado se entregó pero no queda guardado
+        self.assertTrue(any('/seguimiento/' in (correo['html'] or '') for correo in ProveedorFalso.enviados))
+        self.assertEqual(CorreoSaliente.objects.get(tipo='confirmacion_pedido').html, '')
+    
+    def test_reintentos_con_backoff(self):
+        """Un error programa un reintento y al agotar los intentos queda fallido"""
+        class ProveedorCaido:
+            def enviar(self, correo):
+                raise ConnectionError('proveedor caído')
+        
+        encolar_correos([construir_correo_password_reset('a@test.com', 'http://x/reset/')])
+        
+        self.assertEqual(procesar_pendientes(proveedor=ProveedorCaido()), (0, 1))
+        correo = CorreoSaliente.objects.get()
+        self.assertEqual(correo.estado, 'pendiente')
+        self.assertGreater(correo.proximo_intento, timezone.now())
+        
+        CorreoSaliente.objects.update(proximo_intento=timezone.now())
+        procesar_pendientes(proveedor=ProveedorCaido())
+        correo.refresh_from_db()
+        self.assertEqual(correo.estado, 'fallido')
+        self.assertEqual(correo.intentos, 2)
+        # El enlace de restablecimiento no queda guardado
+        self.assertEqual(correo.html, '')
+    
+    def test_enlace_de_restablecimiento_no_queda_en_la_bandeja(self):
+        """El correo se entrega con el enlace y luego se borra su contenido"""
+        encolar_correos([construir_correo_password_reset('a@test.com', 'http://x/reset/abc/')])
+        procesar_pendientes()
+        
+        self.assertIn('http://x/reset/abc/', ProveedorFalso.enviados[-1]['html'])
+        correo = CorreoSaliente.objects.get()
+        self.assertEqual((correo.estado, correo.html), ('enviado', ''))
+        
+        admin = User.objects.create_superuser(correo='bandeja@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        respuesta = self.client.get(f'/admin/miapp/correosaliente/{correo.pk}/change/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotContains(respuesta, 'name="html"')
+
+
+class CheckoutIdempotenciaTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Idempotencia', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=5,
+            categoria=self.categoria
+        )
+        self.client.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': 2}),
+            content_type='application/json'
+        )
+    
+    def checkout(self, clave, datos=DATOS_CHECKOUT):
+        return self.client.post('/api/checkout/',
+            data=json.dumps(datos),
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=clave
+        )
+    
+    def test_reintento_retorna_el_mismo_pedido(self):
+        """Repetir la solicitud con la misma clave no crea otro pedido ni descuenta stock"""
+        primera = self.checkout('clave-1')
+        segunda = self.checkout('clave-1')
+        
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(primera.json()['pedido']['id'], segunda.json()['pedido']['id'])
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 3)
+    
+    def test_clave_reutilizada_con_otros_datos(self):
+        """La misma clave con otro contenido se rechaza"""
+        self.checkout('clave-2')
+        response = self.checkout('clave-2', dict(DATOS_CHECKOUT, comuna='Providencia'))
+        self.assertEqual(response.status_code, 422)
+    
+    def test_clave_acotada_a_la_sesion(self):
+        """Otro cliente con la misma clave y el mismo carrito obtiene su propio pedido"""
+        primera = self.checkout('clave-3')
+        self.client = Client()
+        self.client.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': 2}),
+            content_type='application/json'
+        )
+        segunda = self.checkout('clave-3')
+        
+        self.assertEqual(segunda.status_code, 201)
+        self.assertFalse(segunda.has_header('Idempotent-Replayed'))
+        self.assertNotEqual(primera.json()['pedido']['id'], segunda.json()['pedido']['id'])
+
+
+class InventarioMovimientosTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Inventario', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=10,
+            categoria=self.categoria
+        )
+    
+    def agregar(self, cantidad):
+        return self.client.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': cantidad}),
+            content_type='application/json'
+        )
+    
+    def comprar(self, cantidad):
+        self.agregar(cantidad)
+        return self.client.post('/api/checkout/',
+            data=json.dumps(DATOS_CHECKOUT),
+            content_type='application/json'
+        )
+    
+    def test_venta_y_reposicion_quedan_en_el_libro(self):
+        """Las ventas y reposiciones registran movimientos ya aplicados al stock"""
+        self.assertEqual(self.comprar(3).status_code, 201)
+        self.producto.aumentar_stock(5)
+        
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 12)
+        movimientos = list(MovimientoInventario.objects.order_by('id').values_list('tipo', 'cantidad', 'compactado'))
+        self.assertEqual(movimientos, [('venta', -3, True), ('reposicion', 5, True)])
+    
+    def test_producto_fragmentado_se_compacta(self):
+        """Las ventas de un producto fragmentado descuentan fragmentos y se compactan después"""
+        activar_fragmentos(self.producto.id, 4)
+        self.assertEqual(FragmentoStock.objects.filter(producto=self.producto).count(), 4)
+        
+        self.assertEqual(self.comprar(3).status_code, 201)
+        # Un fragmento tiene 3 unidades: la venta de 4 reparte entre varios fragmentos
+        self.assertEqual(self.comprar(4).status_code, 201)
+        self.assertEqual(self.comprar(4).status_code, 400)
+        
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 10)
+        self.assertEqual(stock_actual([self.producto.id])[self.producto.id], 3)
+        
+        self.assertEqual(compactar_inventario(), 2)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 3)
+        self.assertFalse(MovimientoInventario.objects.filter(compactado=False).exists())
+        cantidades = sorted(FragmentoStock.objects.values_list('cantidad', flat=True))
+        self.assertEqual(cantidades, [0, 1, 1, 1])
+    
+    def test_carrito_limita_con_el_stock_de_los_fragmentos(self):
+        """Tras vender de un producto fragmentado, el carrito y el admin ven el stock real"""
+        activar_fragmentos(self.producto.id, 4)
+        self.assertEqual(self.comprar(7).status_code, 201)
+        
+        self.assertEqual(self.agregar(4).status_code, 400)
+        respuesta = self.agregar(3)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['carrito']['items'][0]['stock_disponible'], 3)
+        
+        respuesta = self.client.put(f'/api/cart/{self.producto.id}/',
+            data=json.dumps({'cantidad': 4}), content_type='application/json'
+        )
+        self.assertContains(respuesta, 'Solo hay 3 unidades', status_code=400)
+        respuesta = self.client.patch('/api/cart/',
+            data=json.dumps({'operaciones': [{'accion': 'set', 'producto_id': self.producto.id, 'cantidad': 4}]}),
+            content_type='application/json'
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        
+        respuesta = self.client.get('/api/public/products/')
+        self.assertEqual(respuesta.json()[0]['stock_disponible'], 3)
+        admin = User.objects.create_superuser(correo='fragmentos@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        self.assertContains(self.client.get('/admin/miapp/producto/'), '⚠ 3 unidades')
+    
+    def test_producto_con_movimientos_se_puede_eliminar(self):
+        """Los movimientos no bloquean la eliminación; las ventas sí"""
+        self.producto.aumentar_stock(5)
+        self.producto.delete()
+        self.assertFalse(MovimientoInventario.objects.exists())
+        
+        vendido = Producto.objects.create(
+            nombre='Papa', descripcion='Papa de prueba', precio_unitario=1000,
+            stock_disponible=10, categoria=self.categoria
+        )
+        self.producto = vendido
+        self.assertEqual(self.comprar(1).status_code, 201)
+        with self.assertRaises(ProtectedError):
+            vendido.delete()
+
+
+@override_settings(CHECKOUT_ESTRATEGIA='optimista', CHECKOUT_REINTENTOS=2, CHECKOUT_BACKOFF_MS=0)
+class CheckoutOptimistaTests(TestCase):
+    
+    def setUp(self):
+        self.client = Client()
+        self.categoria = Categoria.objects.create(nombre='Optimista', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=10,
+            categoria=self.categoria
+        )
+        self.client.post('/api/cart/',
+            data=json.dumps({'producto_id': self.producto.id, 'cantidad': 2}),
+            content_type='application/json'
+        )
+    
+    def checkout_con_escrituras_concurrentes(self, veces):
+        """Simula otro checkout que vende 1 unidad justo antes de cada UPDATE versionado"""
+        restantes = [veces]
+        
+        def otro_checkout(execute, sql, params, many, context):
+            if restantes[0] and sql.startswith('UPDATE "productos"') and '"version" = %s' in sql:
+                restantes[0] -= 1
+                Producto.objects.filter(pk=self.producto.pk).update(
+                    stock_disponible=F('stock_disponible') - 1, version=F('version') + 1
+                )
+            return execute(sql, params, many, context)
+        
+        with connection.execute_wrapper(otro_checkout):
+            return self.client.post('/api/checkout/',
+                data=json.dumps(DATOS_CHECKOUT),
+                content_type='application/json'
+            )
+    
+    def test_reintenta_ante_conflicto_de_version(self):
+        """Si la versión cambió, el checkout relee el producto y reintenta"""
+        with self.assertLogs('miapp.inventario', level='INFO') as logs:
+            response = self.checkout_con_escrituras_concurrentes(1)
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('Conflicto de versión', logs.output[0])
+        # La escritura simulada ocurre dentro del savepoint del intento fallido y se deshace con él
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 8)
+        self.assertEqual(self.producto.version, 1)
+    
+    def test_agota_reintentos(self):
+        """Tras agotar los reintentos responde 409 sin crear el pedido"""
+        response = self.checkout_con_escrituras_concurrentes(3)
+        
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Pedido.objects.count(), 0)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 10)
+
+
+class MisPedidosPaginacionTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(correo='cliente@test.com', nombre='Cliente', password='test123')
+        categoria = Categoria.objects.create(nombre='Historial', activa=True)
+        producto = Producto.objects.create(
+            nombre='Tomate',
+            descripcion='Tomate de prueba',
+            precio_unitario=1000,
+            stock_disponible=10,
+            categoria=categoria
+        )
+        for cantidad in (1, 2, 3):
+            pedido = Pedido.objects.create(usuario=self.user, total_pedido=1000 * cantidad, **DATOS_CHECKOUT)
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=cantidad, precio_compra=1000)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_paginas_por_cursor_con_cantidad_anotada(self):
+        """Cada página trae la cantidad de items anotada, sin consultas por pedido"""
+        with self.assertNumQueries(2):
+            primera = self.client.get('/api/mis-pedidos/', {'page_size': 2}).json()
+        
+        self.assertEqual([p['cantidad_items'] for p in primera['results']], [3, 2])
+        segunda = self.client.get(primera['next']).json()
+        self.assertEqual([p['cantidad_items'] for p in segunda['results']], [1])
+        self.assertIsNone(segunda['next'])
+
+
+class PedidoDetallesPrecargadosTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(correo='detalle@test.com', nombre='Cliente', password='test123')
+        categoria = Categoria.objects.create(nombre='Detalle', activa=True)
+        self.pedido = Pedido.objects.create(usuario=self.user, total_pedido=5000, **DATOS_CHECKOUT)
+        for i in range(5):
+            producto = Producto.objects.create(
+                nombre=f'Producto {i}',
+                descripcion='Producto de prueba',
+                precio_unitario=1000,
+                stock_disponible=10,
+                categoria=categoria
+            )
+            DetallePedido.objects.create(pedido=self.pedido, producto=producto, cantidad=1, precio_compra=1000)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_detalle_api_en_consultas_constantes(self):
+        """El detalle de un pedido no hace una consulta por producto"""
+        # usuario (JWT) + pedido + detalles con producto
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/pedidos/{self.pedido.id}/')
+        
+        self.assertEqual(len(response.json()['detalles']), 5)
+        self.assertEqual(response.json()['detalles'][0]['producto_nombre'], 'Producto 0')
+
+
+class ParticionesPedidosTests(TestCase):
+    
+    def test_detalle_copia_fecha_del_pedido(self):
+        """Los detalles guardan la fecha del pedido (clave de partición)"""
+        categoria = Categoria.objects.create(nombre='Particiones', activa=True)
+        producto = Producto.objects.create(
+            nombre='Tomate', descripcion='Tomate de prueba', precio_unitario=1000,
+            stock_disponible=10, categoria=categoria
+        )
+        pedido = Pedido.objects.create(total_pedido=1000, **DATOS_CHECKOUT)
+        detalle = DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=1, precio_compra=1000)
+        
+        self.assertEqual(detalle.fecha_pedido, pedido.fecha_pedido)
+    
+    def test_comando_requiere_postgresql(self):
+        """En SQLite el comando falla con un mensaje claro en vez de ejecutar DDL"""
+        if connection.vendor == 'postgresql':
+            self.skipTest('Solo aplica a motores sin particionamiento')
+        with self.assertRaisesMessage(CommandError, 'requiere PostgreSQL'):
+            call_command('particionar_pedidos', 'estado')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'El particionamiento requiere PostgreSQL')
+class ParticionesPostgresTests(TestCase):
+    """Ejecuta el DDL real de particionar_pedidos; la transacción del test lo revierte"""
+    
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Particiones PG', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Tomate', descripcion='Tomate de prueba', precio_unitario=1000,
+            stock_disponible=10, categoria=categoria
+        )
+        self.pedido = Pedido.objects.create(total_pedido=1000, clave_idempotencia='clave-1', **DATOS_CHECKOUT)
+        DetallePedido.objects.create(pedido=self.pedido, producto=self.producto, cantidad=1, precio_compra=1000)
+        call_command('particionar_pedidos', 'convertir', '--meses-adelante', '1', stdout=StringIO())
+    
+    def restricciones(self, tabla, tipo):
+        """{nombre: [columnas ordenadas]} de las restricciones del tipo dado"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT conname, ARRAY(
+                    SELECT attname::text FROM pg_attribute
+                    WHERE attrelid = conrelid AND attnum = ANY(conkey) ORDER BY attname
+                )
+                FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = %s
+                """,
+                [tabla, tipo]
+            )
+            return {nombre: list(columnas) for nombre, columnas in cursor.fetchall()}
+    
+    def test_convierte_conservando_datos_y_secuencia(self):
+        estado = estado_particiones()
+        self.assertEqual(set(estado), {'pedidos', 'detalle_pedidos'})
+        self.assertIn('pedidos_default', [nombre for nombre, _, _ in estado['pedidos']])
+        self.assertEqual(crear_particiones_futuras(1), [])
+        
+        self.assertEqual(Pedido.objects.con_detalles().get(pk=self.pedido.pk).detalles.count(), 1)
+        nuevo = Pedido.objects.create(total_pedido=2000, **DATOS_CHECKOUT)
+        DetallePedido.objects.create(pedido=nuevo, producto=self.producto, cantidad=2, precio_compra=1000)
+        self.assertGreater(nuevo.pk, self.pedido.pk)
+    
+    def test_restricciones_coinciden_con_el_modelo(self):
+        """Las únicas de la tabla particionada son las que declara Pedido.Meta"""
+        self.assertEqual(list(self.restricciones('pedidos', 'p').values()), [['fecha_pedido', 'id']])
+        self.assertEqual(
+            self.restricciones('pedidos', 'u'),
+            {'pedidos_clave_idempotencia_uniq': ['clave_idempotencia', 'fecha_pedido']}
+        )
+    
+    def test_fk_compuesta_hacia_pedidos(self):
+        """detalle_pedidos mantiene su FK a pedidos a través de (pedido_id, fecha_pedido)"""
+        self.assertEqual(
+            self.restricciones('detalle_pedidos', 'f')['detalle_pedidos_pedido_fecha_fk'],
+            ['fecha_pedido', 'pedido_id']
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DetallePedido.objects.filter(pedido=self.pedido).update(fecha_pedido=F('fecha_pedido') - timedelta(days=40))
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class TransicionesMasivasTests(TestCase):
+    
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Transiciones', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Lechuga', descripcion='Lechuga de prueba', precio_unitario=1000,
+            stock_disponible=10, categoria=categoria
+        )
+        self.pedidos = []
+        for estado in ['pendiente_pago', 'pagado', 'enviado']:
+            pedido = Pedido.objects.create(total_pedido=2000, estado_pedido=estado, **DATOS_CHECKOUT)
+            DetallePedido.objects.create(pedido=pedido, producto=self.producto, cantidad=2, precio_compra=1000)
+            self.pedidos.append(pedido)
+    
+    def test_cancelar_repone_stock_y_encola_avisos(self):
+        """Cancelar en lote solo toca pedidos elegibles, repone su stock y encola un aviso por pedido"""
+        cancelados = Pedido.objects.filter(pk__in=[p.pk for p in self.pedidos]).cambiar_estado('cancelado')
+        
+        self.assertEqual(cancelados, 2)
+        self.assertEqual(Pedido.objects.get(pk=self.pedidos[2].pk).estado_pedido, 'enviado')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 14)
+        self.assertEqual(
+            MovimientoInventario.objects.filter(tipo='cancelacion', producto=self.producto).count(), 2
+        )
+        self.assertEqual(CorreoSaliente.objects.filter(tipo='cambio_estado').count(), 2)
+    
+    def test_transicion_no_permitida_lanza_error(self):
+        """marcar_como_* no ignora en silencio una transición inválida"""
+        enviado = self.pedidos[2]
+        with self.assertRaises(ValidationError):
+            enviado.cancelar()
+        with self.assertRaises(ValidationError):
+            self.pedidos[0].marcar_como_completado()
+        enviado.refresh_from_db()
+        self.assertEqual(enviado.estado_pedido, 'enviado')
+        self.assertEqual(CorreoSaliente.objects.filter(tipo='cambio_estado').count(), 0)
+    
+    def test_marcar_pagado_en_lote(self):
+        """La transición registra la fecha y no repone stock"""
+        actualizados = Pedido.objects.all().cambiar_estado('pagado')
+        
+        self.assertEqual(actualizados, 1)
+        pedido = Pedido.objects.get(pk=self.pedidos[0].pk)
+        self.assertEqual(pedido.estado_pedido, 'pagado')
+        self.assertIsNotNone(pedido.fecha_pago)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 10)
+
+
+class ExportacionVentasTests(TestCase):
+    
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Exportación', activa=True)
+        producto = Producto.objects.create(
+            nombre='Zanahoria', descripcion='Zanahoria de prueba', precio_unitario=1500,
+            stock_disponible=10, categoria=categoria
+        )
+        for estado in ['pagado', 'cancelado']:
+            pedido = Pedido.objects.create(total_pedido=3000, estado_pedido=estado, **DATOS_CHECKOUT)
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=2, precio_compra=1500)
+        admin = User.objects.create_superuser(correo='admin@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+    
+    def test_exporta_en_streaming_con_filtros(self):
+        """Una fila por línea de venta, filtrada por estado y fecha"""
+        hoy = timezone.localdate().isoformat()
+        response = self.client.get('/admin/exportar/ventas/', {'desde': hoy, 'hasta': hoy, 'estado': 'pagado'})
+        
+        self.assertTrue(response.streaming)
+        filas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(filas), 2)
+        self.assertTrue(filas[0].startswith('Pedido,Fecha,Estado'))
+        self.assertIn('pagado', filas[1])
+        self.assertIn('Zanahoria', filas[1])
+    
+    def test_formato_excel_y_fecha_invalida(self):
+        """El CSV para Excel lleva BOM y ';'; una fecha mal escrita es un 400"""
+        response = self.client.get('/admin/exportar/ventas/', {'formato': 'excel'})
+        contenido = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(contenido.startswith('\ufeffPedido;Fecha'))
+        self.assertIn('1500,00', contenido)
+        
+        response = self.client.get('/admin/exportar/ventas/', {'desde': '2025-13-01'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_textos_con_formula_se_escapan(self):
+        """Un dato del cliente que empieza con = no se evalúa al abrir el archivo"""
+        Pedido.objects.filter(estado_pedido='pagado').update(
+            nombre_cliente='=HYPERLINK("http://x","y")', direccion='+56 9 1234'
+        )
+        response = self.client.get('/admin/exportar/ventas/', {'formato': 'excel', 'estado': 'pagado'})
+        fila = b''.join(response.streaming_content).decode('utf-8').splitlines()[1]
+        
+        self.assertIn('''"'=HYPERLINK(""http://x"",""y"")"''', fila)
+        self.assertIn("'+56 9 1234", fila)
+        self.assertNotIn(';=', fila)
+    
+    @override_settings(EXPORTACION_LOTE=2)
+    def test_exporta_en_streaming_bajo_asgi(self):
+        """Bajo ASGI las filas llegan por lotes desde un generador asíncrono"""
+        pedido = Pedido.objects.get(estado_pedido='pagado')
+        for _ in range(3):
+            DetallePedido.objects.create(pedido=pedido, producto=pedido.detalles.first().producto, cantidad=1, precio_compra=1500)
+        admin = User.objects.get(correo='admin@test.com')
+        
+        async def descargar():
+            await self.async_client.aforce_login(admin)
+            response = await self.async_client.get('/admin/exportar/ventas/')
+            return response, [parte async for parte in response.streaming_content]
+        
+        with mock.patch('miapp.exportacion.lote_ventas', wraps=exportacion.lote_ventas) as lotes:
+            response, partes = async_to_sync(descargar)()
+        
+        self.assertTrue(response.is_async)
+        filas = b''.join(partes).decode().splitlines()
+        self.assertEqual(len(filas), 6)
+        # Mismo archivo que la descarga síncrona: los lotes no saltan ni repiten filas
+        self.assertEqual(filas, b''.join(self.client.get('/admin/exportar/ventas/').streaming_content).decode().splitlines())
+        # 5 filas de a 2: tres consultas
+        self.assertEqual(lotes.call_count, 3)
+    
+    def test_comando_exportar(self):
+        salida = StringIO()
+        call_command('exportar_ventas', '--estado', 'cancelado', stdout=salida)
+        self.assertEqual(len(salida.getvalue().splitlines()), 2)
+
+
+class BusquedaAdminTests(TestCase):
+    
+    def setUp(self):
+        from django.contrib.admin.sites import site
+        self.admin = site._registry[Pedido]
+        self.ana = Pedido.objects.create(
+            total_pedido=1000, **{**DATOS_CHECKOUT, 'nombre_cliente': 'Ana Pérez', 'correo_cliente': 'ana@test.com'}
+        )
+        self.luis = Pedido.objects.create(
+            total_pedido=1000, numero_seguimiento='CX1234567',
+            **{**DATOS_CHECKOUT, 'nombre_cliente': 'Luis Soto', 'correo_cliente': 'luis@test.com'}
+        )
+    
+    def buscar(self, termino):
+        queryset, duplicados = self.admin.get_search_results(None, Pedido.objects.all(), termino)
+        self.assertFalse(duplicados)
+        return set(queryset)
+    
+    def test_busqueda_por_texto_y_exacta(self):
+        """Palabras con AND sobre los campos de texto; #id y seguimiento por igualdad"""
+        self.assertEqual(self.buscar('ana pérez'), {self.ana})
+        self.assertEqual(self.buscar('SOTO'), {self.luis})
+        self.assertEqual(self.buscar(f'#{self.ana.id}'), {self.ana})
+        self.assertEqual(self.buscar('CX1234567'), {self.luis})
+        self.assertEqual(self.buscar('CX12'), set())
+    
+    def test_id_no_se_busca_como_texto(self):
+        """El id va por igualdad en la consulta, sin convertirlo a texto"""
+        sql = str(self.admin.get_search_results(None, Pedido.objects.all(), str(self.luis.id))[0].query)
+        self.assertIn(f'"pedidos"."id" = {self.luis.id}', sql)
+
+
+class EventosPedidosTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create_user(correo='eventos@test.com', nombre='Cliente', password='test123')
+        self.pedido = Pedido.objects.create(usuario=self.user, total_pedido=1000, **DATOS_CHECKOUT)
+    
+    def marcar_pagado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedido.marcar_como_pagado()
+    
+    def test_cambio_de_estado_llega_al_flujo(self):
+        """El cambio confirmado se entrega a la conexión SSE del dueño del pedido"""
+        async def escuchar():
+            flujo = flujo_eventos(self.user.id, latido=0.05)
+            self.assertTrue((await anext(flujo)).startswith('retry:'))
+            await sync_to_async(self.marcar_pagado)()
+            evento = await anext(flujo)
+            while evento.startswith(':'):
+                evento = await anext(flujo)
+            await flujo.aclose()
+            return evento
+        
+        evento = async_to_sync(escuchar)()
+        
+        self.assertTrue(evento.startswith('event: estado\n'))
+        datos = json.loads(evento.split('data: ', 1)[1])
+        self.assertEqual((datos['pedido'], datos['estado'], datos['anterior']), (self.pedido.id, 'pagado', 'pendiente_pago'))
+        self.assertEqual(broker.conectados(), 0)
+    
+    def test_requiere_autenticacion(self):
+        async def pedir():
+            sin_sesion = await self.async_client.get('/api/pedidos/eventos/')
+            con_token = await self.async_client.get(
+                '/api/pedidos/eventos/', {'token': str(RefreshToken.for_user(self.user).access_token)}
+            )
+            await self.async_client.aforce_login(self.user)
+            con_sesion = await self.async_client.get('/api/pedidos/eventos/')
+            return sin_sesion, con_token, con_sesion
+        
+        sin_sesion, con_token, con_sesion = async_to_sync(pedir)()
+        
+        self.assertEqual(sin_sesion.status_code, 401)
+        # El token en la URL ya no autentica
+        self.assertEqual(con_token.status_code, 401)
+        self.assertEqual(con_sesion.status_code, 200)
+        self.assertEqual(con_sesion['Content-Type'], 'text/event-stream')
+
+
+class SeguimientoInvitadosTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.token, hash_token = generar_token_seguimiento()
+        self.pedido = Pedido.objects.create(
+            total_pedido=1000, numero_seguimiento='CX998877', token_seguimiento_hash=hash_token,
+            **DATOS_CHECKOUT
+        )
+    
+    def consultar(self, **datos):
+        return self.client.post('/api/seguimiento/', datos, content_type='application/json')
+    
+    def test_busqueda_por_id_seguimiento_o_token(self):
+        """Cualquiera de las tres formas encuentra el pedido; el correo no distingue mayúsculas"""
+        for datos in [
+            {'pedido': self.pedido.id, 'correo': 'INVITADO@test.com'},
+            {'numero_seguimiento': 'CX998877', 'correo': 'invitado@test.com'},
+            {'token': self.token},
+        ]:
+            response = self.consultar(**datos)
+            self.assertEqual(response.status_code, 200, datos)
+            self.assertEqual(response.json()['id'], self.pedido.id)
+            self.assertNotIn('correo_cliente', response.json())
+        
+        self.assertEqual(self.consultar(pedido=self.pedido.id, correo='otro@test.com').status_code, 404)
+        self.assertEqual(self.consultar(pedido=self.pedido.id).status_code, 400)
+    
+    def test_respuesta_cacheada_y_limite(self):
+        """Repetir la consulta no vuelve a la base y el exceso de intentos responde 429"""
+        self.consultar(token=self.token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.consultar(token=self.token).status_code, 200)
+        
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'seguimiento': '2/min'}):
+            cache.clear()
+            estados = [self.consultar(token=self.token).status_code for _ in range(3)]
+        self.assertEqual(estados, [200, 200, 429])
+    
+    def test_enlace_del_correo(self):
+        response = self.client.get(f'/seguimiento/{self.token}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/seguimiento/no-existe/').status_code, 404)
+
+
+class ResumenesVentasTests(TestCase):
+    
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre='Resúmenes', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Acelga', descripcion='Acelga de prueba', precio_unitario=1000,
+            stock_disponible=10, categoria=self.categoria
+        )
+        self.pedidos = []
+        for _ in range(2):
+            pedido = Pedido.objects.create(total_pedido=3000, **DATOS_CHECKOUT)
+            DetallePedido.objects.create(pedido=pedido, producto=self.producto, cantidad=3, precio_compra=1000)
+            self.pedidos.append(pedido)
+        registrar_pedidos_nuevos([p.pk for p in self.pedidos])
+    
+    def resumen(self):
+        return (
+            {v.estado_pedido: (v.pedidos, int(v.monto)) for v in VentaDiaria.objects.filter(pedidos__gt=0)},
+            {v.estado_pedido: v.unidades for v in VentaDiariaProducto.objects.filter(unidades__gt=0)},
+        )
+    
+    def test_incremental_igual_a_reconstruido(self):
+        """Los cambios de estado trasladan los montos y coinciden con la reconstrucción"""
+        self.pedidos[0].marcar_como_pagado()
+        incremental = self.resumen()
+        
+        self.assertEqual(incremental[0], {'pendiente_pago': (1, 3000), 'pagado': (1, 3000)})
+        self.assertEqual(incremental[1], {'pendiente_pago': 3, 'pagado': 3})
+        self.assertEqual(VentaDiariaProducto.objects.first().categoria, self.categoria)
+        
+        call_command('reconstruir_resumenes', stdout=StringIO())
+        self.assertEqual(self.resumen(), incremental)
+    
+    def test_cambios_desde_el_admin(self):
+        """Crear o eliminar pedidos y editar líneas en el admin deja los resúmenes como la reconstrucción"""
+        admin = User.objects.create_superuser(correo='resumen@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        datos = {
+            'estado_pedido': 'pagado', 'metodo_pago': 'transferencia', 'total_pedido': 5000, 'usuario': '',
+            'nombre_cliente': 'Venta', 'correo_cliente': 'venta@test.com', 'telefono_cliente': '+56912345678',
+            'direccion': 'Calle 1', 'region': 'RM', 'comuna': 'Santiago',
+            'detalles-TOTAL_FORMS': 0, 'detalles-INITIAL_FORMS': 0,
+        }
+        self.assertEqual(self.client.post('/admin/miapp/pedido/add/', datos).status_code, 302)
+        
+        self.client.post('/admin/miapp/pedido/', {
+            'action': 'delete_selected', '_selected_action': [self.pedidos[0].pk], 'post': 'yes',
+        })
+        detalle = self.pedidos[1].detalles.get()
+        self.client.post(f'/admin/miapp/detallepedido/{detalle.pk}/change/', {
+            'pedido': self.pedidos[1].pk, 'producto': self.producto.pk, 'cantidad': 5, 'precio_compra': 1000,
+        })
+        incremental = self.resumen()
+        
+        self.assertFalse(Pedido.objects.filter(pk=self.pedidos[0].pk).exists())
+        self.assertEqual(incremental, ({'pendiente_pago': (1, 3000), 'pagado': (1, 5000)}, {'pendiente_pago': 5}))
+        call_command('reconstruir_resumenes', stdout=StringIO())
+        self.assertEqual(self.resumen(), incremental)
+    
+    def test_paneles_del_dashboard(self):
+        """La página no calcula métricas; cada panel es un JSON cacheado por rango"""
+        cache.clear()
+        self.pedidos[1].marcar_como_pagado()
+        admin = User.objects.create_superuser(correo='dash@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        hoy = timezone.localdate().isoformat()
+        
+        # sesión + usuario + últimos pedidos
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/admin/dashboard/').status_code, 200)
+        
+        ventas = self.client.get('/admin/dashboard/datos/ventas/', {'hasta': hoy}).json()
+        self.assertEqual(len(ventas['data']), 31)
+        self.assertEqual(ventas['data'][-1], 3000.0)
+        self.assertEqual(
+            self.client.get('/admin/dashboard/datos/indicadores/').json()['pedidos_pendientes'], 1
+        )
+        self.assertEqual(
+            self.client.get('/admin/dashboard/datos/productos/').json()['productos'],
+            [{'nombre': 'Acelga', 'total_vendido': 3}]
+        )
+        
+        # sesión + usuario; la métrica sale del cache
+        with self.assertNumQueries(2):
+            self.client.get('/admin/dashboard/datos/ventas/', {'hasta': hoy})
+        self.assertEqual(self.client.get('/admin/dashboard/datos/ventas/', {'desde': '2025-02-30'}).status_code, 400)
+        self.assertEqual(self.client.get('/admin/dashboard/datos/otra/').status_code, 404)
+
+
+class ChangelistsAdminTests(TestCase):
+    
+    def setUp(self):
+        admin = User.objects.create_superuser(correo='listas@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        self.categoria = Categoria.objects.create(nombre='Listados', activa=True)
+        self.agregar_filas()
+    
+    def agregar_filas(self, n=2):
+        ahora = timezone.now()
+        for _ in range(n):
+            categoria = Categoria.objects.create(nombre=f'Cat {Categoria.objects.count()}', activa=True)
+            producto = Producto.objects.create(
+                nombre=f'Prod {Producto.objects.count()}', descripcion='Listado', precio_unitario=1000,
+                stock_disponible=5, categoria=categoria
+            )
+            Oferta.objects.create(
+                producto=producto, precio_oferta=800, activa=True,
+                fecha_inicio=ahora - timedelta(days=1), fecha_fin=ahora + timedelta(days=1)
+            )
+            cliente = User.objects.create_user(
+                correo=f'c{User.objects.count()}@test.com', password='test123', nombre='Cliente'
+            )
+            pedido = Pedido.objects.create(total_pedido=2000, usuario=cliente, estado_pedido='pagado', **DATOS_CHECKOUT)
+            DetallePedido.objects.create(pedido=pedido, producto=producto, cantidad=2, precio_compra=1000)
+    
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(capturadas)
+    
+    def test_consultas_no_crecen_con_las_filas(self):
+        """Cada listado cuesta lo mismo con 3 o con 7 filas: nada se consulta por fila"""
+        urls = [
+            '/admin/miapp/categoria/', '/admin/miapp/cliente/', '/admin/miapp/producto/',
+            '/admin/miapp/oferta/', '/admin/miapp/detallepedido/', '/admin/miapp/pedido/',
+        ]
+        antes = {url: self.consultas(url) for url in urls}
+        self.agregar_filas(4)
+        self.assertEqual({url: self.consultas(url) for url in urls}, antes)
+    
+    def test_columnas_anotadas(self):
+        respuesta = self.client.get('/admin/miapp/cliente/')
+        self.assertContains(respuesta, '$2,000')
+        respuesta = self.client.get('/admin/miapp/producto/')
+        self.assertContains(respuesta, '🔥 -20')
+
+
+class PaginadorEstimadoTests(TestCase):
+    
+    def setUp(self):
+        for _ in range(3):
+            Pedido.objects.create(total_pedido=1000, **DATOS_CHECKOUT)
+    
+    def test_usa_la_estimacion_sobre_el_umbral(self):
+        paginador = PaginadorEstimado(Pedido.objects.all(), 20)
+        with mock.patch.object(PaginadorEstimado, '_estimar', return_value=250000):
+            with self.assertNumQueries(0):
+                self.assertEqual(paginador.count, 250000)
+        self.assertEqual(paginador.num_pages, 12500)
+    
+    def test_cuenta_exacto_bajo_el_umbral_o_fuera_de_postgres(self):
+        with mock.patch.object(PaginadorEstimado, '_estimar', return_value=40):
+            self.assertEqual(PaginadorEstimado(Pedido.objects.all(), 20).count, 3)
+        # SQLite no tiene estimaciones del planificador
+        self.assertEqual(PaginadorEstimado(Pedido.objects.filter(total_pedido=1000), 20).count, 3)
+    
+    def test_listado_de_pedidos_sin_conteo_total(self):
+        """Filtrado, el admin no agrega el COUNT(*) de la tabla completa"""
+        admin = User.objects.create_superuser(correo='pag@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get('/admin/miapp/pedido/', {'estado_pedido__exact': 'pendiente_pago'})
+        self.assertEqual(respuesta.status_code, 200)
+        conteos = [q['sql'] for q in capturadas if 'COUNT(' in q['sql'] and '"pedidos"' in q['sql']]
+        self.assertEqual(len(conteos), 1)
+        self.assertIn('WHERE', conteos[0])
+
+
+class PedidoAdminEstadoTests(TestCase):
+    
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Admin estado', activa=True)
+        self.producto = Producto.objects.create(
+            nombre='Pepino', descripcion='Pepino de prueba', precio_unitario=1000,
+            stock_disponible=10, categoria=categoria
+        )
+        self.pedido = Pedido.objects.create(total_pedido=2000, estado_pedido='pagado', **DATOS_CHECKOUT)
+        DetallePedido.objects.create(pedido=self.pedido, producto=self.producto, cantidad=2, precio_compra=1000)
+        admin_user = User.objects.create_superuser(correo='estado@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin_user)
+    
+    def guardar(self, estado):
+        datos = {
+            campo: getattr(self.pedido, campo) or ''
+            for campo in ['metodo_pago', 'nombre_cliente', 'correo_cliente', 'telefono_cliente', 'direccion',
+                          'region', 'comuna', 'codigo_postal', 'referencia_direccion', 'numero_seguimiento', 'notas_pedido']
+        }
+        datos.update({
+            'estado_pedido': estado, 'usuario': '',
+            'detalles-TOTAL_FORMS': 0, 'detalles-INITIAL_FORMS': 0,
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/admin/miapp/pedido/{self.pedido.pk}/change/', datos)
+    
+    def test_estado_editado_pasa_por_cambiar_estado(self):
+        """Cancelar desde el formulario repone stock y encola el aviso, como la acción"""
+        respuesta = self.guardar('cancelado')
+        
+        self.assertEqual(respuesta.status_code, 302)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado_pedido, 'cancelado')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_disponible, 12)
+        self.assertEqual(CorreoSaliente.objects.filter(tipo='cambio_estado').count(), 1)
+    
+    def test_pagado_pasa_a_preparando_desde_el_formulario(self):
+        """'preparando' es un destino válido desde 'pagado' y mueve los resúmenes"""
+        registrar_pedidos_nuevos([self.pedido.pk], 'pagado')
+        respuesta = self.guardar('preparando')
+        
+        self.assertEqual(respuesta.status_code, 302)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado_pedido, 'preparando')
+        self.assertEqual(CorreoSaliente.objects.filter(tipo='cambio_estado').count(), 1)
+        self.assertEqual(
+            {v.estado_pedido: v.pedidos for v in VentaDiaria.objects.filter(pedidos__gt=0)}, {'preparando': 1}
+        )
+        # Y de ahí puede seguir a 'enviado'
+        self.pedido.marcar_como_enviado()
+        self.assertEqual(self.pedido.estado_pedido, 'enviado')
+    
+    def test_transicion_no_permitida_es_error_del_formulario(self):
+        respuesta = self.guardar('pendiente_pago')
+        
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'no puede pasar a')
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado_pedido, 'pagado')
+
+
+class AutocompletadoAdminTests(TestCase):
+    
+    def setUp(self):
+        self.admin = User.objects.create_superuser(correo='auto@test.com', password='test123', nombre='Admin')
+        self.client.force_login(self.admin)
+        for i in range(5):
+            User.objects.create_user(correo=f'autocliente{i}@test.com', password='test123', nombre=f'Cliente {i}')
+        self.pedido = Pedido.objects.create(total_pedido=1000, usuario=self.admin, **DATOS_CHECKOUT)
+    
+    def test_formulario_de_pedido_sin_opciones_de_clientes(self):
+        """El select de usuario solo trae la opción elegida; el resto va por autocompletado"""
+        respuesta = self.client.get(f'/admin/miapp/pedido/{self.pedido.pk}/change/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'admin-autocomplete')
+        self.assertNotContains(respuesta, 'autocliente0@test.com')
+    
+    def test_autocompletado_de_clientes_sin_totales(self):
+        """La búsqueda del widget no agrega el JOIN agrupado del listado"""
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get('/admin/autocomplete/', {
+                'app_label': 'miapp', 'model_name': 'pedido', 'field_name': 'usuario', 'term': 'autocliente3',
+            })
+        self.assertEqual([r['text'] for r in respuesta.json()['results']], ['Cliente 3 (autocliente3@test.com)'])
+        self.assertFalse(any('GROUP BY' in q['sql'] for q in capturadas))
+
+
+class AnaliticaClientesTests(TestCase):
+    
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        ahora = timezone.now()
+        self.ana = User.objects.create_user(correo='ana.rfm@test.com', password='test123', nombre='Ana')
+        self.luis = User.objects.create_user(correo='luis.rfm@test.com', password='test123', nombre='Luis')
+        # (cliente, días atrás, total, estado)
+        for cliente, dias, total, estado in [
+            (self.ana, 70, 5000, 'completado'), (self.ana, 5, 3000, 'pagado'),
+            (self.luis, 40, 2000, 'enviado'), (self.luis, 1, 9000, 'cancelado'),
+        ]:
+            pedido = Pedido.objects.create(total_pedido=total, usuario=cliente, estado_pedido=estado, **DATOS_CHECKOUT)
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=ahora - timedelta(days=dias))
+    
+    def test_rfm_y_cohortes(self):
+        """Solo cuentan pedidos vendidos; recalcular reemplaza el resultado anterior"""
+        for _ in range(2):
+            self.assertEqual(calcular_analitica_clientes(hoy=self.hoy)[0], 2)
+        
+        ana, luis = ClienteRFM.objects.get(cliente=self.ana), ClienteRFM.objects.get(cliente=self.luis)
+        self.assertEqual((ana.frecuencia, int(ana.monto), ana.recencia_dias), (2, 8000, 5))
+        self.assertEqual((luis.frecuencia, int(luis.monto), luis.recencia_dias), (1, 2000, 40))
+        self.assertGreater(ana.puntaje_r, luis.puntaje_r)
+        self.assertGreater(ana.puntaje_f, luis.puntaje_f)
+        
+        self.assertEqual(sum(CohorteMensual.objects.filter(mes=0).values_list('clientes', flat=True)), 2)
+        self.assertTrue(CohorteMensual.objects.filter(cohorte=ana.primera_compra.replace(day=1), mes__gt=0).exists())
+        self.assertEqual(sum(CohorteMensual.objects.values_list('pedidos', flat=True)), 3)
+    
+    def test_paneles_de_clientes(self):
+        cache.clear()
+        calcular_analitica_clientes(hoy=self.hoy)
+        admin = User.objects.create_superuser(correo='rfm@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        
+        segmentos = self.client.get('/admin/dashboard/datos/segmentos/').json()
+        self.assertEqual(sum(segmentos['data']), 2)
+        self.assertEqual(segmentos['tasa_recompra'], 50.0)
+        cohortes = self.client.get('/admin/dashboard/datos/cohortes/').json()['cohortes']
+        self.assertEqual(sum(c['clientes'] for c in cohortes), 2)
+        self.assertTrue(all(c['retencion'][0] == 100.0 for c in cohortes))
+
+
+class ReposicionTests(TestCase):
+    
+    def setUp(self):
+        self.hoy = timezone.localdate()
+        categoria = Categoria.objects.create(nombre='Reposición', activa=True)
+        self.rapido = Producto.objects.create(
+            nombre='Rápido', descripcion='Se vende todos los días', precio_unitario=1000,
+            stock_disponible=30, categoria=categoria
+        )
+        self.lento = Producto.objects.create(
+            nombre='Lento', descripcion='Casi no se vende', precio_unitario=1000,
+            stock_disponible=30, categoria=categoria
+        )
+        # 10 unidades diarias del rápido en las últimas 4 semanas; el lento, 2 en total
+        VentaDiariaProducto.objects.bulk_create([
+            VentaDiariaProducto(dia=self.hoy - timedelta(days=d), estado_pedido='pagado', producto=self.rapido,
+                                categoria=categoria, unidades=10, monto=10000)
+            for d in range(1, 29)
+        ] + [
+            VentaDiariaProducto(dia=self.hoy - timedelta(days=3), estado_pedido='completado', producto=self.lento,
+                                categoria=categoria, unidades=2, monto=2000),
+            VentaDiariaProducto(dia=self.hoy - timedelta(days=2), estado_pedido='cancelado', producto=self.lento,
+                                categoria=categoria, unidades=50, monto=50000),
+        ])
+    
+    def test_velocidad_y_punto_de_reorden(self):
+        self.assertEqual(calcular_reposicion(dias=28, hoy=self.hoy), 2)
+        rapido, lento = self.rapido.reposicion, ReposicionProducto.objects.get(producto=self.lento)
+        self.assertEqual(rapido.velocidad_diaria, 10)
+        self.assertEqual(rapido.punto_reorden, 70)  # 7 días de entrega, sin variación
+        self.assertEqual(rapido.dias_hasta_agotar(30), 3)
+        self.assertAlmostEqual(lento.velocidad_diaria, 2 / 28, places=3)
+        self.assertGreater(lento.punto_reorden, 0)
+    
+    def test_filtro_del_admin(self):
+        calcular_reposicion(dias=28, hoy=self.hoy)
+        admin = User.objects.create_superuser(correo='repo@test.com', password='test123', nombre='Admin')
+        self.client.force_login(admin)
+        respuesta = self.client.get('/admin/miapp/producto/', {'reposicion': 'reponer'})
+        self.assertEqual(list(respuesta.context['cl'].result_list), [self.rapido])
+        self.assertContains(respuesta, '≈ 3 días')
+
+
+class JWTClaimsTests(TestCase):
+    
+    def setUp(self):
+        self.cliente = User.objects.create_user(
+            correo='claims@test.com', password='test123', nombre='Claudia', telefono='+56911111111'
+        )
+        Pedido.objects.create(total_pedido=1000, usuario=self.cliente, **DATOS_CHECKOUT)
+    
+    def get(self, url, token):
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+    
+    def test_identidad_desde_los_claims(self):
+        """Con la versión en cache, el token se valida sin consultar clientes"""
+        token = TokenCliente.for_user(self.cliente).access_token
+        self.assertEqual(token['correo'], 'claims@test.com')
+        self.get('/api/auth/verify-token', token)
+        
+        with self.assertNumQueries(0):
+            respuesta = self.get('/api/auth/verify-token', token)
+        self.assertEqual(respuesta.json()['cliente_id'], self.cliente.id)
+        
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.get('/api/mis-pedidos/', token)
+        self.assertEqual(len(respuesta.json()['results']), 1)
+        self.assertFalse(any('"clientes"' in q['sql'] for q in capturadas))
+        
+        # El detalle sí carga el modelo: el teléfono pudo cambiar después del login
+        User.objects.filter(pk=self.cliente.pk).update(telefono='+56922222222')
+        self.assertEqual(self.get('/api/clientes/me', token).json()['telefono'], '+56922222222')
+    
+    def test_cambiar_version_revoca_los_tokens(self):
+        token = TokenCliente.for_user(self.cliente).access_token
+        self.assertEqual(self.get('/api/auth/verify-token', token).status_code, 200)
+        
+        self.cliente.invalidar_tokens()
+        self.assertEqual(self.get('/api/auth/verify-token', token).status_code, 401)
+        
+        token = TokenCliente.for_user(self.cliente).access_token
+        self.cliente.set_password('otra-clave-123')
+        self.cliente.save()
+        self.assertEqual(self.get('/api/auth/verify-token', token).status_code, 401)
+        self.assertEqual(self.get('/api/auth/verify-token', TokenCliente.for_user(self.cliente).access_token).status_code, 200)
+    
+    def test_checkout_y_perfil_desde_la_sesion(self):
+        self.client.post('/api/auth/login', {'correo': 'claims@test.com', 'password': 'test123'}, content_type='application/json')
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get('/perfil/')
+        self.assertContains(respuesta, '+56911111111')
+        self.assertFalse(any('FROM "clientes"' in q['sql'] for q in capturadas))
+
+
+class BenchmarkCheckoutTests(TransactionTestCase):
+    """Prueba de humo del benchmark de contención del checkout"""
+    
+    def test_reporte_json_sin_sobreventa(self):
+        salida = StringIO()
+        call_command(
+            'benchmark_checkout', compradores=6, concurrencia=1, productos=1, stock=4,
+            forzar=True, stdout=salida
+        )
+        resultados = json.loads(salida.getvalue())['resultados']
+        
+        self.assertEqual(resultados['checkouts_exitosos'], 4)
+        self.assertEqual(resultados['sobreventa_unidades'], 0)
+        self.assertEqual(resultados['productos_stock_inconsistente'], 0)
+        self.assertIn('p95', resultados['latencia_ms'])
+        # Los datos generados se eliminan al terminar
+        self.assertFalse(Producto.objects.exists())
+        self.assertFalse(VentaDiaria.objects.filter(pedidos__gt=0).exists())
@@ -9,6 +9,7 @@ from .views import (
     ProductoDetailAPIView,
     CarritoView,
     CarritoItemView,
+    CarritoResumenView,
     CarritoVaciarView,
     CheckoutAPIView,
     MisPedidosAPIView,
@@ -28,6 +29,7 @@ urlpatterns = [
     path('checkout/', views.checkout, name='checkout'),
     path('pedido-confirmado/<int:pedido_id>/', views.confirmacion_pedido, name='confirmacion_pedido'),
     path('mis-pedidos/', views.mis_pedidos, name='mis_pedidos'),
+    path('seguimiento/<str:token>/', views.seguimiento_pedido, name='seguimiento_pedido'),
     path('contacto/', views.ventas, name='contacto'),
     path('perfil/', views.perfil_temporal, name='perfil'),
     
@@ -51,12 +53,15 @@ urlpatterns = [
     # ===== API ENDPOINTS - CARRITO =====
     path('api/cart/', CarritoView.as_view(), name='carrito'),
     path('api/cart/<int:producto_id>/', CarritoItemView.as_view(), name='carrito-item'),
+    path('api/cart/summary/', CarritoResumenView.as_view(), name='carrito-resumen'),
     path('api/cart/clear/', CarritoVaciarView.as_view(), name='carrito-vaciar'),
     
     # ===== API ENDPOINTS - CHECKOUT Y PEDIDOS =====
     path('api/checkout/', CheckoutAPIView.as_view(), name='checkout-api'),
     path('api/mis-pedidos/', MisPedidosAPIView.as_view(), name='mis-pedidos-api'),
     path('api/pedidos/<int:pk>/', DetallePedidoAPIView.as_view(), name='detalle-pedido-api'),
+    path('api/pedidos/eventos/', views.eventos_pedidos, name='eventos-pedidos'),
+    path('api/seguimiento/', views.SeguimientoPedidoAPIView.as_view(), name='seguimiento-api'),
 
     # ===== CHATBOT =====
     path('chatbot/ask/', views.chatbot_ask, name='chatbot-ask'),
@@ -5,18 +5,46 @@ from .models import Producto, Categoria, Oferta, Cliente, Pedido, DetallePedido
 from django.utils import timezone
 from django.utils.html import strip_tags 
 
+import hashlib
 import json
 import logging
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import Http404, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from .chatbot_logic import best_intent, RESPUESTAS, FALLBACK
+from .autenticacion import TokenCliente, cliente_de_request, estado_cliente
+from .catalogo import obtener_version_catalogo
+from .correos import (
+    construir_correo_password_reset,
+    encolar_correos,
+    encolar_correos_nuevo_pedido,
+)
+from .eventos import flujo_eventos
+from .exportacion import ParametrosInvalidos, afilas_ventas, consulta_ventas, filas_ventas, generar_csv, nombre_archivo
+from .metricas import DIAS_POR_DEFECTO, METRICAS, RangoInvalido, obtener_metrica, rango_dias
+from .resumenes import registrar_pedidos_nuevos
+from .seguimiento import buscar_pedido, consultar_seguimiento, generar_token_seguimiento
+from .inventario import (
+    StockInsuficiente,
+    ConflictoStock,
+    reservas_activas,
+    checkout_optimista,
+    reservar_stock,
+    stock_reservado,
+    liberar_reservas,
+    confirmar_reservas,
+    descontar_stock,
+    descontar_stock_optimista,
+    stock_actual,
+    anotar_stock_actual,
+)
 
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated 
+from rest_framework.throttling import ScopedRateThrottle
 
-from rest_framework_simplejwt.tokens import RefreshToken 
 from decimal import Decimal
 
 from rest_framework.decorators import api_view
@@ -29,17 +57,21 @@ from .serializers import (
     ProductoSerializer,
     ProductoListSerializer,
     CarritoItemSerializer,
+    CarritoLoteSerializer,
     CarritoSerializer,
     CheckoutSerializer,
     PedidoSerializer,
     PedidoListSerializer,
+    SeguimientoConsultaSerializer,
+    SeguimientoPedidoSerializer,
     ClienteUpdateSerializer 
 )
 
 from django.core.mail import send_mail, EmailMultiAlternatives
 from django.template.loader import render_to_string
-from django.db import transaction
+from django.db import connection, transaction, IntegrityError
 from .serializers import CheckoutSerializer, PedidoSerializer, PedidoListSerializer
+from .paginacion import PedidosCursorPagination
 
 from datetime import timedelta
 import json
@@ -53,7 +85,7 @@ from django.utils.timezone import localtime
 
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode
+from django.utils.http import parse_etags, urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 
 from django.contrib.sites.shortcuts import get_current_site
@@ -75,7 +107,7 @@ def inicio(request):
     
     productos_mas_vendidos = DetallePedido.objects.filter(
         pedido__estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado'],
-        pedido__fecha_pedido__gte=hace_30_dias
+        fecha_pedido__gte=hace_30_dias
     ).values('producto__id', 'producto__nombre').annotate(
         total_vendido=Sum('cantidad')
     ).order_by('-total_vendido')[:10]
@@ -204,7 +236,7 @@ class ClienteRegistroAPIView(generics.CreateAPIView):
 
 
 def get_tokens_for_user(cliente):
-    refresh = RefreshToken.for_user(cliente) 
+    refresh = TokenCliente.for_user(cliente)
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -224,6 +256,7 @@ class ClienteLoginAPIView(generics.GenericAPIView):
             request.session['cliente_id'] = cliente.id
             request.session['cliente_correo'] = cliente.correo
             request.session['cliente_nombre'] = cliente.nombre
+            request.session['cliente_telefono'] = cliente.telefono or ''
             
             limpiar_carrito_invitado(request)
             
@@ -258,7 +291,8 @@ class ClienteDetailAPIView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # Los datos de contacto pueden haber cambiado desde que se emitió el token
+        return cliente_de_request(self.request)
 
 
 # ===== API VIEWS - PRODUCTOS =====
@@ -268,7 +302,7 @@ class ProductoListAPIView(generics.ListAPIView):
     Endpoint GET /api/public/products
     Lista todos los productos disponibles (público)
     """
-    queryset = Producto.objects.filter(activo=True).select_related('categoria')
+    queryset = anotar_stock_actual(Producto.objects.filter(activo=True).select_related('categoria'))
     serializer_class = ProductoListSerializer
     
     def get_queryset(self):
@@ -290,7 +324,9 @@ class ProductoDetailAPIView(generics.RetrieveAPIView):
     Endpoint GET /api/public/products/:id
     Obtiene el detalle completo de un producto específico (público)
     """
-    queryset = Producto.objects.filter(activo=True).select_related('categoria').prefetch_related('ofertas')
+    queryset = anotar_stock_actual(
+        Producto.objects.filter(activo=True).select_related('categoria').prefetch_related('ofertas')
+    )
     serializer_class = ProductoSerializer
     lookup_field = 'pk'
     
@@ -309,23 +345,54 @@ class ProductoDetailAPIView(generics.RetrieveAPIView):
             )
 
 
+# ===== FUNCIONES AUXILIARES DE SESIÓN =====
+
+def datos_cliente_sesion(request):
+    """
+    Datos de contacto del cliente logueado, guardados en la sesión al iniciar
+    sesión y al editar el perfil (sin consultar la tabla de clientes).
+    Las sesiones anteriores sin teléfono se completan una vez desde la base.
+    """
+    cliente_id = request.session.get('cliente_id')
+    if not cliente_id:
+        return {}
+    
+    if 'cliente_telefono' not in request.session:
+        cliente = Cliente.objects.filter(id=cliente_id).values('nombre', 'correo', 'telefono').first()
+        if cliente is None:
+            return {}
+        request.session['cliente_nombre'] = cliente['nombre']
+        request.session['cliente_correo'] = cliente['correo']
+        request.session['cliente_telefono'] = cliente['telefono'] or ''
+    
+    return {
+        'id': cliente_id,
+        'nombre': request.session.get('cliente_nombre', ''),
+        'correo': request.session.get('cliente_correo', ''),
+        'telefono': request.session['cliente_telefono'],
+    }
+
+
 # ===== FUNCIONES AUXILIARES PARA CARRITO =====
 
-def obtener_carrito(request):
+def obtener_clave_carrito(request):
     """
-    Obtiene el carrito según si el usuario está logueado o no.
+    Retorna la clave de sesión del carrito según si el usuario está logueado o no.
     - Usuario logueado: carrito_user_{id}
     - Usuario invitado: carrito_guest
     """
-    # Determinar qué carrito usar
     cliente_id = request.session.get('cliente_id')
     
     if cliente_id:
-        # Usuario logueado
-        carrito_key = f'carrito_user_{cliente_id}'
-    else:
-        # Usuario invitado
-        carrito_key = 'carrito_guest'
+        return f'carrito_user_{cliente_id}'
+    return 'carrito_guest'
+
+
+def obtener_carrito(request):
+    """
+    Obtiene el carrito según si el usuario está logueado o no.
+    """
+    carrito_key = obtener_clave_carrito(request)
     
     # Obtener o crear carrito
     carrito = request.session.get(carrito_key, {'items': {}})
@@ -337,21 +404,71 @@ def obtener_carrito(request):
     return carrito
 
 
+def obtener_clave_reserva(request):
+    """
+    Identifica el carrito actual (sesión + carrito) para asociarle reservas de stock.
+    """
+    if not request.session.session_key:
+        request.session.save()
+    return f'{request.session.session_key}:{obtener_clave_carrito(request)}'
+
+
 def guardar_carrito(request, carrito):
     """
     Guarda el carrito en la sesión correcta.
+    El resumen guardado deja de ser válido cuando cambian los items.
     """
-    # Determinar qué carrito usar
-    cliente_id = request.session.get('cliente_id')
+    carrito.pop('resumen', None)
     
-    if cliente_id:
-        carrito_key = f'carrito_user_{cliente_id}'
+    request.session[obtener_clave_carrito(request)] = carrito
+    request.session.modified = True
+
+
+def guardar_resumen_carrito(request, carrito, carrito_completo):
+    """
+    Guarda junto al carrito un resumen (cantidad y total) ligado a la versión
+    del catálogo, para servir el badge del header sin consultar productos.
+    """
+    version = obtener_version_catalogo()
+    total = str(carrito_completo['total'].quantize(Decimal('0.01')))
+    cantidad_items = carrito_completo['cantidad_items']
+    
+    huella = hashlib.md5(
+        json.dumps([version, carrito.get('items', {}), total], sort_keys=True).encode()
+    ).hexdigest()
+    
+    resumen = {
+        'cantidad_items': cantidad_items,
+        'total': total,
+        'version_catalogo': version,
+        'etag': f'"{huella}"',
+    }
+    
+    if carrito.get('resumen') != resumen:
+        carrito['resumen'] = resumen
+        request.session[obtener_clave_carrito(request)] = carrito
+        request.session.modified = True
+    
+    return resumen
+
+
+def obtener_resumen_carrito(request):
+    """
+    Retorna el resumen del carrito. Solo recalcula (y consulta productos)
+    si el carrito cambió o si cambió la versión del catálogo.
+    """
+    carrito = obtener_carrito(request)
+    resumen = carrito.get('resumen')
+    
+    if resumen and resumen.get('version_catalogo') == obtener_version_catalogo():
+        return resumen
+    
+    if not carrito['items']:
+        carrito_completo = {'items': [], 'total': Decimal('0.00'), 'cantidad_items': 0}
     else:
-        carrito_key = 'carrito_guest'
+        carrito_completo = calcular_carrito_completo(carrito)
     
-    # Guardar carrito
-    request.session[carrito_key] = carrito
-    request.session.modified = True
+    return guardar_resumen_carrito(request, carrito, carrito_completo)
 
 
 def limpiar_carrito_invitado(request):
@@ -359,6 +476,8 @@ def limpiar_carrito_invitado(request):
     Limpia el carrito de invitado (para usar al hacer login).
     """
     if 'carrito_guest' in request.session:
+        if reservas_activas() and request.session.session_key:
+            liberar_reservas(f'{request.session.session_key}:carrito_guest')
         del request.session['carrito_guest']
         request.session.modified = True
 
@@ -393,6 +512,7 @@ def calcular_carrito_completo(carrito):
     """
     items_detallados = []
     total = Decimal('0.00')
+    stock = stock_actual([int(clave) for clave in carrito.get('items', {}) if clave.isdigit()])
     
     for producto_id_str, cantidad in carrito.get('items', {}).items():
         try:
@@ -421,7 +541,7 @@ def calcular_carrito_completo(carrito):
                 'cantidad': cantidad,
                 'unidad_medida': producto.unidad_medida,
                 'imagen_url': imagen_url,
-                'stock_disponible': producto.stock_disponible,
+                'stock_disponible': stock.get(producto.id, producto.stock_disponible),
                 'subtotal': subtotal
             }
             
@@ -445,12 +565,14 @@ class CarritoView(APIView):
     """
     GET /api/cart - Obtener el carrito actual
     POST /api/cart - Agregar un producto al carrito
+    PATCH /api/cart - Aplicar un lote de operaciones (add/set/remove)
     """
     
     def get(self, request):
         """Obtiene el contenido del carrito"""
         carrito = obtener_carrito(request)
         carrito_completo = calcular_carrito_completo(carrito)
+        guardar_resumen_carrito(request, carrito, carrito_completo)
         
         serializer = CarritoSerializer(carrito_completo)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -480,16 +602,21 @@ class CarritoView(APIView):
         # Verificar stock
         try:
             producto = Producto.objects.get(pk=producto_id, activo=True)
-            if nueva_cantidad > producto.stock_disponible:
-                return Response({
-                    'error': f'Stock insuficiente. Solo hay {producto.stock_disponible} unidades disponibles.'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            if reservas_activas():
+                reservar_stock(obtener_clave_reserva(request), {producto.id: nueva_cantidad})
+            else:
+                disponible = stock_actual([producto.id])[producto.id]
+                if nueva_cantidad > disponible:
+                    return Response({
+                        'error': f'Stock insuficiente. Solo hay {disponible} unidades disponibles.'
+                    }, status=status.HTTP_400_BAD_REQUEST)
             
             carrito['items'][producto_id_str] = nueva_cantidad
             guardar_carrito(request, carrito)
             
             # Retornar carrito actualizado
             carrito_completo = calcular_carrito_completo(carrito)
+            guardar_resumen_carrito(request, carrito, carrito_completo)
             serializer = CarritoSerializer(carrito_completo)
             
             return Response({
@@ -497,10 +624,113 @@ class CarritoView(APIView):
                 'carrito': serializer.data
             }, status=status.HTTP_200_OK)
             
+        except StockInsuficiente as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Producto.DoesNotExist:
             return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
 
+    def patch(self, request):
+        """
+        Aplica varias operaciones sobre el carrito en una sola llamada.
+        Body: {"operaciones": [{"accion": "add", "producto_id": 1, "cantidad": 2}, ...]}
+        Si alguna operación falla, el carrito queda sin cambios.
+        """
+        lote_serializer = CarritoLoteSerializer(data=request.data)
+        
+        if not lote_serializer.is_valid():
+            return Response(lote_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        operaciones = lote_serializer.validated_data['operaciones']
+        
+        # Trabajar sobre una copia para no tocar el carrito si hay errores
+        carrito = obtener_carrito(request)
+        items = dict(carrito['items'])
+        
+        # Obtener todos los productos involucrados en una sola consulta
+        ids_productos = {op['producto_id'] for op in operaciones if op['accion'] != 'remove'}
+        productos = Producto.objects.filter(
+            pk__in=ids_productos,
+            activo=True
+        ).only('id', 'nombre').in_bulk()
+        
+        errores = []
+        modificados = set()
+        
+        for indice, operacion in enumerate(operaciones):
+            producto_id = operacion['producto_id']
+            producto_id_str = str(producto_id)
+            
+            if operacion['accion'] == 'remove':
+                items.pop(producto_id_str, None)
+                modificados.discard(producto_id)
+                continue
+            
+            if producto_id not in productos:
+                errores.append({
+                    'indice': indice,
+                    'producto_id': producto_id,
+                    'error': 'Producto no encontrado'
+                })
+                continue
+            
+            if operacion['accion'] == 'add':
+                items[producto_id_str] = items.get(producto_id_str, 0) + operacion['cantidad']
+            else:
+                items[producto_id_str] = operacion['cantidad']
+            modificados.add(producto_id)
+        
+        # Verificar stock sobre las cantidades finales
+        reservado_otros = {}
+        if reservas_activas():
+            clave_reserva = obtener_clave_reserva(request)
+            reservado_otros = stock_reservado(modificados, excluir_clave=clave_reserva)
+        
+        stock = stock_actual(modificados)
+        for producto_id in modificados:
+            producto = productos[producto_id]
+            cantidad = items[str(producto_id)]
+            disponible = stock[producto_id] - reservado_otros.get(producto_id, 0)
+            if cantidad > disponible:
+                errores.append({
+                    'producto_id': producto_id,
+                    'error': f'Stock insuficiente para {producto.nombre}. Solo hay {max(disponible, 0)} unidades disponibles.'
+                })
+        
+        if errores:
+            return Response({
+                'error': 'No se pudo actualizar el carrito',
+                'errores': errores
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if reservas_activas():
+            try:
+                reservar_stock(clave_reserva, {
+                    producto_id: items[str(producto_id)] for producto_id in modificados
+                })
+            except StockInsuficiente as e:
+                return Response({
+                    'error': 'No se pudo actualizar el carrito',
+                    'errores': [{'producto_id': e.producto.id, 'error': str(e)}]
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            eliminados = [int(clave) for clave in carrito['items'] if clave not in items]
+            if eliminados:
+                liberar_reservas(clave_reserva, eliminados)
+        
+        carrito['items'] = items
+        guardar_carrito(request, carrito)
+        
+        carrito_completo = calcular_carrito_completo(carrito)
+        guardar_resumen_carrito(request, carrito, carrito_completo)
+        serializer = CarritoSerializer(carrito_completo)
+        
+        return Response({
+            'message': f'{len(operaciones)} operación(es) aplicada(s)',
+            'carrito': serializer.data
+        }, status=status.HTTP_200_OK)
+
+
 class CarritoItemView(APIView):
     """
     PUT /api/cart/<producto_id> - Actualizar cantidad de un producto
@@ -523,15 +753,20 @@ class CarritoItemView(APIView):
         # Verificar stock
         try:
             producto = Producto.objects.get(pk=producto_id, activo=True)
-            if nueva_cantidad > producto.stock_disponible:
-                return Response({
-                    'error': f'Stock insuficiente. Solo hay {producto.stock_disponible} unidades disponibles.'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            if reservas_activas():
+                reservar_stock(obtener_clave_reserva(request), {producto.id: nueva_cantidad})
+            else:
+                disponible = stock_actual([producto.id])[producto.id]
+                if nueva_cantidad > disponible:
+                    return Response({
+                        'error': f'Stock insuficiente. Solo hay {disponible} unidades disponibles.'
+                    }, status=status.HTTP_400_BAD_REQUEST)
             
             carrito['items'][producto_id_str] = nueva_cantidad
             guardar_carrito(request, carrito)
             
             carrito_completo = calcular_carrito_completo(carrito)
+            guardar_resumen_carrito(request, carrito, carrito_completo)
             serializer = CarritoSerializer(carrito_completo)
             
             return Response({
@@ -539,6 +774,8 @@ class CarritoItemView(APIView):
                 'carrito': serializer.data
             }, status=status.HTTP_200_OK)
             
+        except StockInsuficiente as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Producto.DoesNotExist:
             return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -551,7 +788,11 @@ class CarritoItemView(APIView):
             del carrito['items'][producto_id_str]
             guardar_carrito(request, carrito)
             
+            if reservas_activas():
+                liberar_reservas(obtener_clave_reserva(request), [producto_id])
+            
             carrito_completo = calcular_carrito_completo(carrito)
+            guardar_resumen_carrito(request, carrito, carrito_completo)
             serializer = CarritoSerializer(carrito_completo)
             
             return Response({
@@ -562,11 +803,47 @@ class CarritoItemView(APIView):
         return Response({'error': 'Producto no está en el carrito'}, status=status.HTTP_404_NOT_FOUND)
 
 
+def etag_coincide(etag, if_none_match):
+    """
+    Compara un ETag con la cabecera If-None-Match: lista de etiquetas separadas
+    por comas, '*' o etiquetas débiles (W/"..."), con comparación débil.
+    """
+    etiquetas = parse_etags(if_none_match or '')
+    return '*' in etiquetas or any(etiqueta.removeprefix('W/') == etag for etiqueta in etiquetas)
+
+
+class CarritoResumenView(APIView):
+    """
+    GET /api/cart/summary - Cantidad de items y total para el badge del header.
+    Usa el resumen guardado en la sesión y soporta If-None-Match (ETag).
+    """
+    
+    def get(self, request):
+        """Obtiene el resumen del carrito"""
+        resumen = obtener_resumen_carrito(request)
+        etag = resumen['etag']
+        
+        if etag_coincide(etag, request.headers.get('If-None-Match')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({
+                'cantidad_items': resumen['cantidad_items'],
+                'total': resumen['total'],
+            }, status=status.HTTP_200_OK)
+        
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
 class CarritoVaciarView(APIView):
     """DELETE /api/cart/clear - Vaciar todo el carrito"""
     
     def delete(self, request):
         """Vacía completamente el carrito"""
+        if reservas_activas():
+            liberar_reservas(obtener_clave_reserva(request))
+        
         limpiar_carrito_actual(request)
         
         return Response({
@@ -596,135 +873,144 @@ def ver_carrito(request):
     return render(request, 'miapp/carrito.html', contexto)
 
 
-# ===== FUNCIONES DE CORREO =====
+# ===== API VIEWS PARA CHECKOUT =====
 
-def enviar_correo_confirmacion_pedido(pedido):
-    """
-    Envía correo de confirmación al cliente con instrucciones de pago
-    Usa Resend API (HTTP) en lugar de SMTP
-    """
-    try:
-        import resend
-        from django.conf import settings
-        
-        # Configurar API key de Resend
-        resend.api_key = settings.EMAIL_HOST_PASSWORD  # Usamos esta variable para la API key
-        
-        detalles = pedido.detalles.all()
-        
-        # Construir lista de productos
-        productos_html = ""
-        for detalle in detalles:
-            productos_html += f"<li>{detalle.cantidad} x {detalle.producto.nombre} - ${detalle.precio_compra:,.0f}</li>"
-        
-        mensaje_html = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                <h2 style="color: #28a745;">¡Gracias por tu pedido!</h2>
-                
-                <div style="background: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                    <h3>Pedido #{pedido.id}</h3>
-                    <p><strong>Total:</strong> ${pedido.total_pedido:,.0f}</p>
-                </div>
-                
-                <h3>Productos:</h3>
-                <ul>{productos_html}</ul>
-                
-                <div style="background: #fff3cd; padding: 20px; border-radius: 5px; margin: 20px 0; border-left: 4px solid #ffc107;">
-                    <h3 style="margin-top: 0;">💳 Datos para Transferencia</h3>
-                    <p><strong>Banco:</strong> Banco Estado</p>
-                    <p><strong>Tipo de Cuenta:</strong> Cuenta Vista</p>
-                    <p><strong>Número de Cuenta:</strong> 90272246717</p>
-                    <p><strong>RUT:</strong> 77.851.212-2</p>
-                    <p><strong>Titular:</strong> Tres en uno</p>
-                    <p><strong>Monto a transferir:</strong> ${pedido.total_pedido:,.0f}</p>
-                    <p style="color: #856404;"><strong>⚠️ Importante:</strong> Incluye el número de pedido #{pedido.id} en el mensaje de la transferencia.</p>
-                </div>
-                
-                <div style="background: #d4edda; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                    <h3 style="margin-top: 0;">📦 Dirección de Envío</h3>
-                    <p>{pedido.direccion}</p>
-                    <p>{pedido.comuna}, {pedido.region}</p>
-                </div>
-                
-                <p>Si tienes alguna duda, contáctanos a: ventas.tresenuno@gmail.com</p>
-            </body>
-        </html>
-        """
-        
-        params = {
-            "from": f"Tres en Uno <{settings.DEFAULT_FROM_EMAIL}>",
-            "to": [pedido.correo_cliente],
-            "subject": f"Pedido #{pedido.id} - Confirmación y Datos de Pago",
-            "html": mensaje_html,
-        }
-        
-        resend.Emails.send(params)
-        logger.info(f"Correo de confirmación enviado para pedido #{pedido.id}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error al enviar correo: {str(e)}")
-        return False
+def calcular_hash_checkout(datos_pedido, cliente_id):
+    """Huella de la solicitud de checkout asociada a una clave de idempotencia"""
+    contenido = json.dumps({'datos': datos_pedido, 'cliente_id': cliente_id}, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode()).hexdigest()
 
 
-def enviar_correo_admin_nuevo_pedido(pedido):
+def clave_idempotencia_del_cliente(request, clave):
     """
-    Notifica al administrador sobre un nuevo pedido
-    Usa Resend API (HTTP)
+    Clave que se guarda en el pedido: la del header acotada al cliente (o a la
+    sesión del invitado), así dos clientes con la misma clave no comparten pedido.
     """
-    try:
-        import resend
-        from django.conf import settings
-        
-        resend.api_key = settings.EMAIL_HOST_PASSWORD
-        
-        detalles = pedido.detalles.all()
-        productos_texto = "\n".join([f"- {d.cantidad} x {d.producto.nombre} - ${d.precio_compra:,.0f}" for d in detalles])
-        
-        mensaje = f"""
-        Nuevo pedido en Tres En Uno
-        
-        PEDIDO #{pedido.id}
-        Total: ${pedido.total_pedido:,.0f}
-        
-        CLIENTE:
-        Nombre: {pedido.nombre_cliente}
-        Email: {pedido.correo_cliente}
-        Teléfono: {pedido.telefono_cliente}
-        
-        DIRECCIÓN:
-        {pedido.direccion}
-        {pedido.comuna}, {pedido.region}
-        
-        PRODUCTOS:
-        {productos_texto}
-        """
-        
-        params = {
-            "from": f"Tres en Uno <{settings.DEFAULT_FROM_EMAIL}>",
-            "to": ["ventas.tresenuno@gmail.com"],
-            "subject": f"🛒 Nuevo Pedido #{pedido.id} - {pedido.nombre_cliente}",
-            "text": mensaje,
-        }
-        
-        resend.Emails.send(params)
-        logger.info(f"Correo admin enviado para pedido #{pedido.id}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error al enviar correo admin: {str(e)}")
-        return False
+    cliente_id = request.session.get('cliente_id')
+    if cliente_id:
+        ambito = f'cliente:{cliente_id}'
+    else:
+        if not request.session.session_key:
+            request.session.save()
+        ambito = f'sesion:{request.session.session_key}'
+    return hashlib.sha256(f'{ambito}:{clave}'.encode()).hexdigest()
 
 
-# ===== API VIEWS PARA CHECKOUT =====
+def respuesta_pedido_creado(pedido, request, repetida=False):
+    """Respuesta 201 del checkout (también usada al repetir una clave de idempotencia)"""
+    pedido = Pedido.objects.con_detalles().get(pk=pedido.pk)
+    pedido_serializer = PedidoSerializer(pedido, context={'request': request})
+    
+    response = Response({
+        'message': 'Pedido creado exitosamente',
+        'pedido': pedido_serializer.data
+    }, status=status.HTTP_201_CREATED)
+    
+    if repetida:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
 
 class CheckoutAPIView(APIView):
     """
     POST /api/checkout - Procesar el checkout y crear el pedido
     Permite checkout tanto para usuarios autenticados como invitados
+    Acepta el header Idempotency-Key para que los reintentos no dupliquen pedidos
     """
     
+    def respuesta_idempotente(self, request, clave_idempotencia, hash_solicitud):
+        """
+        Si la clave ya generó un pedido, retorna la respuesta de ese pedido
+        (o 422 si la clave se usó con otros datos). Si no, retorna None.
+        """
+        pedido = Pedido.objects.filter(clave_idempotencia=clave_idempotencia).first()
+        
+        if pedido is None:
+            return None
+        
+        if pedido.hash_solicitud != hash_solicitud:
+            logger.warning(f"Idempotency-Key reutilizada con otros datos (pedido #{pedido.id})")
+            return Response({
+                'error': 'La clave de idempotencia ya fue usada con otros datos.'
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        logger.info(f"Checkout repetido con la misma clave: se retorna el pedido #{pedido.id}")
+        return respuesta_pedido_creado(pedido, request, repetida=True)
+    
+    def crear_pedido(self, datos_pedido, carrito_completo, cliente_id, clave_reserva,
+                     clave_idempotencia, hash_solicitud):
+        """Crea el pedido, sus detalles y descuenta el stock en una sola transacción"""
+        with transaction.atomic():
+            if clave_idempotencia:
+                # La restricción única incluye fecha_pedido: serializar por clave
+                # para que dos reintentos simultáneos no creen dos pedidos
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))', [clave_idempotencia])
+                if Pedido.objects.filter(clave_idempotencia=clave_idempotencia).exists():
+                    raise IntegrityError('Clave de idempotencia ya utilizada')
+            
+            # Crear el pedido (el token de seguimiento solo viaja en el correo)
+            token_seguimiento, hash_token = generar_token_seguimiento()
+            pedido = Pedido.objects.create(
+                clave_idempotencia=clave_idempotencia,
+                hash_solicitud=hash_solicitud,
+                token_seguimiento_hash=hash_token,
+                usuario_id=cliente_id,  # Puede ser None para invitados
+                nombre_cliente=datos_pedido['nombre_cliente'],
+                correo_cliente=datos_pedido['correo_cliente'],
+                telefono_cliente=datos_pedido['telefono_cliente'],
+                direccion=datos_pedido['direccion'],
+                region=datos_pedido['region'],
+                comuna=datos_pedido['comuna'],
+                codigo_postal=datos_pedido.get('codigo_postal', ''),
+                referencia_direccion=datos_pedido.get('referencia_direccion', ''),
+                notas_pedido=datos_pedido.get('notas_pedido', ''),
+                metodo_pago=datos_pedido.get('metodo_pago', 'transferencia'),
+                total_pedido=carrito_completo['total'],
+                estado_pedido='pendiente_pago'
+            )
+            
+            logger.info(f"Pedido creado: #{pedido.id}")
+            
+            # Crear todos los detalles con un solo INSERT
+            DetallePedido.objects.bulk_create([
+                DetallePedido(
+                    pedido=pedido,
+                    producto_id=item['producto_id'],
+                    cantidad=item['cantidad'],
+                    precio_compra=item['precio_unitario'],
+                    fecha_pedido=pedido.fecha_pedido
+                )
+                for item in carrito_completo['items']
+            ])
+            
+            # Encolar correos en la misma transacción (los envía el worker)
+            encolar_correos_nuevo_pedido(pedido, token_seguimiento=token_seguimiento)
+            
+            # Descontar stock al final, para mantener los bloqueos de
+            # productos el menor tiempo posible antes del commit
+            cantidades = {
+                item['producto_id']: item['cantidad'] for item in carrito_completo['items']
+            }
+            if clave_reserva:
+                # Modo reservas: el stock ya está apartado, solo se confirma
+                confirmar_reservas(clave_reserva, cantidades, pedido=pedido)
+            elif checkout_optimista():
+                # Sin bloqueos: UPDATE condicionado a la versión, con reintentos
+                descontar_stock_optimista(cantidades, pedido=pedido)
+            else:
+                descontar_stock(cantidades, pedido=pedido)
+            logger.info(f"Stock actualizado para {len(cantidades)} producto(s)")
+            
+            # Resúmenes del dashboard (upsert aditivo por día y producto)
+            registrar_pedidos_nuevos([pedido.pk])
+            
+            # Si llegamos aquí, todo OK - commit implícito al salir del with
+            logger.info(f"Transacción completada para pedido #{pedido.id}")
+        
+        return pedido
+    
     def post(self, request):
         """Procesa el checkout y crea el pedido"""
         
@@ -740,6 +1026,24 @@ class CheckoutAPIView(APIView):
                 logger.error(f"Errores de validación: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
+            # Idempotencia: un reintento con la misma clave retorna el pedido ya creado
+            clave_idempotencia = request.headers.get('Idempotency-Key', '').strip() or None
+            hash_solicitud = ''
+            
+            if clave_idempotencia:
+                if len(clave_idempotencia) > 255:
+                    return Response({
+                        'error': 'Idempotency-Key demasiado larga (máximo 255 caracteres).'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                
+                clave_idempotencia = clave_idempotencia_del_cliente(request, clave_idempotencia)
+                hash_solicitud = calcular_hash_checkout(
+                    serializer.validated_data, request.session.get('cliente_id')
+                )
+                respuesta = self.respuesta_idempotente(request, clave_idempotencia, hash_solicitud)
+                if respuesta is not None:
+                    return respuesta
+            
             # Obtener el carrito
             carrito = obtener_carrito(request)
             
@@ -756,86 +1060,51 @@ class CheckoutAPIView(APIView):
             # Obtener datos del pedido validados
             datos_pedido = serializer.validated_data
             
-            # Obtener cliente si está autenticado (puede ser None para invitados)
+            # Cliente autenticado (None para invitados); su existencia sale del
+            # cache de estados de cliente, sin cargar el modelo
             cliente_id = request.session.get('cliente_id')
-            cliente = None
             
             if cliente_id:
-                try:
-                    cliente = Cliente.objects.get(id=cliente_id)
-                    logger.info(f"Cliente autenticado: {cliente.correo}")
-                except Cliente.DoesNotExist:
-                    logger.warning(f"Cliente ID {cliente_id} no encontrado en BD")
+                estado = estado_cliente(cliente_id)
+                if estado is None or not estado[1]:
+                    logger.warning(f"Cliente ID {cliente_id} no encontrado o inactivo")
+                    cliente_id = None
+                else:
+                    logger.info(f"Cliente autenticado: {request.session.get('cliente_correo')}")
             else:
                 logger.info("Checkout como invitado")
             
+            clave_reserva = obtener_clave_reserva(request) if reservas_activas() else None
+            
             # Crear el pedido dentro de una transacción
-            with transaction.atomic():
-                # Crear el pedido
-                pedido = Pedido.objects.create(
-                    usuario=cliente,  # Puede ser None para invitados
-                    nombre_cliente=datos_pedido['nombre_cliente'],
-                    correo_cliente=datos_pedido['correo_cliente'],
-                    telefono_cliente=datos_pedido['telefono_cliente'],
-                    direccion=datos_pedido['direccion'],
-                    region=datos_pedido['region'],
-                    comuna=datos_pedido['comuna'],
-                    codigo_postal=datos_pedido.get('codigo_postal', ''),
-                    referencia_direccion=datos_pedido.get('referencia_direccion', ''),
-                    notas_pedido=datos_pedido.get('notas_pedido', ''),
-                    metodo_pago=datos_pedido.get('metodo_pago', 'transferencia'),
-                    total_pedido=carrito_completo['total'],
-                    estado_pedido='pendiente_pago'
+            try:
+                pedido = self.crear_pedido(
+                    datos_pedido, carrito_completo, cliente_id, clave_reserva,
+                    clave_idempotencia, hash_solicitud
                 )
-                
-                logger.info(f"Pedido creado: #{pedido.id}")
-                
-                # Crear detalles del pedido y descontar stock
-                for item in carrito_completo['items']:
-                    try:
-                        producto = Producto.objects.select_for_update().get(pk=item['producto_id'])
-                        
-                        # Verificar stock nuevamente (por si cambió)
-                        if producto.stock_disponible < item['cantidad']:
-                            logger.error(f"Stock insuficiente para {producto.nombre}")
-                            raise ValueError(f'Stock insuficiente para {producto.nombre}')
-                        
-                        # Crear detalle
-                        DetallePedido.objects.create(
-                            pedido=pedido,
-                            producto=producto,
-                            cantidad=item['cantidad'],
-                            precio_compra=item['precio_unitario']
-                        )
-                        
-                        # Descontar stock
-                        producto.reducir_stock(item['cantidad'])
-                        logger.info(f"Stock actualizado para {producto.nombre}: {producto.stock_disponible}")
-                        
-                    except Producto.DoesNotExist:
-                        logger.error(f"Producto {item['producto_id']} no encontrado")
-                        raise ValueError(f"Producto no encontrado: {item['nombre']}")
-                
-                # Si llegamos aquí, todo OK - commit implícito al salir del with
-                logger.info(f"Transacción completada para pedido #{pedido.id}")
+            except IntegrityError:
+                # Otra solicitud con la misma clave se adelantó y ya hizo commit
+                respuesta = clave_idempotencia and self.respuesta_idempotente(
+                    request, clave_idempotencia, hash_solicitud
+                )
+                if not respuesta:
+                    raise
+                return respuesta
             
-            # FUERA de la transacción: limpiar carrito y enviar correos
+            # FUERA de la transacción: limpiar carrito
             limpiar_carrito_actual(request)
             logger.info("Carrito limpiado")
             
-            # Enviar correos (no afectan la transacción)
-            enviar_correo_confirmacion_pedido(pedido)
-            enviar_correo_admin_nuevo_pedido(pedido)
-            
-            # Serializar el pedido para la respuesta
-            pedido_serializer = PedidoSerializer(pedido, context={'request': request})
-            
             logger.info(f"=== CHECKOUT EXITOSO: Pedido #{pedido.id} ===")
             
+            return respuesta_pedido_creado(pedido, request)
+            
+        except ConflictoStock as ce:
+            # Checkout optimista: demasiadas escrituras concurrentes sobre los mismos productos
+            logger.warning(f"Conflicto de concurrencia en checkout: {str(ce)}")
             return Response({
-                'message': 'Pedido creado exitosamente',
-                'pedido': pedido_serializer.data
-            }, status=status.HTTP_201_CREATED)
+                'error': str(ce)
+            }, status=status.HTTP_409_CONFLICT)
             
         except ValueError as ve:
             # Errores de validación de negocio (stock, etc)
@@ -855,12 +1124,45 @@ class CheckoutAPIView(APIView):
 class MisPedidosAPIView(generics.ListAPIView):
     """
     GET /api/mis-pedidos - Lista los pedidos del usuario autenticado
+    (paginado por cursor: usar el link `next` de la respuesta)
     """
     serializer_class = PedidoListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PedidosCursorPagination
     
     def get_queryset(self):
-        return Pedido.objects.filter(usuario=self.request.user).order_by('-fecha_pedido')
+        return Pedido.objects.filter(usuario_id=self.request.user.id).con_cantidad_items()
+
+
+async def cliente_de_eventos(request):
+    """
+    Cliente de la conexión SSE: sesión de cliente o usuario de Django.
+    No se aceptan tokens en la URL: quedarían en logs de proxies e historial.
+    """
+    cliente_id = await request.session.aget('cliente_id')
+    if cliente_id:
+        return cliente_id
+    
+    usuario = await request.auser()
+    if usuario.is_authenticated:
+        return usuario.pk
+    return None
+
+
+async def eventos_pedidos(request):
+    """
+    Stream SSE con los cambios de estado de los pedidos del cliente.
+    Reemplaza el polling a /api/pedidos/<id>/: una conexión inactiva por cliente.
+    Requiere servir la app por ASGI (tres_en_uno/asgi.py).
+    """
+    usuario_id = await cliente_de_eventos(request)
+    if usuario_id is None:
+        return JsonResponse({'error': 'No autenticado'}, status=401)
+    
+    response = StreamingHttpResponse(flujo_eventos(int(usuario_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 class DetallePedidoAPIView(generics.RetrieveAPIView):
@@ -871,7 +1173,34 @@ class DetallePedidoAPIView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Pedido.objects.filter(usuario=self.request.user)
+        return Pedido.objects.filter(usuario_id=self.request.user.id).con_detalles()
+
+
+class SeguimientoPedidoAPIView(APIView):
+    """
+    POST /api/seguimiento/ - Estado de un pedido sin iniciar sesión
+    Body: {"pedido", "correo"}, {"numero_seguimiento", "correo"} o {"token"}
+    Limitado por IP (scope 'seguimiento') y cacheado unos segundos.
+    """
+    authentication_classes = []
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'seguimiento'
+    
+    def post(self, request):
+        consulta = SeguimientoConsultaSerializer(data=request.data)
+        consulta.is_valid(raise_exception=True)
+        
+        datos = consultar_seguimiento(
+            lambda pedido: SeguimientoPedidoSerializer(pedido).data,
+            **consulta.validated_data
+        )
+        if datos is None:
+            # Mismo mensaje para pedido inexistente y correo incorrecto
+            return Response(
+                {'error': 'No encontramos un pedido con esos datos.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(datos)
 
 
 # ===== VISTAS HTML =====
@@ -888,24 +1217,9 @@ def checkout(request):
         from django.shortcuts import redirect
         return redirect('listar_productos')
     
-    datos_usuario = {}
-    cliente_id = request.session.get('cliente_id')
-    
-    if cliente_id:
-        try:
-            cliente = Cliente.objects.get(id=cliente_id)
-            datos_usuario = {
-                'nombre': cliente.nombre,
-                'correo': cliente.correo,
-                'telefono': cliente.telefono or '',
-            }
-        except Cliente.DoesNotExist:
-            # Si el cliente no existe, dejar vacío
-            datos_usuario = {}
-    
     contexto = {
         'carrito': carrito_completo,
-        'datos_usuario': datos_usuario,
+        'datos_usuario': datos_cliente_sesion(request),
     }
     
     return render(request, 'miapp/checkout.html', contexto)
@@ -916,7 +1230,7 @@ def confirmacion_pedido(request, pedido_id):
     Vista que muestra la confirmación del pedido
     URL: /pedido-confirmado/<id>/
     """
-    pedido = get_object_or_404(Pedido, pk=pedido_id)
+    pedido = get_object_or_404(Pedido.objects.con_detalles(), pk=pedido_id)
     detalles = pedido.detalles.all()
     
     # Calcular subtotales para cada detalle
@@ -936,6 +1250,26 @@ def confirmacion_pedido(request, pedido_id):
     return render(request, 'miapp/confirmacion_pedido.html', contexto)
 
 
+def seguimiento_pedido(request, token):
+    """
+    Enlace de seguimiento del correo de confirmación (sirve sin cuenta)
+    URL: /seguimiento/<token>/
+    """
+    pedido = buscar_pedido(token=token)
+    if pedido is None:
+        raise Http404('Enlace de seguimiento no válido')
+    
+    detalles = pedido.detalles.all()
+    contexto = {
+        'pedido': pedido,
+        'detalles': detalles,
+        'detalles_con_subtotal': [
+            {'detalle': detalle, 'subtotal': detalle.subtotal} for detalle in detalles
+        ],
+    }
+    return render(request, 'miapp/confirmacion_pedido.html', contexto)
+
+
 def mis_pedidos(request):
     """
     Vista que muestra los pedidos del usuario autenticado
@@ -945,7 +1279,7 @@ def mis_pedidos(request):
         from django.shortcuts import redirect
         return redirect('login-form')
     
-    pedidos = Pedido.objects.filter(usuario=request.user).order_by('-fecha_pedido')
+    pedidos = Pedido.objects.filter(usuario=request.user).con_cantidad_items().order_by('-fecha_pedido')
     
     contexto = {
         'pedidos': pedidos,
@@ -968,136 +1302,62 @@ class CategoriaListAPIView(generics.ListAPIView):
 
 @staff_member_required
 def dashboard_admin_view(request):
-    """Vista del dashboard de administración"""
-    from django.db.models import Sum, Count
-    
-    hoy = timezone.now()
-    hace_30_dias = hoy - timedelta(days=30)
-    hace_7_dias = hoy - timedelta(days=7)
-    
-    # Ventas del mes
-    ventas_mes_query = Pedido.objects.filter(
-        fecha_pedido__month=hoy.month,
-        fecha_pedido__year=hoy.year,
-        estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado']
-    ).aggregate(total=Sum('total_pedido'))
-    
-    ventas_mes = ventas_mes_query['total'] if ventas_mes_query['total'] else 0
-    
-    # Resto de métricas
-    pedidos_mes = Pedido.objects.filter(
-        fecha_pedido__month=hoy.month,
-        fecha_pedido__year=hoy.year
-    ).count()
-    
-    pedidos_pendientes = Pedido.objects.filter(estado_pedido='pendiente_pago').count()
-    total_productos = Producto.objects.filter(activo=True).count()
-    total_clientes = Cliente.objects.filter(is_active=True).count()
-    
-    # Ventas por día
-    ventas_por_dia = []
-    labels_dias = []
-    
-    for i in range(30, -1, -1):
-        fecha = hoy - timedelta(days=i)
-        ventas_dia_query = Pedido.objects.filter(
-            fecha_pedido__date=fecha.date(),
-            estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado']
-        ).aggregate(total=Sum('total_pedido'))
-        
-        ventas_dia = float(ventas_dia_query['total']) if ventas_dia_query['total'] else 0.0
-        ventas_por_dia.append(ventas_dia)
-        labels_dias.append(fecha.strftime('%d/%m'))
-    
-    # Top productos
-    productos_vendidos = DetallePedido.objects.filter(
-        pedido__estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado'],
-        pedido__fecha_pedido__gte=hace_30_dias
-    ).values('producto__nombre').annotate(
-        total_vendido=Sum('cantidad')
-    ).order_by('-total_vendido')[:5]
-    
-    # Últimos pedidos
-    ultimos_pedidos = Pedido.objects.order_by('-fecha_pedido')[:10]
-    
-    # Pedidos por estado
-    pedidos_por_estado = Pedido.objects.values('estado_pedido').annotate(
-        total=Count('id')
-    ).order_by('-total')
-    
-    estados_labels = []
-    estados_data = []
-    estados_background = []
-    estados_colores = {
-        'pendiente_pago': '#ffc107',
-        'pagado': '#28a745',
-        'preparando': '#17a2b8',
-        'enviado': '#007bff',
-        'completado': '#6c757d',
-        'cancelado': '#dc3545',
-    }
-    
-    for estado in pedidos_por_estado:
-        estados_labels.append(dict(Pedido.ESTADOS).get(estado['estado_pedido'], estado['estado_pedido']))
-        estados_data.append(estado['total'])
-        estados_background.append(estados_colores.get(estado['estado_pedido'], '#6c757d'))
-    
-    # Ventas por categoría
-    ventas_por_categoria = DetallePedido.objects.filter(
-        pedido__estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado'],
-        pedido__fecha_pedido__gte=hace_30_dias
-    ).values('producto__categoria__nombre').annotate(
-        total_vendido=Sum('cantidad')
-    ).order_by('-total_vendido')[:5]
-    
-    categorias_labels = [item['producto__categoria__nombre'] or 'Sin categoría' for item in ventas_por_categoria]
-    categorias_data = [item['total_vendido'] for item in ventas_por_categoria]
-    
-    # Comparación semana
-    ventas_semana_query = Pedido.objects.filter(
-        fecha_pedido__gte=hace_7_dias,
-        estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado']
-    ).aggregate(total=Sum('total_pedido'))
-    
-    ventas_esta_semana = ventas_semana_query['total'] if ventas_semana_query['total'] else 0
-    
-    hace_14_dias = hoy - timedelta(days=14)
-    ventas_anterior_query = Pedido.objects.filter(
-        fecha_pedido__gte=hace_14_dias,
-        fecha_pedido__lt=hace_7_dias,
-        estado_pedido__in=['pagado', 'preparando', 'enviado', 'completado']
-    ).aggregate(total=Sum('total_pedido'))
-    
-    ventas_semana_anterior = ventas_anterior_query['total'] if ventas_anterior_query['total'] else 0
-    
-    if ventas_semana_anterior > 0:
-        cambio_porcentaje = ((ventas_esta_semana - ventas_semana_anterior) / ventas_semana_anterior) * 100
-    else:
-        cambio_porcentaje = 100 if ventas_esta_semana > 0 else 0
-    
+    """
+    Vista del dashboard de administración. Solo arma la página: cada panel
+    pide sus datos a `datos_dashboard` en paralelo.
+    """
+    hoy = timezone.localdate()
     contexto = {
         'title': 'Dashboard de Ventas',
-        'ventas_mes': ventas_mes,
-        'pedidos_mes': pedidos_mes,
-        'pedidos_pendientes': pedidos_pendientes,
-        'total_productos': total_productos,
-        'total_clientes': total_clientes,
-        'ventas_esta_semana': ventas_esta_semana,
-        'cambio_porcentaje': round(cambio_porcentaje, 1),
-        'ventas_labels': json.dumps(labels_dias),
-        'ventas_data': json.dumps(ventas_por_dia),
-        'estados_labels': json.dumps(estados_labels),
-        'estados_data': json.dumps(estados_data),
-        'estados_background': json.dumps(estados_background),
-        'categorias_labels': json.dumps(categorias_labels),
-        'categorias_data': json.dumps(categorias_data),
-        'productos_vendidos': productos_vendidos,
-        'ultimos_pedidos': ultimos_pedidos,
+        'desde': (hoy - timedelta(days=DIAS_POR_DEFECTO)).isoformat(),
+        'hasta': hoy.isoformat(),
+        'ultimos_pedidos': Pedido.objects.order_by('-fecha_pedido')[:10],
     }
     
     return render(request, 'admin/dashboard.html', contexto)
 
 
+@staff_member_required
+def datos_dashboard(request, metrica):
+    """
+    JSON de un panel del dashboard (ver miapp/metricas.py), cacheado por métrica.
+    Filtros GET: desde, hasta (AAAA-MM-DD, inclusivas).
+    """
+    if metrica not in METRICAS:
+        return JsonResponse({'error': f'Métrica desconocida: {metrica}'}, status=404)
+    try:
+        desde, hasta = rango_dias(request.GET.get('desde'), request.GET.get('hasta'))
+    except RangoInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(obtener_metrica(metrica, desde, hasta))
+
+
+@staff_member_required
+def exportar_ventas(request):
+    """
+    Descarga en streaming las líneas de venta (CSV o CSV para Excel).
+    Filtros GET: desde, hasta (AAAA-MM-DD, inclusivas), estado (repetible), formato.
+    Bajo ASGI las filas se leen por lotes con un generador asíncrono.
+    """
+    desde = request.GET.get('desde') or None
+    hasta = request.GET.get('hasta') or None
+    estados = request.GET.getlist('estado')
+    lote = getattr(settings, 'EXPORTACION_LOTE', 2000)
+    try:
+        if isinstance(request, ASGIRequest):
+            filas = afilas_ventas(consulta_ventas(desde, hasta, estados), lote=lote)
+        else:
+            filas = filas_ventas(desde, hasta, estados=estados, lote=lote)
+        lineas = generar_csv(filas, formato=request.GET.get('formato', 'csv'))
+    except ParametrosInvalidos as e:
+        return HttpResponseBadRequest(str(e))
+    
+    response = StreamingHttpResponse(lineas, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre_archivo(desde, hasta)}"'
+    return response
+
+
 @csrf_exempt
 def chatbot_ask(request):
     if request.method != 'POST':
@@ -1141,24 +1401,17 @@ def perfil_temporal(request):
     Vista del perfil del usuario con historial de pedidos.
     Solo muestra pedidos del cliente autenticado via JWT.
     """
-    # Obtener el ID del cliente desde la sesión
-    cliente_id = request.session.get('cliente_id')
-    
-    # Obtener el cliente actual desde la base de datos
-    cliente = Cliente.objects.get(id=cliente_id)
+    # Datos del cliente desde la sesión
+    usuario = datos_cliente_sesion(request)
     
     # Obtener solo los pedidos de este cliente
     pedidos = Pedido.objects.filter(
-        usuario=cliente
-    ).select_related(
-        'usuario'
-    ).prefetch_related(
-        'detalles__producto'
-    ).order_by('-fecha_pedido')
+        usuario_id=request.session['cliente_id']
+    ).con_detalles().order_by('-fecha_pedido')
     
     contexto = {
         'pedidos': pedidos,
-        'usuario': cliente,
+        'usuario': usuario,
     }
     
     return render(request, 'miapp/perfil.html', contexto)
@@ -1196,6 +1449,8 @@ def actualizar_perfil(request):
             request.session['cliente_correo'] = cliente_actualizado.correo
         if 'nombre' in serializer.validated_data:
             request.session['cliente_nombre'] = cliente_actualizado.nombre
+        if 'telefono' in serializer.validated_data:
+            request.session['cliente_telefono'] = cliente_actualizado.telefono or ''
         
         return Response({
             'message': 'Perfil actualizado exitosamente',
@@ -1209,70 +1464,6 @@ def actualizar_perfil(request):
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-def enviar_correo_password_reset(email, reset_url):
-    """
-    Envía correo de recuperación de contraseña usando Resend API
-    """
-    try:
-        import resend
-        from django.conf import settings
-        
-        resend.api_key = settings.EMAIL_HOST_PASSWORD
-        
-        mensaje_html = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="text-align: center; margin-bottom: 30px;">
-                    <h2 style="color: #28a745;">Restablecer Contraseña</h2>
-                </div>
-                
-                <p>Hola,</p>
-                
-                <p>Recibimos una solicitud para restablecer la contraseña de tu cuenta en Tres En Uno.</p>
-                
-                <div style="text-align: center; margin: 30px 0;">
-                    <a href="{reset_url}" 
-                       style="background: #28a745; color: white; padding: 15px 30px; 
-                              text-decoration: none; border-radius: 5px; display: inline-block;
-                              font-weight: bold;">
-                        Restablecer mi contraseña
-                    </a>
-                </div>
-                
-                <p>O copia y pega este enlace en tu navegador:</p>
-                <p style="background: #f8f9fa; padding: 10px; border-radius: 5px; word-break: break-all;">
-                    {reset_url}
-                </p>
-                
-                <p style="color: #6c757d; font-size: 14px; margin-top: 30px;">
-                    Si no solicitaste este cambio, puedes ignorar este correo de forma segura.
-                </p>
-                
-                <hr style="margin: 30px 0; border: none; border-top: 1px solid #e9ecef;">
-                
-                <p style="color: #6c757d; font-size: 12px; text-align: center;">
-                    Tres En Uno - Cultivos Orgánicos<br>
-                    Este es un correo automático, por favor no respondas a este mensaje.
-                </p>
-            </body>
-        </html>
-        """
-        
-        params = {
-            "from": f"Tres en Uno <{settings.DEFAULT_FROM_EMAIL}>",
-            "to": [email],
-            "subject": "Restablecer contraseña - Tres en Uno",
-            "html": mensaje_html,
-        }
-        
-        resend.Emails.send(params)
-        logger.info(f"Correo de reset enviado a {email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error al enviar correo de reset: {str(e)}")
-        return False
-
 class CustomPasswordResetView(APIView):
     """
     Vista custom para password reset que usa Resend API
@@ -1307,10 +1498,10 @@ class CustomPasswordResetView(APIView):
                     domain = request.get_host()
                     reset_url = f"{protocol}://{domain}/auth/olvide-contrasena/confirmar/{uid}/{token}/"
                     
-                    # Enviar correo con Resend
-                    enviar_correo_password_reset(email, reset_url)
+                    # Encolar correo (lo envía el worker de correos)
+                    encolar_correos([construir_correo_password_reset(email, reset_url)])
                     
-                    logger.info(f"Correo de reset enviado a {email}")
+                    logger.info(f"Correo de reset encolado para {email}")
             
             # Siempre redirigir a "done" (por seguridad)
             return redirect('password_reset_done')
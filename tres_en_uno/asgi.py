@@ -3,6 +3,10 @@ ASGI config for tres_en_uno project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+En producción la app se sirve por ASGI (gunicorn con workers de uvicorn, ver
+Procfile) para mantener abiertas las conexiones SSE de /api/pedidos/eventos/
+sin ocupar un worker por cliente.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
@@ -138,6 +138,29 @@ else:
         }
     }
 
+# ==============================================================================
+# CACHE
+# ==============================================================================
+
+# Con varios workers de Gunicorn conviene un cache compartido (Redis) para que
+# la versión del catálogo y los resúmenes de carrito sean consistentes.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tres-en-uno',
+        }
+    }
+
 # ==============================================================================
 # PASSWORD VALIDATION
 # ==============================================================================
@@ -212,7 +235,8 @@ LOGOUT_REDIRECT_URL = '/'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT validado con sus claims, sin leer el cliente (miapp/autenticacion.py)
+        'miapp.autenticacion.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
@@ -225,6 +249,10 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        # Seguimiento de pedidos sin cuenta, por IP
+        'seguimiento': config('SEGUIMIENTO_RATE', default='10/min'),
+    },
 }
 
 # ==============================================================================
@@ -242,6 +270,10 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Segundos que cada proceso recuerda la versión de tokens de un cliente. Una
+# revocación tarda a lo más esto en llegar a los demás procesos.
+JWT_CACHE_SEGUNDOS = config('JWT_CACHE_SEGUNDOS', default=60, cast=int)
+
 # ==============================================================================
 # EMAIL CONFIGURATION - SOLO PARA RESEND API
 # ==============================================================================
@@ -250,6 +282,42 @@ SIMPLE_JWT = {
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')  # API key de Resend
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='onboarding@resend.dev')
 
+# Los correos se encolan en la tabla correos_salientes y los envía el worker
+# `python manage.py enviar_correos`. Proveedores: 'resend' o 'fake' (pruebas).
+EMAIL_PROVEEDOR = config('EMAIL_PROVEEDOR', default='resend')
+CORREOS_MAX_INTENTOS = config('CORREOS_MAX_INTENTOS', default=5, cast=int)
+CORREOS_BACKOFF_SEGUNDOS = config('CORREOS_BACKOFF_SEGUNDOS', default=60, cast=int)
+CORREOS_LEASE_SEGUNDOS = config('CORREOS_LEASE_SEGUNDOS', default=300, cast=int)
+
+# ==============================================================================
+# INVENTARIO
+# ==============================================================================
+
+# Reservas de stock al agregar al carrito (pensado para ventas flash)
+RESERVAS_STOCK_ACTIVAS = config('RESERVAS_STOCK_ACTIVAS', default=False, cast=bool)
+RESERVA_STOCK_MINUTOS = config('RESERVA_STOCK_MINUTOS', default=15, cast=int)
+
+# Contadores fragmentados para productos muy vendidos (ver compactar_inventario)
+STOCK_FRAGMENTOS = config('STOCK_FRAGMENTOS', default=8, cast=int)
+
+# Estrategia de descuento de stock en el checkout:
+#   'pesimista': SELECT ... FOR UPDATE ordenado (por defecto)
+#   'optimista': sin bloqueos, UPDATE condicionado a la versión del producto con reintentos
+CHECKOUT_ESTRATEGIA = config('CHECKOUT_ESTRATEGIA', default='pesimista')
+CHECKOUT_REINTENTOS = config('CHECKOUT_REINTENTOS', default=5, cast=int)
+CHECKOUT_BACKOFF_MS = config('CHECKOUT_BACKOFF_MS', default=10, cast=int)
+
+# Particiones mensuales de pedidos (solo PostgreSQL, ver particionar_pedidos)
+PARTICIONES_MESES_ADELANTE = config('PARTICIONES_MESES_ADELANTE', default=3, cast=int)
+PARTICIONES_RETENCION_MESES = config('PARTICIONES_RETENCION_MESES', default=24, cast=int)
+PARTICIONES_ESQUEMA_ARCHIVO = config('PARTICIONES_ESQUEMA_ARCHIVO', default='archivo')
+
+# Estado de pedidos en vivo (SSE, ver miapp/eventos.py): segundos entre latidos
+SSE_LATIDO_SEGUNDOS = config('SSE_LATIDO_SEGUNDOS', default=20, cast=int)
+
+# Seguimiento de pedidos sin cuenta: segundos que se cachea cada respuesta
+SEGUIMIENTO_CACHE_SEGUNDOS = config('SEGUIMIENTO_CACHE_SEGUNDOS', default=30, cast=int)
+
 # ==============================================================================
 # SITE CONFIGURATION
 # ==============================================================================
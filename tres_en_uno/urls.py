@@ -3,11 +3,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
-from miapp.views import dashboard_admin_view, CustomPasswordResetView
+from miapp.views import dashboard_admin_view, datos_dashboard, exportar_ventas, CustomPasswordResetView
 
 urlpatterns = [
     # ===== DASHBOARD ADMIN (DEBE IR ANTES DE admin/) =====
     path('admin/dashboard/', dashboard_admin_view, name='admin-dashboard'),
+    path('admin/dashboard/datos/<str:metrica>/', datos_dashboard, name='admin-dashboard-datos'),
+    path('admin/exportar/ventas/', exportar_ventas, name='admin-exportar-ventas'),
     
     path('admin/', admin.site.urls),
     path('', include('miapp.urls')),